@@ -0,0 +1,72 @@
+"""
+Measures the memory used by a fully decoded 1920x1080 image, with and without a ColorCache.
+
+Runs under CPython, since it relies on tracemalloc.
+"""
+import io
+import struct
+import tracemalloc
+
+import bmp_file_reader as bmpr
+
+WIDTH = 1920
+HEIGHT = 1080
+
+# A handful of flat colors, like you would find in artwork or sprites
+PALETTE = [
+    b"\x00\x00\x00",
+    b"\xff\xff\xff",
+    b"\x00\x00\xff",
+    b"\x00\xff\x00",
+    b"\xff\x00\x00",
+    b"\x71\x91\x14",
+    b"\x20\x40\x80",
+    b"\x80\x80\x80",
+]
+
+
+def make_flat_color_bmp(width, height):
+    row_size = ((24 * width + 31) // 32) * 4
+    pixel_array_size = row_size * height
+
+    header = struct.pack("<2sIHHI", b"BM", 14 + 40 + pixel_array_size, 0, 0, 14 + 40)
+    dib_header = struct.pack(
+        "<IiiHHIIiiII", 40, width, height, 1, 24, 0, pixel_array_size, 2835, 2835, 0, 0
+    )
+
+    rows = []
+    for y in range(0, height):
+        row = b"".join(PALETTE[(x // 64 + y // 64) % len(PALETTE)] for x in range(0, width))
+        rows.append(row + b"\x00" * (row_size - len(row)))
+
+    return header + dib_header + b"".join(rows)
+
+
+def measure_decoded_size(image_bytes, **reader_kwargs):
+    reader = bmpr.BMPFileReader(io.BytesIO(image_bytes), **reader_kwargs)
+
+    tracemalloc.start()
+    rows = [reader.get_row(i) for i in range(0, reader.get_height())]
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    del rows
+
+    return current, peak
+
+
+def main():
+    image_bytes = make_flat_color_bmp(WIDTH, HEIGHT)
+
+    print("{}x{} image, fully decoded into rows of Color objects".format(WIDTH, HEIGHT))
+
+    current, peak = measure_decoded_size(image_bytes)
+    print("Without ColorCache: {:.1f} MiB retained, {:.1f} MiB peak".format(current / 2**20, peak / 2**20))
+
+    if hasattr(bmpr, "ColorCache"):
+        current, peak = measure_decoded_size(image_bytes, color_cache=bmpr.ColorCache())
+        print("With ColorCache:    {:.1f} MiB retained, {:.1f} MiB peak".format(current / 2**20, peak / 2**20))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,73 +1,424 @@
+"""
+Benchmarks for reading BMP files, which run under both CPython and MicroPython.
+
+Synthetic images of various sizes and bit depths are generated, and then each of the ways of
+reading them (header parsing, row-by-row, bulk, region, raw, and bulk raw reads) is timed. The results are
+written out as both JSON and CSV, including the throughput in MB/s and pixels/s, and the peak memory
+used (on CPython).
+
+Usage (CPython):
+
+    cd benchmarks
+    PYTHONPATH=.. python read_speeds.py --preset quick
+    PYTHONPATH=.. python read_speeds.py --sizes 1920x1080 --bits-per-pixel 24 32 --repeats 3
+
+On MicroPython, run the file directly (ex. via Thonny), which runs the "pico" preset.
+"""
 import json
 import math
+import os
 import time
 
 import bmp_file_reader as bmpr
 
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+PRESETS = {
+    # The original benchmark images, which are small enough to read on a Raspberry Pi Pico
+    "pico": {"sizes": [(32, 32), (160, 128)], "bits_per_pixel": [24], "repeats": 10},
+    # Quick enough to run on every CI build. Odd widths are included so that rows have padding.
+    "quick": {
+        "sizes": [(1, 1), (33, 17), (160, 128), (641, 480)],
+        "bits_per_pixel": [1, 4, 8, 16, 24, 32],
+        "repeats": 3,
+    },
+    "full": {
+        "sizes": [
+            (1, 1),
+            (33, 17),
+            (160, 128),
+            (641, 480),
+            (1920, 1080),
+            (3840, 2160),
+            (7680, 4320),
+        ],
+        "bits_per_pixel": [8, 16, 24, 32],
+        "repeats": 3,
+    },
+}
+
+CSV_COLUMNS = [
+    "benchmark",
+    "width",
+    "height",
+    "bits_per_pixel",
+    "file_size_bytes",
+    "repeats",
+    "mean_ms",
+    "min_ms",
+    "stddev_ms",
+    "mb_per_s",
+    "pixels_per_s",
+    "peak_memory_bytes",
+]
+
+
+if hasattr(time, "ticks_us"):
+    # MicroPython
+    now = time.ticks_us
+
+    def elapsed_ms(before, after):
+        return time.ticks_diff(after, before) / 1000.0
+
+else:
+    now = time.perf_counter
+
+    def elapsed_ms(before, after):
+        return (after - before) * 1000.0
+
+
+def write_synthetic_bmp(filepath, width, height, bits_per_pixel):
+    """
+    Writes an uncompressed BMP file with a repeating pattern of pixels. One row is written at a
+    time, so even very large images can be generated without much memory.
+    """
+    row_size = ((bits_per_pixel * width + 31) // 32) * 4
+    pixel_bytes_per_row = (bits_per_pixel * width + 7) // 8
+
+    if bits_per_pixel <= 8:
+        num_colors = 1 << bits_per_pixel
+        palette = b"".join(
+            bytes([(i * 37) & 0xFF, (i * 101) & 0xFF, (i * 197) & 0xFF, 0])
+            for i in range(0, num_colors)
+        )
+    else:
+        num_colors = 0
+        palette = b""
+
+    image_start_offset = 14 + 40 + len(palette)
+    pixel_array_size = row_size * height
+
+    with open(filepath, "wb") as output_stream:
+        output_stream.write(b"BM")
+        output_stream.write((image_start_offset + pixel_array_size).to_bytes(4, "little"))
+        output_stream.write(bytes(4))
+        output_stream.write(image_start_offset.to_bytes(4, "little"))
+
+        output_stream.write((40).to_bytes(4, "little"))
+        output_stream.write(width.to_bytes(4, "little"))
+        output_stream.write(height.to_bytes(4, "little"))
+        output_stream.write((1).to_bytes(2, "little"))
+        output_stream.write(bits_per_pixel.to_bytes(2, "little"))
+        output_stream.write((0).to_bytes(4, "little"))
+        output_stream.write(pixel_array_size.to_bytes(4, "little"))
+        output_stream.write((2835).to_bytes(4, "little"))
+        output_stream.write((2835).to_bytes(4, "little"))
+        output_stream.write(num_colors.to_bytes(4, "little"))
+        output_stream.write((0).to_bytes(4, "little"))
+
+        output_stream.write(palette)
+
+        pattern = bytes(range(0, 256)) * (pixel_bytes_per_row // 256 + 2)
+        padding = bytes(row_size - pixel_bytes_per_row)
+        for row in range(0, height):
+            start = (row * 7) % 256
+            output_stream.write(pattern[start : start + pixel_bytes_per_row])
+            output_stream.write(padding)
+
+
+def read_headers(filepath):
+    with open(filepath, "rb") as file_handle:
+        reader = bmpr.BMPFileReader(file_handle)
+
+        reader.read_bmp_file_header()
+        reader.read_dib_header()
+
 
 def read_file_row_by_row(filepath):
-    with open(filepath, "r") as file_handle:
+    with open(filepath, "rb") as file_handle:
         reader = bmpr.BMPFileReader(file_handle)
 
         for row_i in range(0, reader.get_height()):
             row = reader.get_row(row_i)
 
 
-def run_benchmark(name, function, arguments, num_times):
+def read_file_bulk(filepath):
+    with open(filepath, "rb") as file_handle:
+        reader = bmpr.BMPFileReader(file_handle)
+
+        for row_i, row in reader.iter_rows(order="file_order"):
+            pass
+
+
+def read_file_region(filepath):
+    with open(filepath, "rb") as file_handle:
+        reader = bmpr.BMPFileReader(file_handle)
+
+        # The center quarter of the image
+        width = reader.get_width()
+        height = reader.get_height()
+        reader.get_region(width // 4, height // 4, max(1, width // 2), max(1, height // 2))
+
+
+def read_file_raw(filepath):
+    with open(filepath, "rb") as file_handle:
+        reader = bmpr.BMPFileReader(file_handle)
+
+        buffer = bytearray(reader.get_width() * 3)
+        for row_i in range(0, reader.get_height()):
+            reader.get_row_raw(row_i, out=buffer)
+
+
+def read_file_raw_bulk(filepath):
+    with open(filepath, "rb") as file_handle:
+        reader = bmpr.BMPFileReader(file_handle)
+
+        for row_i, row in reader.iter_rows_raw(order="file_order"):
+            pass
+
+
+BENCHMARKS = [
+    ("header_parse", read_headers),
+    ("row_by_row", read_file_row_by_row),
+    ("bulk", read_file_bulk),
+    ("region", read_file_region),
+    ("raw", read_file_raw),
+    ("raw_bulk", read_file_raw_bulk),
+]
+
+
+def run_benchmark(function, arguments, num_times):
     durations = []
     for _ in range(0, num_times):
-        before = time.ticks_ms()
+        before = now()
         function(*arguments)
-        after = time.ticks_ms()
+        after = now()
 
-        duration_ms = time.ticks_diff(after, before)
-
-        durations.append(duration_ms)
+        durations.append(elapsed_ms(before, after))
 
     return durations
 
 
-def summarize_results(benchmark_results):
-    mean_ms = sum(benchmark_results) / len(benchmark_results)
-    stddev_ms = math.sqrt(
-        (sum(((x - mean_ms) ** 2 for x in benchmark_results))) / len(benchmark_results)
-    )
+def measure_peak_memory(function, arguments):
+    if tracemalloc is None:
+        return None
+
+    tracemalloc.start()
+    try:
+        function(*arguments)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return peak
 
-    mean = f"{mean_ms}ms"
-    stddev = f"{stddev_ms}ms"
 
-    return {"mean": mean, "stddev": stddev}
+def summarize_results(name, width, height, bits_per_pixel, file_size, durations, peak_memory):
+    mean_ms = sum(durations) / len(durations)
+    stddev_ms = math.sqrt((sum(((x - mean_ms) ** 2 for x in durations))) / len(durations))
+
+    # Throughputs are relative to the size of the whole image, even for benchmarks that only read
+    # part of it, so that they can be compared across benchmarks. Header parsing does not depend on
+    # the size of the pixel data.
+    if name == "header_parse" or mean_ms <= 0:
+        mb_per_s = None
+        pixels_per_s = None
+    else:
+        mb_per_s = (file_size / 1000000.0) / (mean_ms / 1000.0)
+        pixels_per_s = (width * height) / (mean_ms / 1000.0)
+
+    return {
+        "benchmark": name,
+        "width": width,
+        "height": height,
+        "bits_per_pixel": bits_per_pixel,
+        "file_size_bytes": file_size,
+        "repeats": len(durations),
+        "mean_ms": mean_ms,
+        "min_ms": min(durations),
+        "stddev_ms": stddev_ms,
+        "mb_per_s": mb_per_s,
+        "pixels_per_s": pixels_per_s,
+        "peak_memory_bytes": peak_memory,
+    }
 
 
 def print_summary(summary):
-    print(f'{summary["mean"]} +/- {summary["stddev"]}')
+    throughput = ""
+    if summary["mb_per_s"] is not None:
+        throughput = " ({:.2f} MB/s, {:.0f} pixels/s)".format(
+            summary["mb_per_s"], summary["pixels_per_s"]
+        )
 
+    print("{:.3f}ms +/- {:.3f}ms{}".format(summary["mean_ms"], summary["stddev_ms"], throughput))
 
-def run_benchmarks(output_stream):
-    benchmarks = [
-        ("read_file_row_by_row_01", read_file_row_by_row, ("32x32.bmp",), 10),
-        ("read_file_row_by_row_02", read_file_row_by_row, ("160x128.bmp",), 10),
-    ]
 
-    results = {}
-    for b in benchmarks:
-        print(b[0], "... ", end="")
+def write_csv(results, output_stream):
+    output_stream.write(",".join(CSV_COLUMNS) + "\n")
+    for result in results:
+        values = ["" if result[column] is None else str(result[column]) for column in CSV_COLUMNS]
+        output_stream.write(",".join(values) + "\n")
 
-        b_results = run_benchmark(b[0], b[1], b[2], b[3])
-        summary = summarize_results(b_results)
 
-        print_summary(summary)
+def run_benchmarks(sizes, bits_per_pixel_values, repeats, work_dir, benchmark_names=None):
+    try:
+        os.mkdir(work_dir)
+    except OSError:
+        pass
 
-        results[b[0]] = summary
+    results = []
+    for width, height in sizes:
+        for bits_per_pixel in bits_per_pixel_values:
+            filepath = "{}/{}x{}_{}bpp.bmp".format(work_dir, width, height, bits_per_pixel)
+            write_synthetic_bmp(filepath, width, height, bits_per_pixel)
+            file_size = os.stat(filepath)[6]
 
-    # print(results)
+            for name, function in BENCHMARKS:
+                if benchmark_names is not None and name not in benchmark_names:
+                    continue
 
-    # TODO: write as csv instead
-    json.dump(results, output_stream)
+                print("{} {}x{} {}bpp ... ".format(name, width, height, bits_per_pixel), end="")
 
+                durations = run_benchmark(function, (filepath,), repeats)
+                peak_memory = measure_peak_memory(function, (filepath,))
+
+                summary = summarize_results(
+                    name, width, height, bits_per_pixel, file_size, durations, peak_memory
+                )
+                print_summary(summary)
+
+                results.append(summary)
+
+            os.remove(filepath)
+
+    return results
+
+
+def compare_to_baseline(results, baseline, max_slowdown, min_duration_ms=0):
+    """
+    Returns the benchmarks that are more than max_slowdown times slower than in the baseline.
+
+    The fastest run of each benchmark is compared, as it is the least affected by noise from other
+    processes. Benchmarks that took less than min_duration_ms in the baseline are too noisy to
+    compare and are skipped.
+    """
+
+    def key(result):
+        return (result["benchmark"], result["width"], result["height"], result["bits_per_pixel"])
+
+    baseline_results = dict((key(result), result) for result in baseline)
+
+    regressions = []
+    for result in results:
+        baseline_result = baseline_results.get(key(result))
+        if baseline_result is None:
+            continue
+
+        # Results from before min_ms was recorded only have the mean
+        baseline_ms = baseline_result.get("min_ms", baseline_result["mean_ms"])
+        if baseline_ms <= 0 or baseline_ms < min_duration_ms:
+            continue
+
+        slowdown = result["min_ms"] / baseline_ms
+        if slowdown > max_slowdown:
+            regressions.append((result, slowdown))
+
+    return regressions
+
+
+def parse_size(size_str):
+    width, height = size_str.lower().split("x")
+    return int(width), int(height)
+
+
+def main():
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--preset", choices=sorted(PRESETS.keys()), default="quick")
+    parser.add_argument("--sizes", nargs="+", type=parse_size, help="ex. 640x480 7680x4320")
+    parser.add_argument("--bits-per-pixel", nargs="+", type=int)
+    parser.add_argument("--repeats", type=int)
+    parser.add_argument("--benchmarks", nargs="+", choices=[name for name, _ in BENCHMARKS])
+    parser.add_argument("--work-dir", default="benchmark_images")
+    parser.add_argument("--json", default="benchmark_results.json")
+    parser.add_argument("--csv", default="benchmark_results.csv")
+    parser.add_argument(
+        "--baseline", help="JSON results of an earlier run to check for regressions against"
+    )
+    parser.add_argument(
+        "--max-slowdown",
+        type=float,
+        default=1.5,
+        help="How many times slower than the baseline a benchmark can be before it fails",
+    )
+    parser.add_argument(
+        "--min-duration-ms",
+        type=float,
+        default=1.0,
+        help="Benchmarks faster than this in the baseline are too noisy to check for regressions",
+    )
+    args = parser.parse_args()
+
+    preset = PRESETS[args.preset]
+    sizes = args.sizes or preset["sizes"]
+    bits_per_pixel_values = args.bits_per_pixel or preset["bits_per_pixel"]
+    repeats = args.repeats or preset["repeats"]
+
+    print("Starting benchmarks...")
+    results = run_benchmarks(sizes, bits_per_pixel_values, repeats, args.work_dir, args.benchmarks)
+
+    with open(args.json, "w") as output_stream:
+        json.dump(results, output_stream, indent=2)
+
+    with open(args.csv, "w") as output_stream:
+        write_csv(results, output_stream)
+
+    if args.baseline is not None:
+        with open(args.baseline, "r") as input_stream:
+            baseline = json.load(input_stream)
+
+        regressions = compare_to_baseline(
+            results, baseline, args.max_slowdown, args.min_duration_ms
+        )
+        for result, slowdown in regressions:
+            print(
+                "Regression: {} {}x{} {}bpp is {:.2f}x slower than the baseline".format(
+                    result["benchmark"],
+                    result["width"],
+                    result["height"],
+                    result["bits_per_pixel"],
+                    slowdown,
+                )
+            )
+
+        if len(regressions) > 0:
+            sys.exit(1)
+
+
+def main_micropython():
+    preset = PRESETS["pico"]
 
-if __name__ == "__main__":
     print("Starting benchmarks...")
+    results = run_benchmarks(
+        preset["sizes"], preset["bits_per_pixel"], preset["repeats"], "benchmark_images"
+    )
+
     with open("benchmark_results.json", "w") as output_stream:
-        run_benchmarks(output_stream)
-        print()
+        json.dump(results, output_stream)
+
+    with open("benchmark_results.csv", "w") as output_stream:
+        write_csv(results, output_stream)
+
+    print()
+
+
+if __name__ == "__main__":
+    if hasattr(time, "ticks_us"):
+        main_micropython()
+    else:
+        main()
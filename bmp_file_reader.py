@@ -20,7 +20,21 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-import math
+import struct
+
+# The default number of bytes to read at a time when reading many rows of an image at once
+DEFAULT_CHUNK_SIZE = 8192
+
+# The approximate number of bytes of memory used by each decoded pixel (a list slot and a Color
+# object on 64-bit CPython), used to keep RowCaches within their budget
+DECODED_PIXEL_SIZE = 64
+
+# The default limit on the number of pixels of an image read in strict mode, which bounds the memory
+# used to read it
+DEFAULT_MAX_PIXELS = 1 << 26
+
+# The largest DIB header read in strict mode (BITMAPV5HEADER)
+STRICT_MAX_DIB_HEADER_SIZE = 124
 
 
 class BMPFileReader:
@@ -28,173 +42,2726 @@ class BMPFileReader:
     An object for reading a BMP image file.
     """
 
-    def __init__(self, file_handle):
-        """
-        Creates a BMPFileReader from the given file handle.
+    def __init__(
+        self, file_handle, color_cache=None, row_cache=None, stats=None, strict=False, max_pixels=None
+    ):
+        """
+        Creates a BMPFileReader from the given file handle.
+
+        The file handle must have been opened in read binary mode ("rb").
+
+        :param file_handle: The file handle of the BMP image to read.
+        :type file_handle: io.TextIOWrapper
+        :param color_cache: An optional cache used to share Color objects between pixels with the
+            same color.
+        :type color_cache: ColorCache
+        :param row_cache: An optional cache used to keep recently read rows and regions of the image
+            in memory, so that reading them again does not need to read from the file.
+        :type row_cache: RowCache
+        :param stats: An optional object to record the reader's I/O and decoding counts and timings
+            in.
+        :type stats: ReaderStats
+        :param strict: Whether to validate the headers of the file (see validate) before reading any
+            pixel data, and to only accept DIB headers of known sizes. Use this for files from
+            untrusted sources.
+        :type strict: bool
+        :param max_pixels: The maximum number of pixels allowed in strict mode. Defaults to
+            DEFAULT_MAX_PIXELS.
+        :type max_pixels: int
+        """
+        self.file_handle = file_handle
+        self.color_cache = color_cache
+        self.row_cache = row_cache
+        self.stats = stats
+        self.strict = strict
+        self.max_pixels = DEFAULT_MAX_PIXELS if max_pixels is None else max_pixels
+        self.__bmp_header = None
+        self.__dib_header = None
+        self.__supported = False
+        self.__rle_decoder = None
+        self.__mapping = None
+        self.__mapped_bytes = None
+        self.__owns_file_handle = False
+
+    @staticmethod
+    def from_path(
+        path, mmap=False, color_cache=None, row_cache=None, stats=None, strict=False, max_pixels=None
+    ):
+        """
+        Creates a BMPFileReader that reads the BMP image file at the given path.
+
+        If mmap is True, then the file is memory-mapped, and rows and raw pixel data are served as
+        slices of the mapping instead of being read in with seek and read calls. This allows random
+        access to any part of very large images without copying, and only the pages of the file
+        that are actually accessed end up being loaded into memory. Memory-mapping is not available
+        on MicroPython.
+
+        The returned reader owns the file, so it should be closed once it is no longer needed (ex.
+        by using it as a context manager).
+
+        :param path: The path of the BMP image file to read.
+        :type path: str
+        :param mmap: Whether to memory-map the file.
+        :type mmap: bool
+        :param color_cache: An optional cache used to share Color objects between pixels with the
+            same color.
+        :type color_cache: ColorCache
+        :param row_cache: An optional cache used to keep recently read rows and regions of the image
+            in memory.
+        :type row_cache: RowCache
+        :param stats: An optional object to record the reader's I/O and decoding counts and timings
+            in.
+        :type stats: ReaderStats
+        :param strict: Whether to validate the headers of the file before reading any pixel data.
+        :type strict: bool
+        :param max_pixels: The maximum number of pixels allowed in strict mode.
+        :type max_pixels: int
+        :return: A reader for the given file.
+        :rtype: BMPFileReader
+        """
+        file_handle = open(path, "rb")
+
+        try:
+            reader = BMPFileReader(
+                file_handle,
+                color_cache=color_cache,
+                row_cache=row_cache,
+                stats=stats,
+                strict=strict,
+                max_pixels=max_pixels,
+            )
+            reader.__owns_file_handle = True
+
+            if mmap:
+                import mmap as mmap_module
+
+                reader.__mapping = mmap_module.mmap(
+                    file_handle.fileno(), 0, access=mmap_module.ACCESS_READ
+                )
+                reader.__mapped_bytes = memoryview(reader.__mapping)
+        except BaseException:
+            file_handle.close()
+            raise
+
+        return reader
+
+    def close(self):
+        """
+        Closes the memory-mapping of the file (if any), and the file itself if it was opened by
+        the reader (ex. via from_path).
+        """
+        if self.__mapping is not None:
+            try:
+                self.__mapped_bytes.release()
+                self.__mapping.close()
+            except BufferError:
+                # Views of the mapping (ex. raw rows or ndarrays) are still in use, so leave the
+                # mapping to be closed once they have all been garbage collected
+                pass
+
+            self.__mapped_bytes = None
+            self.__mapping = None
+
+        if self.__owns_file_handle:
+            self.file_handle.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def read_bmp_file_header(self):
+        """
+        Returns the BMP file header of the image.
+
+        :return: BMP file header of the image.
+        :rtype: BMPHeader
+        """
+        if self.__bmp_header is not None:
+            return self.__bmp_header
+
+        stats = self.stats
+        if stats is not None:
+            start = stats.start()
+
+        self.file_handle.seek(0)
+
+        header_bytes = self.file_handle.read(14)
+
+        bmp_header = BMPHeader.from_bytes(header_bytes)
+        self.__bmp_header = bmp_header
+
+        if stats is not None:
+            stats.seeks += 1
+            stats.reads += 1
+            stats.bytes_read += len(header_bytes)
+            stats.stop("header", start)
+
+        return bmp_header
+
+    def read_dib_header(self):
+        """
+        Returns the DIB header of the BMP file.
+
+        :return: DIB header of the image.
+        :rtype: DIBHeader
+        """
+        if self.__dib_header is not None:
+            return self.__dib_header
+
+        stats = self.stats
+        if stats is not None:
+            start = stats.start()
+
+        if self.strict:
+            # The header also has to fit within the file
+            max_header_size = min(STRICT_MAX_DIB_HEADER_SIZE, self._get_file_size() - 14)
+
+            self.file_handle.seek(14)
+            dib_header = DIBHeader.from_positioned_file_handler(
+                self.file_handle, max_header_size=max_header_size
+            )
+        else:
+            self.file_handle.seek(14)
+            dib_header = DIBHeader.from_positioned_file_handler(self.file_handle)
+        self.__dib_header = dib_header
+
+        if stats is not None:
+            # The header is read in a few small pieces, which are counted as a single read
+            stats.seeks += 1
+            stats.reads += 1
+            stats.bytes_read += self.file_handle.tell() - 14
+            stats.stop("header", start)
+
+        return dib_header
+
+    def get_width(self):
+        """
+        Returns the width of the image (in pixels).
+
+        :return: Width of the image in pixels.
+        :rtype: int
+        """
+        return self.read_dib_header().width
+
+    def get_height(self):
+        """
+        Returns the height of the image (in pixels).
+
+        :return: Height of the image in pixels.
+        :rtype: int
+        """
+        return abs(self.read_dib_header().height)
+
+    def is_top_down(self):
+        """
+        Returns whether the rows of the image are stored starting from the top row (indicated by a
+        negative height in the DIB header), rather than the usual bottom row first.
+
+        Row indices used by this reader always count from the top row, regardless of how the rows
+        are stored.
+
+        :return: True if the rows of the image are stored top-down.
+        :rtype: bool
+        """
+        return self.read_dib_header().height < 0
+
+    def get_row(self, row):
+        """
+        Reads in the pixels of the specified row (zero-indexed).
+
+        :param row: The index of the row to read.
+        :type row: int
+        :return: The colors of the pixels in the specified row.
+        :rtype: List[Color]
+        """
+        self._check_supported()
+
+        if self.row_cache is not None:
+            pixels = self.row_cache.get(("row", row))
+            self._record_cache_lookup(pixels is not None)
+            if pixels is not None:
+                return pixels
+
+        # Prepare to start parsing the row
+        self._check_row(row)
+
+        row_index = self._get_file_row(row)
+
+        # Read in the row information from the file
+        row_bytes = self._read_row_bytes(row_index)
+
+        pixels = self._decode_row(row_bytes)
+
+        if self.row_cache is not None:
+            self.row_cache.put(("row", row), pixels, self._estimate_decoded_size(len(pixels)))
+
+        return pixels
+
+    def get_row_raw(self, row, out=None):
+        """
+        Reads in the raw pixel bytes of the specified row (zero-indexed), without creating a Color
+        for each pixel.
+
+        The bytes are given as blue, green, red triples for each pixel in the row, with the row's
+        padding stripped off. If a preallocated buffer is given, then the bytes are read directly
+        into it, so that reading many rows does not need to allocate anything per row. If the file
+        is memory-mapped and no buffer is given, then a view of the mapping is returned.
+
+        For images that do not use 24-bit colors, the pixels are converted into blue, green, red
+        triples, which requires reading in the row before converting it into the buffer.
+
+        :param row: The index of the row to read.
+        :type row: int
+        :param out: A writable buffer (ex. bytearray) to read the row into. Must be at least
+            3 * width bytes long.
+        :type out: bytearray
+        :return: A view of the blue, green, red bytes of the pixels in the specified row.
+        :rtype: memoryview
+        """
+        self._check_supported()
+        self._check_row(row)
+
+        row_index = self._get_file_row(row)
+        row_start = self._get_row_start(row_index)
+
+        if out is None:
+            if self.__mapped_bytes is not None and self.__decoder.is_bgr24:
+                return self.__mapped_bytes[row_start : row_start + self.__width_bytes]
+
+            out = bytearray(self.__width_bytes)
+        elif len(out) < self.__width_bytes:
+            raise ValueError(
+                "Buffer is too small to hold a row of the image ({} < {} bytes).".format(
+                    len(out), self.__width_bytes
+                )
+            )
+
+        row_view = memoryview(out)[0 : self.__width_bytes]
+
+        if self.__decoder.is_bgr24:
+            self._readinto(row_start, row_view)
+
+            # The row is already in the right format, but still counts as decoded
+            if self.stats is not None:
+                self.stats.rows_decoded += 1
+        else:
+            row_bytes = self._read_row_bytes(row_index)
+
+            stats = self.stats
+            if stats is not None:
+                start = stats.start()
+
+            self.__decoder.to_bgr(row_bytes, self.get_width(), row_view)
+
+            if stats is not None:
+                stats.rows_decoded += 1
+                stats.stop("decode", start)
+
+        return row_view
+
+    def iter_rows(self, order="top_down", chunk_size=None):
+        """
+        Iterates over the rows of the image, yielding (row_index, pixels) tuples.
+
+        Rather than seeking to each row individually, the pixel array is read in large sequential
+        chunks of several rows at a time, so decoding a full image costs a handful of reads instead
+        of one seek and read per row.
+
+        With order="top_down" the rows are yielded starting from the top row of the image. With
+        order="file_order" the rows are yielded in the order that they are stored in the file
+        (bottom-up for most BMP files, top-down for ones with a negative height), which keeps the
+        reads strictly sequential. Either way, the yielded row indices count from the top row.
+
+        :param order: The order to yield the rows in, either "top_down" or "file_order".
+        :type order: str
+        :param chunk_size: The maximum number of bytes to read from the file at a time (at least one
+            row is always read). Defaults to DEFAULT_CHUNK_SIZE.
+        :type chunk_size: int
+        :return: An iterator over the index and the colors of the pixels of each row.
+        :rtype: Iterator[Tuple[int, List[Color]]]
+        """
+        for row, row_bytes in self._iter_row_bytes(order, chunk_size):
+            yield row, self._decode_row(row_bytes)
+
+    def iter_rows_raw(self, order="top_down", chunk_size=None):
+        """
+        Iterates over the raw pixel bytes of the rows of the image, yielding (row_index, row_bytes)
+        tuples, where the row bytes are blue, green, red triples for each pixel in the row (see
+        get_row_raw).
+
+        Like iter_rows, several rows are read from the file at a time. All of the reads go into the
+        same buffer, so no memory is allocated per row or per read. Since the buffer is reused, each
+        row's bytes are only valid until the next row is yielded, and should be copied if they are
+        needed for longer.
+
+        :param order: The order to yield the rows in, either "top_down" or "file_order".
+        :type order: str
+        :param chunk_size: The size of the buffer to read rows into, which sets how many rows are
+            read from the file at a time (at least one row is always read). Defaults to
+            DEFAULT_CHUNK_SIZE.
+        :type chunk_size: int
+        :return: An iterator over the index and the blue, green, red bytes of each row.
+        :rtype: Iterator[Tuple[int, memoryview]]
+        """
+        self._check_supported()
+
+        width_bytes = self.__width_bytes
+        if self.__decoder.is_bgr24:
+            for row, row_bytes in self._iter_row_bytes(order, chunk_size):
+                # The rows are already in the right format, but still count as decoded
+                stats = self.stats
+                if stats is not None:
+                    stats.rows_decoded += 1
+
+                yield row, row_bytes[0:width_bytes]
+        else:
+            width = self.get_width()
+            bgr_row = memoryview(bytearray(width_bytes))
+            for row, row_bytes in self._iter_row_bytes(order, chunk_size):
+                stats = self.stats
+                if stats is not None:
+                    start = stats.start()
+
+                self.__decoder.to_bgr(row_bytes, width, bgr_row)
+
+                if stats is not None:
+                    stats.rows_decoded += 1
+                    stats.stop("decode", start)
+
+                yield row, bgr_row
+
+    def read_all_rows(self, chunk_size=None):
+        """
+        Reads in the pixels of all of the rows of the image, reading the pixel array in large
+        sequential chunks.
+
+        :param chunk_size: The maximum number of bytes to read from the file at a time. Defaults to
+            DEFAULT_CHUNK_SIZE.
+        :type chunk_size: int
+        :return: The colors of the pixels of each row, starting from the top row.
+        :rtype: List[List[Color]]
+        """
+        # Validate the headers (in strict mode) before allocating anything based on them
+        self._check_supported()
+
+        rows = [None] * self.get_height()
+        for row, pixels in self.iter_rows(order="file_order", chunk_size=chunk_size):
+            rows[row] = pixels
+
+        return rows
+
+    def get_region(self, x, y, width, height):
+        """
+        Reads in the pixels of the given rectangular region of the image.
+
+        Only the bytes of the columns within the region are read in for each row, so reading a small
+        region (ex. a viewport) of a large image is much cheaper than reading in the whole rows.
+
+        :param x: The index of the leftmost column of the region.
+        :type x: int
+        :param y: The index of the top row of the region.
+        :type y: int
+        :param width: The width of the region (in pixels).
+        :type width: int
+        :param height: The height of the region (in pixels).
+        :type height: int
+        :return: The colors of the pixels in each row of the region, starting from the top row.
+        :rtype: List[List[Color]]
+        """
+        self._check_supported()
+
+        if (
+            x < 0
+            or y < 0
+            or width < 0
+            or height < 0
+            or x + width > self.get_width()
+            or y + height > self.get_height()
+        ):
+            raise ValueError(
+                "Region (x={}, y={}, width={}, height={}) is not within the {}x{} image.".format(
+                    x, y, width, height, self.get_width(), self.get_height()
+                )
+            )
+
+        if self.row_cache is not None:
+            key = ("region", x, y, width, height)
+            rows = self.row_cache.get(key)
+            self._record_cache_lookup(rows is not None)
+            if rows is not None:
+                return rows
+
+        # Images with less than 8 bits per pixel can have pixels that start part way into a byte
+        bits_per_pixel = self.__decoder.bits_per_pixel
+        span_offset = (x * bits_per_pixel) // 8
+        span_size = ((x + width) * bits_per_pixel + 7) // 8 - span_offset
+        skipped_pixels = ((x * bits_per_pixel) % 8) // bits_per_pixel
+
+        rows = []
+        for row in range(y, y + height):
+            row_index = self._get_file_row(row)
+
+            if self.__rle_decoder is not None:
+                row_bytes = self.__rle_decoder.decode_row(self._read, row_index)
+                span_bytes = row_bytes[span_offset : span_offset + span_size]
+            else:
+                span_bytes = self._read(self._get_row_start(row_index) + span_offset, span_size)
+
+            pixels = self._decode_row(span_bytes, skipped_pixels + width)
+            if skipped_pixels > 0:
+                pixels = pixels[skipped_pixels:]
+
+            rows.append(pixels)
+
+        if self.row_cache is not None:
+            self.row_cache.put(key, rows, self._estimate_decoded_size(width * height))
+
+        return rows
+
+    def get_pixel(self, x, y):
+        """
+        Reads in the color of the pixel at the given column and row.
+
+        Only the bytes of the pixel itself are read from the file (except for run-length encoded
+        images, where the row has to be decoded), so this is much cheaper than get_row when only a
+        few pixels are needed.
+
+        :param x: The index of the column of the pixel.
+        :type x: int
+        :param y: The index of the row of the pixel.
+        :type y: int
+        :return: The color of the pixel.
+        :rtype: Color
+        """
+        return self.get_pixels([(x, y)])[0]
+
+    def get_pixels(self, coordinates):
+        """
+        Reads in the colors of the pixels at the given (x, y) coordinates.
+
+        The pixels are read in the order that they are stored in the file, regardless of the order
+        they are given in, so that the reads move forwards through the file. Pixels in the same row
+        that are within DEFAULT_CHUNK_SIZE bytes of each other share a single read.
+
+        :param coordinates: The (x, y) coordinates of the pixels to read.
+        :type coordinates: Iterable[Tuple[int, int]]
+        :return: The colors of the pixels, in the same order as the given coordinates.
+        :rtype: List[Color]
+        """
+        self._check_supported()
+
+        coordinates = list(coordinates)
+
+        width = self.get_width()
+        height = self.get_height()
+        for x, y in coordinates:
+            if x < 0 or x >= width or y < 0 or y >= height:
+                raise IndexError(
+                    "Pixel ({}, {}) is out of range for a {}x{} image.".format(x, y, width, height)
+                )
+
+        # Sort the pixels by where they are stored in the file
+        order = sorted(
+            range(0, len(coordinates)),
+            key=lambda i: (self._get_file_row(coordinates[i][1]), coordinates[i][0]),
+        )
+
+        pixels = [None] * len(coordinates)
+
+        i = 0
+        while i < len(order):
+            y = coordinates[order[i]][1]
+
+            j = i
+            while j < len(order) and coordinates[order[j]][1] == y:
+                j += 1
+
+            row_pixels = self._get_row_pixels(
+                self._get_file_row(y), [coordinates[k][0] for k in order[i:j]]
+            )
+            for k, color in zip(order[i:j], row_pixels):
+                pixels[k] = color
+
+            i = j
+
+        return pixels
+
+    def iter_column(self, x, order="top_down", chunk_size=None):
+        """
+        Iterates over the pixels of the given column of the image, yielding (row_index, color)
+        tuples.
+
+        See iter_columns.
+
+        :param x: The index of the column.
+        :type x: int
+        :param order: The order to yield the rows in, either "top_down" or "file_order".
+        :type order: str
+        :param chunk_size: The maximum number of bytes to read from the file at a time. Defaults to
+            DEFAULT_CHUNK_SIZE.
+        :type chunk_size: int
+        :return: An iterator over the index of each row and the color of the column's pixel in it.
+        :rtype: Iterator[Tuple[int, Color]]
+        """
+        for row, colors in self.iter_columns([x], order=order, chunk_size=chunk_size):
+            yield row, colors[0]
+
+    def iter_columns(self, columns, order="top_down", chunk_size=None):
+        """
+        Iterates over the pixels of the given columns of the image, yielding (row_index, colors)
+        tuples, where colors has the color of each of the given columns in that row.
+
+        If the rows of the image are small, then several rows are read in at a time (like
+        iter_rows), and only the pixels of the given columns are decoded. Otherwise only the bytes
+        of the given columns are read from each row.
+
+        :param columns: The indices of the columns.
+        :type columns: List[int]
+        :param order: The order to yield the rows in, either "top_down" or "file_order".
+        :type order: str
+        :param chunk_size: The maximum number of bytes to read from the file at a time. Defaults to
+            DEFAULT_CHUNK_SIZE.
+        :type chunk_size: int
+        :return: An iterator over the index of each row and the colors of the columns' pixels in it.
+        :rtype: Iterator[Tuple[int, List[Color]]]
+        """
+        if order not in ("top_down", "file_order"):
+            raise ValueError('Invalid row order: "{}"'.format(order))
+
+        self._check_supported()
+
+        if chunk_size is None:
+            chunk_size = DEFAULT_CHUNK_SIZE
+
+        width = self.get_width()
+        height = self.get_height()
+        for x in columns:
+            if x < 0 or x >= width:
+                raise IndexError(
+                    "Column {} is out of range for an image with {} columns.".format(x, width)
+                )
+
+        if len(columns) == 0:
+            # Nothing needs to be read, but each row is still yielded
+            for i in range(0, height):
+                yield (i if order == "top_down" else self._get_file_row(i)), []
+
+            return
+
+        # Pixels are decoded in the order that they are stored in each row
+        sorted_columns = sorted(set(columns))
+        positions = {}
+        for i in range(0, len(sorted_columns)):
+            positions[sorted_columns[i]] = i
+
+        if self.__rle_decoder is not None or self._get_row_size() * 16 <= chunk_size:
+            # Reading whole rows a chunk at a time takes fewer reads than reading each pixel
+            for row, row_bytes in self._iter_row_bytes(order, chunk_size):
+                colors = [self._decode_pixel(row_bytes, x, 0) for x in sorted_columns]
+                yield row, [colors[positions[x]] for x in columns]
+
+            return
+
+        for i in range(0, height):
+            if order == "top_down":
+                row = i
+            else:
+                row = self._get_file_row(i)
+
+            colors = self._get_row_pixels(self._get_file_row(row), sorted_columns)
+            yield row, [colors[positions[x]] for x in columns]
+
+    def iter_tiles(self, tile_width, tile_height):
+        """
+        Iterates over the image split up into tiles of the given size, yielding (x, y, pixels)
+        tuples, where x and y are the coordinates of the top left corner of the tile.
+
+        Tiles are yielded left to right and then top to bottom. Tiles along the right and bottom
+        edges of the image are smaller if the image size is not a multiple of the tile size.
+
+        Only one tile is read in at a time, so this allows working with images that are too large
+        to fit into memory all at once.
+
+        :param tile_width: The width of each tile (in pixels).
+        :type tile_width: int
+        :param tile_height: The height of each tile (in pixels).
+        :type tile_height: int
+        :return: An iterator over the position and the colors of the pixels of each tile.
+        :rtype: Iterator[Tuple[int, int, List[List[Color]]]]
+        """
+        if tile_width <= 0 or tile_height <= 0:
+            raise ValueError(
+                "Invalid tile size: {}x{}".format(tile_width, tile_height)
+            )
+
+        width = self.get_width()
+        height = self.get_height()
+
+        for y in range(0, height, tile_height):
+            for x in range(0, width, tile_width):
+                region = self.get_region(
+                    x, y, min(tile_width, width - x), min(tile_height, height - y)
+                )
+
+                yield x, y, region
+
+    def read_thumbnail(self, max_width, max_height, method="nearest"):
+        """
+        Reads in a downscaled copy of the image that fits within the given size, keeping the
+        image's aspect ratio. Images that already fit are not scaled up.
+
+        With method="nearest" only the sampled rows are read from the file, and only the sampled
+        pixels of those rows are decoded, so the cost depends on the size of the thumbnail rather
+        than the size of the image.
+
+        With method="box" each thumbnail pixel is the average of the block of image pixels that it
+        covers. The image is read in a single sequential pass, and only one row of running totals
+        is kept in memory at a time.
+
+        :param max_width: The maximum width of the thumbnail (in pixels).
+        :type max_width: int
+        :param max_height: The maximum height of the thumbnail (in pixels).
+        :type max_height: int
+        :param method: The downscaling method to use, either "nearest" or "box".
+        :type method: str
+        :return: The colors of the pixels of each row of the thumbnail, starting from the top row.
+        :rtype: List[List[Color]]
+        """
+        if method not in ("nearest", "box"):
+            raise ValueError('Invalid thumbnail method: "{}"'.format(method))
+
+        if max_width <= 0 or max_height <= 0:
+            raise ValueError(
+                "Invalid thumbnail size: {}x{}".format(max_width, max_height)
+            )
+
+        self._check_supported()
+
+        width = self.get_width()
+        height = self.get_height()
+
+        if width <= max_width and height <= max_height:
+            thumbnail_width = width
+            thumbnail_height = height
+        elif width * max_height >= height * max_width:
+            thumbnail_width = max_width
+            thumbnail_height = max(1, min(max_height, (height * max_width + width // 2) // width))
+        else:
+            thumbnail_height = max_height
+            thumbnail_width = max(1, min(max_width, (width * max_height + height // 2) // height))
+
+        if method == "nearest":
+            return self._read_thumbnail_nearest(thumbnail_width, thumbnail_height)
+        else:
+            return self._read_thumbnail_box(thumbnail_width, thumbnail_height)
+
+    def decode_into(self, buffer, format="RGB565_BE", x=0, y=0, stride=None, chunk_size=None):
+        """
+        Decodes the whole image directly into the given buffer (ex. the bytearray of a framebuf),
+        in the given pixel format, without creating any Color objects.
+
+        The conversion into the pixel format is done using lookup tables, so no arithmetic is done
+        per color channel. The supported formats are:
+
+        * "RGB565_BE": 2 bytes per pixel, big-endian 5-bit red, 6-bit green, 5-bit blue (the
+          format used by many SPI LCD displays, and by framebuf.RGB565 buffers sent to them)
+        * "RGB565_LE": 2 bytes per pixel, little-endian 5-bit red, 6-bit green, 5-bit blue
+        * "RGB888": 3 bytes per pixel, red, green, and then blue
+        * "GRAY8": 1 byte per pixel, grayscale
+
+        :param buffer: The writable buffer to decode the image into.
+        :type buffer: bytearray
+        :param format: The pixel format to decode the image into.
+        :type format: str
+        :param x: The column of the buffer to put the left edge of the image at.
+        :type x: int
+        :param y: The row of the buffer to put the top edge of the image at.
+        :type y: int
+        :param stride: The number of bytes per row of the buffer. Defaults to the width of the image
+            times the number of bytes per pixel of the format.
+        :type stride: int
+        :param chunk_size: The maximum number of bytes to read from the file at a time. Defaults to
+            DEFAULT_CHUNK_SIZE.
+        :type chunk_size: int
+        """
+        converter = _PixelFormatConverter.get(format)
+
+        self._check_supported()
+
+        width = self.get_width()
+        height = self.get_height()
+        bytes_per_pixel = converter.bytes_per_pixel
+
+        if stride is None:
+            stride = width * bytes_per_pixel
+
+        _check_fits(buffer, width, height, x, y, stride, bytes_per_pixel)
+
+        buffer_view = memoryview(buffer)
+        stats = self.stats
+        for row, row_bytes in self.iter_rows_raw(order="file_order", chunk_size=chunk_size):
+            if stats is not None:
+                start_time = stats.start()
+
+            start = (y + row) * stride + x * bytes_per_pixel
+            converter.convert(row_bytes, width, buffer_view, start)
+
+            if stats is not None:
+                stats.stop("decode", start_time)
+
+    def to_ndarray(self, channel_order="RGB", copy=False):
+        """
+        Reads in the whole image as a NumPy array of shape (height, width, 3) with dtype uint8.
+
+        The pixel array is read in with a single read, and the row padding, the bottom-up row order,
+        and the channel order are all handled using views of the read in data rather than copies, so
+        the returned array is generally not contiguous. Pass copy=True to get a contiguous copy
+        instead.
+
+        Requires NumPy, which is otherwise not needed by this library.
+
+        :param channel_order: The order of the color channels in the array, either "RGB" or "BGR".
+        :type channel_order: str
+        :param copy: Whether to return a contiguous copy of the pixel data rather than a view.
+        :type copy: bool
+        :return: The pixels of the image, starting from the top row.
+        :rtype: numpy.ndarray
+        """
+        try:
+            import numpy as np
+        except ImportError:
+            raise ImportError("NumPy is required in order to read a BMP file into an ndarray.")
+
+        if channel_order not in ("RGB", "BGR"):
+            raise ValueError('Invalid channel order: "{}"'.format(channel_order))
+
+        self._check_supported()
+
+        width = self.get_width()
+        height = self.get_height()
+        row_size = self._get_row_size()
+
+        if self.__rle_decoder is not None:
+            row_size = width
+            pixel_bytes = bytearray(row_size * height)
+            for file_row in range(0, height):
+                pixel_bytes[file_row * row_size : (file_row + 1) * row_size] = self._read_row_bytes(
+                    file_row
+                )
+        elif self.__mapped_bytes is not None:
+            pixel_bytes = self._read(self._get_row_start(0), row_size * height)
+        else:
+            pixel_bytes = bytearray(row_size * height)
+            self._readinto(self._get_row_start(0), pixel_bytes)
+
+        pixel_stride = self.__decoder.bytes_per_pixel
+        if not self.__decoder.has_bgr_layout:
+            # Convert the pixels into blue, green, red triples first
+            bgr_bytes = bytearray(self.__width_bytes * height)
+            bgr_view = memoryview(bgr_bytes)
+            for file_row in range(0, height):
+                self.__decoder.to_bgr(
+                    pixel_bytes[file_row * row_size : (file_row + 1) * row_size],
+                    width,
+                    bgr_view[file_row * self.__width_bytes : (file_row + 1) * self.__width_bytes],
+                )
+
+            pixel_bytes = bgr_bytes
+            row_size = self.__width_bytes
+            pixel_stride = 3
+
+        # View the padded rows as (row, column, channel), skipping over the padding at the end of
+        # each row (and any unused bytes of each pixel), and then flip bottom-up rows so that the
+        # top row comes first
+        array = np.ndarray(
+            shape=(height, width, 3),
+            dtype=np.uint8,
+            buffer=pixel_bytes,
+            strides=(row_size, pixel_stride, 1),
+        )
+        if not self.is_top_down():
+            array = array[::-1]
+
+        # Pixels are stored as blue, green, red
+        if channel_order == "RGB":
+            array = array[:, :, ::-1]
+
+        if copy:
+            array = np.ascontiguousarray(array)
+
+        return array
+
+    def validate(self):
+        """
+        Checks that the headers of the file are consistent with each other and with the actual
+        size of the file, raising a ValueError describing the first problem found.
+
+        This only reads the headers (and the size of the file), so it takes the same time for any
+        file. It makes sure that the pixel array fits within the file, that the image is within the
+        max_pixels budget, and that its format is supported. In strict mode this is done
+        automatically before any pixel data is read.
+        """
+        file_size = self._get_file_size()
+        if file_size < 14 + 40:
+            raise ValueError("File is too small to be a BMP file ({} bytes).".format(file_size))
+
+        bmp_header = self.read_bmp_file_header()
+        if bmp_header.bmp_type != BMPType.BM:
+            raise ValueError(
+                "Unsupported BMP type: {}".format(BMPType.to_bytes(bmp_header.bmp_type).decode())
+            )
+
+        dib_header = self.read_dib_header()
+        width = dib_header.width
+        height = abs(dib_header.height)
+
+        if width <= 0 or height <= 0 or width > 0x7FFFFFFF:
+            raise ValueError("Invalid image size: {}x{}".format(width, dib_header.height))
+
+        if width * height > self.max_pixels:
+            raise ValueError(
+                "Image is too large: {}x{} is over the limit of {} pixels.".format(
+                    width, height, self.max_pixels
+                )
+            )
+
+        if dib_header.num_color_planes != 1:
+            raise ValueError(
+                "Invalid number of color planes: {}".format(dib_header.num_color_planes)
+            )
+
+        header_size = int.from_bytes(self._read(14, 4), "little")
+        header_end = 14 + header_size
+        if header_size < 52 and dib_header.red_mask is not None:
+            # Color masks directly follow a BITMAPINFOHEADER
+            header_end += 16 if dib_header.alpha_mask is not None else 12
+
+        if dib_header.bits_per_pixel <= 8:
+            if dib_header.num_colors_in_palette > 1 << dib_header.bits_per_pixel:
+                raise ValueError(
+                    "Color table has {} colors, but a {}-bit image can only use {}.".format(
+                        dib_header.num_colors_in_palette,
+                        dib_header.bits_per_pixel,
+                        1 << dib_header.bits_per_pixel,
+                    )
+                )
+
+            header_end += _get_palette_size(dib_header)
+
+        image_start_offset = bmp_header.image_start_offset
+        if image_start_offset < header_end or image_start_offset > file_size:
+            raise ValueError(
+                "Invalid image start offset: {} (the headers end at byte {}, and the file is {} bytes).".format(
+                    image_start_offset, header_end, file_size
+                )
+            )
+
+        # Also checks that the bits per pixel and compression type are supported
+        _create_decoders(dib_header, image_start_offset, self._read_palette)
+
+        if dib_header.compression_type in (CompressionType.BI_RLE8, CompressionType.BI_RLE4):
+            # Run-length encoded data has no fixed size, but reading it stops at the end of the
+            # file, and rows are only indexed as they are reached. The header does give the size of
+            # the encoded data though, which at least shows whether the file was cut off.
+            pixel_array_end = image_start_offset + max(2, dib_header.raw_bitmap_size)
+        else:
+            pixel_array_end = image_start_offset + self._get_row_size() * height
+
+        if pixel_array_end > file_size:
+            raise ValueError(
+                "File is truncated: the pixel array ends at byte {}, but the file is only {} bytes.".format(
+                    pixel_array_end, file_size
+                )
+            )
+
+    def _check_supported(self):
+        if self.__supported:
+            return
+
+        if self.strict:
+            self.validate()
+
+        decoder, rle_decoder = _create_decoders(
+            self.read_dib_header(),
+            self.read_bmp_file_header().image_start_offset,
+            self._read_palette,
+        )
+
+        self.__decoder = decoder
+        self.__rle_decoder = rle_decoder
+        self.__width_bytes = self.get_width() * 3
+        self.__supported = True
+
+    def _read_palette(self):
+        # The color table directly follows the DIB header
+        header_size = int.from_bytes(self._read(14, 4), "little")
+
+        return bytes(self._read(14 + header_size, _get_palette_size(self.read_dib_header())))
+
+    def _get_row_size(self):
+        # Rows are padded out to 4 byte alignment
+        dib_header = self.read_dib_header()
+        return ((dib_header.bits_per_pixel * dib_header.width + 31) // 32) * 4
+
+    def _check_row(self, row):
+        if row < 0 or row >= self.get_height():
+            raise IndexError(
+                "Row {} is out of range for an image with {} rows.".format(row, self.get_height())
+            )
+
+    def _get_file_size(self):
+        if self.__mapped_bytes is not None:
+            return len(self.__mapped_bytes)
+
+        # Seeking to the end works on MicroPython and for in-memory files as well as files on disk
+        self.file_handle.seek(0, 2)
+        return self.file_handle.tell()
+
+    def _get_file_row(self, row):
+        # Maps between row indices counting from the top of the image and the order that rows are
+        # stored in the file. The mapping is its own inverse, so it also maps file rows to rows.
+        if self.is_top_down():
+            return row
+
+        return (self.get_height() - row) - 1
+
+    def _get_row_start(self, file_row):
+        return self.read_bmp_file_header().image_start_offset + self._get_row_size() * file_row
+
+    def _iter_row_bytes(self, order, chunk_size):
+        if order not in ("top_down", "file_order"):
+            raise ValueError('Invalid row order: "{}"'.format(order))
+
+        self._check_supported()
+
+        if chunk_size is None:
+            chunk_size = DEFAULT_CHUNK_SIZE
+
+        height = self.get_height()
+
+        # Reading top-down through a bottom-up file is the only case that walks backwards
+        backwards = order == "top_down" and not self.is_top_down()
+
+        if self.__rle_decoder is not None:
+            # Run-length encoded rows are decoded one at a time, using the row index after the
+            # first pass over the file
+            if backwards:
+                file_rows = range(height - 1, -1, -1)
+            else:
+                file_rows = range(0, height)
+
+            for file_row in file_rows:
+                yield self._get_file_row(file_row), self._read_row_bytes(file_row)
+
+            return
+
+        row_size = self._get_row_size()
+        rows_per_chunk = max(1, min(height, chunk_size // row_size))
+
+        # Each chunk is read into the same buffer, unless the file is memory-mapped, in which case
+        # the rows can be used directly from the mapping
+        if self.__mapped_bytes is None:
+            chunk_buffer = memoryview(bytearray(row_size * rows_per_chunk))
+
+        # When rows are stored bottom-up, reading top-down walks the chunks backwards through the
+        # file, while still reading each chunk sequentially
+        if backwards:
+            chunk_starts = range(
+                ((height - 1) // rows_per_chunk) * rows_per_chunk, -1, -rows_per_chunk
+            )
+        else:
+            chunk_starts = range(0, height, rows_per_chunk)
+
+        for chunk_start in chunk_starts:
+            num_rows = min(rows_per_chunk, height - chunk_start)
+
+            chunk_start_offset = self._get_row_start(chunk_start)
+            if self.__mapped_bytes is not None:
+                chunk = self._read(chunk_start_offset, row_size * num_rows)
+            else:
+                chunk = chunk_buffer[0 : row_size * num_rows]
+                self._readinto(chunk_start_offset, chunk)
+
+            if backwards:
+                file_rows = range(num_rows - 1, -1, -1)
+            else:
+                file_rows = range(0, num_rows)
+
+            for i in file_rows:
+                row = self._get_file_row(chunk_start + i)
+                yield row, chunk[i * row_size : (i + 1) * row_size]
+
+    def _read_thumbnail_nearest(self, thumbnail_width, thumbnail_height):
+        width = self.get_width()
+        height = self.get_height()
+
+        # Sample the pixel at the center of the block that each thumbnail pixel covers
+        columns = [((2 * i + 1) * width) // (2 * thumbnail_width) for i in range(0, thumbnail_width)]
+
+        bits_per_pixel = self.__decoder.bits_per_pixel
+        if self.__rle_decoder is None and bits_per_pixel >= 8:
+            # Whole bytes per pixel, so the sampled pixels can be picked out before decoding
+            bytes_per_pixel = bits_per_pixel // 8
+            sampled_bytes = bytearray(thumbnail_width * bytes_per_pixel)
+
+            span_start = columns[0] * bytes_per_pixel
+            span_size = (columns[-1] + 1) * bytes_per_pixel - span_start
+        else:
+            sampled_bytes = None
+
+        rows = []
+        for i in range(0, thumbnail_height):
+            row = ((2 * i + 1) * height) // (2 * thumbnail_height)
+            row_index = self._get_file_row(row)
+
+            if sampled_bytes is None:
+                pixels = self._decode_row(self._read_row_bytes(row_index))
+                rows.append([pixels[column] for column in columns])
+                continue
+
+            span_bytes = self._read(self._get_row_start(row_index) + span_start, span_size)
+
+            j = 0
+            for column in columns:
+                start = column * bytes_per_pixel - span_start
+                sampled_bytes[j : j + bytes_per_pixel] = span_bytes[start : start + bytes_per_pixel]
+                j += bytes_per_pixel
+
+            rows.append(self._decode_row(sampled_bytes, thumbnail_width))
+
+        return rows
+
+    def _read_thumbnail_box(self, thumbnail_width, thumbnail_height):
+        width = self.get_width()
+        height = self.get_height()
+
+        # Image pixel (x, y) falls into the block of thumbnail pixel
+        # ((x * thumbnail_width) // width, (y * thumbnail_height) // height)
+        column_blocks = [(x * thumbnail_width) // width for x in range(0, width)]
+        column_counts = [0] * thumbnail_width
+        for block in column_blocks:
+            column_counts[block] += 1
+
+        def block_rows(block):
+            # The first row of a block is the smallest y with (y * thumbnail_height) // height
+            # equal to the block
+            start = (block * height + thumbnail_height - 1) // thumbnail_height
+            end = ((block + 1) * height + thumbnail_height - 1) // thumbnail_height
+            return end - start
+
+        if self.color_cache is None:
+            make_color = Color
+        else:
+            make_color = self.color_cache.get
+
+        rows = [None] * thumbnail_height
+        red_sums = [0] * thumbnail_width
+        green_sums = [0] * thumbnail_width
+        blue_sums = [0] * thumbnail_width
+        current_block = None
+
+        for row, row_bytes in self.iter_rows_raw(order="file_order"):
+            block = (row * thumbnail_height) // height
+            if block != current_block:
+                if current_block is not None:
+                    rows[current_block] = self._average_box_row(
+                        red_sums,
+                        green_sums,
+                        blue_sums,
+                        column_counts,
+                        block_rows(current_block),
+                        make_color,
+                    )
+
+                current_block = block
+                for i in range(0, thumbnail_width):
+                    red_sums[i] = 0
+                    green_sums[i] = 0
+                    blue_sums[i] = 0
+
+            row_bytes = bytes(row_bytes)
+            i = 0
+            for block in column_blocks:
+                blue_sums[block] += row_bytes[i]
+                green_sums[block] += row_bytes[i + 1]
+                red_sums[block] += row_bytes[i + 2]
+                i += 3
+
+        if current_block is not None:
+            rows[current_block] = self._average_box_row(
+                red_sums,
+                green_sums,
+                blue_sums,
+                column_counts,
+                block_rows(current_block),
+                make_color,
+            )
+
+        return rows
+
+    @staticmethod
+    def _average_box_row(red_sums, green_sums, blue_sums, column_counts, num_rows, make_color):
+        pixels = []
+        for i in range(0, len(column_counts)):
+            count = column_counts[i] * num_rows
+            half = count // 2
+            pixels.append(
+                make_color(
+                    (red_sums[i] + half) // count,
+                    (green_sums[i] + half) // count,
+                    (blue_sums[i] + half) // count,
+                )
+            )
+
+        return pixels
+
+    def _estimate_decoded_size(self, num_pixels):
+        # Each decoded pixel takes up a list slot, and unless Colors are shared via a ColorCache, a
+        # Color object as well
+        if self.color_cache is None:
+            return num_pixels * DECODED_PIXEL_SIZE
+        else:
+            return num_pixels * 8
+
+    def _get_row_pixels(self, file_row, columns):
+        # Reads in the pixels of the given columns (in ascending order) of the given row
+        if self.__rle_decoder is not None:
+            row_bytes = self.__rle_decoder.decode_row(self._read, file_row)
+            return [self._decode_pixel(row_bytes, x, 0) for x in columns]
+
+        bits_per_pixel = self.__decoder.bits_per_pixel
+        row_start = self._get_row_start(file_row)
+
+        # Pixels within DEFAULT_CHUNK_SIZE bytes of the first pixel of a group are read together in
+        # a single read, so nearby pixels share reads while far apart ones are read separately
+        pixels = []
+        i = 0
+        while i < len(columns):
+            span_start = (columns[i] * bits_per_pixel) // 8
+
+            j = i + 1
+            while (
+                j < len(columns)
+                and ((columns[j] + 1) * bits_per_pixel + 7) // 8 - span_start <= DEFAULT_CHUNK_SIZE
+            ):
+                j += 1
+
+            span_end = ((columns[j - 1] + 1) * bits_per_pixel + 7) // 8
+            span_bytes = self._read(row_start + span_start, span_end - span_start)
+            for x in columns[i:j]:
+                pixels.append(self._decode_pixel(span_bytes, x, span_start))
+
+            i = j
+
+        return pixels
+
+    def _decode_pixel(self, span_bytes, x, span_start):
+        # Decodes the pixel of the given column from bytes of its row starting at span_start. Pixels
+        # of images with less than 8 bits per pixel can start part way into a byte.
+        bits_per_pixel = self.__decoder.bits_per_pixel
+        offset = (x * bits_per_pixel) // 8 - span_start
+        skipped_pixels = ((x * bits_per_pixel) % 8) // bits_per_pixel
+
+        pixel_bytes = span_bytes[offset : offset + max(1, bits_per_pixel // 8)]
+        return _decode_pixels(self.__decoder, pixel_bytes, skipped_pixels + 1, self.color_cache)[
+            skipped_pixels
+        ]
+
+    def _read_row_bytes(self, file_row):
+        if self.__rle_decoder is not None:
+            return self.__rle_decoder.decode_row(self._read, file_row)
+
+        return self._read(self._get_row_start(file_row), self._get_row_size())
+
+    def _read(self, offset, size):
+        stats = self.stats
+        if stats is not None:
+            start = stats.start()
+
+        if self.__mapped_bytes is not None:
+            data = self.__mapped_bytes[offset : offset + size]
+        else:
+            self.file_handle.seek(offset)
+            data = self.file_handle.read(size)
+
+        if stats is not None:
+            self._record_read(len(data), start)
+
+        return data
+
+    def _readinto(self, offset, buffer):
+        stats = self.stats
+        if stats is not None:
+            start = stats.start()
+
+        if self.__mapped_bytes is not None:
+            buffer[:] = self.__mapped_bytes[offset : offset + len(buffer)]
+            num_bytes = len(buffer)
+        else:
+            self.file_handle.seek(offset)
+            num_bytes = self.file_handle.readinto(buffer) or 0
+
+        if stats is not None:
+            self._record_read(num_bytes, start)
+
+    def _record_read(self, num_bytes, start):
+        stats = self.stats
+
+        # Memory-mapped files are read without seeking
+        if self.__mapped_bytes is None:
+            stats.seeks += 1
+
+        stats.reads += 1
+        stats.bytes_read += num_bytes
+        stats.stop("io", start)
+
+    def _record_cache_lookup(self, hit):
+        if self.stats is not None:
+            if hit:
+                self.stats.cache_hits += 1
+            else:
+                self.stats.cache_misses += 1
+
+    def _decode_row(self, row_bytes, num_pixels=None):
+        if num_pixels is None:
+            num_pixels = self.get_width()
+
+        stats = self.stats
+        if stats is None:
+            return _decode_pixels(self.__decoder, row_bytes, num_pixels, self.color_cache)
+
+        start = stats.start()
+        pixels = _decode_pixels(self.__decoder, row_bytes, num_pixels, self.color_cache)
+
+        stats.rows_decoded += 1
+        stats.stop("decode", start)
+
+        return pixels
+
+
+class BMPStreamReader:
+    """
+    An object for reading a BMP image from a stream that cannot seek, such as a socket, a pipe, or
+    stdin, in a single forward pass.
+
+    The headers are read when they are first needed, and then the rows of the image can be iterated
+    over once, in the order that they are stored in the file. Only one row of the image is kept in
+    memory at a time, so memory use does not depend on the height of the image.
+    """
+
+    def __init__(self, file_handle, color_cache=None):
+        """
+        Creates a BMPStreamReader from the given stream.
+
+        The stream only needs to support read (and ideally readinto), and must be positioned at the
+        start of the BMP file.
+
+        :param file_handle: The stream of the BMP image to read, in binary mode.
+        :type file_handle: io.RawIOBase
+        :param color_cache: An optional cache used to share Color objects between pixels with the
+            same color.
+        :type color_cache: ColorCache
+        """
+        self.file_handle = file_handle
+        self.color_cache = color_cache
+        self.__stream = _ForwardReader(file_handle)
+        self.__bmp_header = None
+        self.__dib_header = None
+        self.__supported = False
+        self.__rows_read = False
+
+    def read_bmp_file_header(self):
+        """
+        Returns the BMP file header of the image.
+
+        :return: BMP file header of the image.
+        :rtype: BMPHeader
+        """
+        if self.__bmp_header is None:
+            self.__bmp_header = BMPHeader.from_bytes(self.__stream.read(14))
+
+        return self.__bmp_header
+
+    def read_dib_header(self):
+        """
+        Returns the DIB header of the BMP file.
+
+        :return: DIB header of the image.
+        :rtype: DIBHeader
+        """
+        if self.__dib_header is None:
+            self.read_bmp_file_header()
+            self.__dib_header = DIBHeader.from_positioned_file_handler(self.__stream)
+
+        return self.__dib_header
+
+    def get_width(self):
+        """
+        Returns the width of the image (in pixels).
+
+        :return: The width of the image.
+        :rtype: int
+        """
+        return self.read_dib_header().width
+
+    def get_height(self):
+        """
+        Returns the height of the image (in pixels).
+
+        :return: The height of the image.
+        :rtype: int
+        """
+        return abs(self.read_dib_header().height)
+
+    def is_top_down(self):
+        """
+        Returns whether the rows of the image are stored starting from the top row.
+
+        :return: True if the rows of the image are stored top-down.
+        :rtype: bool
+        """
+        return self.read_dib_header().height < 0
+
+    def iter_rows(self):
+        """
+        Iterates over the rows of the image in the order that they are stored in the stream
+        (bottom-up for most BMP files), yielding (row_index, pixels) tuples, where the row index
+        counts from the top row.
+
+        The rows can only be iterated over once.
+
+        :return: An iterator over the index and the colors of the pixels of each row.
+        :rtype: Iterator[Tuple[int, List[Color]]]
+        """
+        for row, row_bytes in self._iter_row_bytes():
+            yield row, _decode_pixels(
+                self.__decoder, row_bytes, self.get_width(), self.color_cache
+            )
+
+    def iter_rows_raw(self):
+        """
+        Iterates over the raw pixel bytes of the rows of the image in the order that they are
+        stored in the stream, yielding (row_index, row_bytes) tuples, where the row bytes are blue,
+        green, red triples for each pixel in the row (see BMPFileReader.get_row_raw).
+
+        Each row is read into the same buffer, so each row's bytes are only valid until the next
+        row is yielded. The rows can only be iterated over once.
+
+        :return: An iterator over the index and the blue, green, red bytes of each row.
+        :rtype: Iterator[Tuple[int, memoryview]]
+        """
+        self._check_supported()
+
+        rows = self._iter_row_bytes()
+
+        width = self.get_width()
+        decoder = self.__decoder
+        if decoder.is_bgr24:
+            for row, row_bytes in rows:
+                yield row, row_bytes[0 : width * 3]
+        else:
+            bgr_row = memoryview(bytearray(width * 3))
+            for row, row_bytes in rows:
+                decoder.to_bgr(row_bytes, width, bgr_row)
+                yield row, bgr_row
+
+    def read_all_rows(self):
+        """
+        Reads in the pixels of all of the rows of the image.
+
+        :return: The colors of the pixels of each row, starting from the top row.
+        :rtype: List[List[Color]]
+        """
+        self._check_supported()
+
+        # Rows are added as they arrive rather than preallocated from the height in the header, so
+        # that memory use is bounded by the data actually in the stream
+        rows = []
+        for _, pixels in self.iter_rows():
+            rows.append(pixels)
+
+        if not self.is_top_down():
+            rows.reverse()
+
+        return rows
+
+    def _iter_row_bytes(self):
+        self._check_supported()
+
+        if self.__rows_read:
+            raise ValueError("The rows of a stream can only be read once.")
+        self.__rows_read = True
+
+        width = self.get_width()
+        height = self.get_height()
+        top_down = self.is_top_down()
+        stream = self.__stream
+
+        if self.__rle_decoder is not None:
+            rle_decoder = self.__rle_decoder
+            for file_row in range(0, height):
+                # Rows are decoded in order, so nothing before the start of this row is needed again
+                row_offset = rle_decoder.get_row_offset(file_row)
+                if row_offset is not None:
+                    stream.discard_before(row_offset)
+
+                row_bytes = rle_decoder.decode_row(stream.read_at, file_row)
+
+                yield file_row if top_down else (height - file_row) - 1, row_bytes
+
+            return
+
+        row_size = ((self.__decoder.bits_per_pixel * width + 31) // 32) * 4
+        row_buffer = memoryview(bytearray(row_size))
+        image_start_offset = self.read_bmp_file_header().image_start_offset
+
+        for file_row in range(0, height):
+            stream.readinto_at(image_start_offset + row_size * file_row, row_buffer)
+
+            yield file_row if top_down else (height - file_row) - 1, row_buffer
+
+    def _check_supported(self):
+        if self.__supported:
+            return
+
+        dib_header = self.read_dib_header()
+
+        # The color table directly follows the DIB header, which has just been read
+        decoder, rle_decoder = _create_decoders(
+            dib_header,
+            self.read_bmp_file_header().image_start_offset,
+            lambda: bytes(self.__stream.read(_get_palette_size(dib_header))),
+            keep_rle_index=False,
+        )
+
+        self.__decoder = decoder
+        self.__rle_decoder = rle_decoder
+        self.__supported = True
+
+
+class BMPFileWriter:
+    """
+    An object for writing a 24-bit BMP image file one row at a time.
+
+    Only a single row of the image is held in memory at a time, so arbitrarily large images can be
+    written out.
+    """
+
+    def __init__(self, file_handle, width, height, channel_order="RGB"):
+        """
+        Creates a BMPFileWriter that writes an image of the given size to the given file handle,
+        and writes out the headers of the image.
+
+        The file handle must have been opened in write binary mode ("wb"), and must be seekable,
+        since rows are stored in the file from the bottom of the image up.
+
+        :param file_handle: The file handle to write the BMP image to.
+        :type file_handle: io.TextIOWrapper
+        :param width: The width of the image (in pixels).
+        :type width: int
+        :param height: The height of the image (in pixels).
+        :type height: int
+        :param channel_order: The order of the color channels of rows given as NumPy arrays, either
+            "RGB" or "BGR".
+        :type channel_order: str
+        """
+        if width <= 0 or height <= 0:
+            raise ValueError("Invalid image size: {}x{}".format(width, height))
+
+        if channel_order not in ("RGB", "BGR"):
+            raise ValueError('Invalid channel order: "{}"'.format(channel_order))
+
+        self.file_handle = file_handle
+        self.width = width
+        self.height = height
+        self.channel_order = channel_order
+
+        # Rows are padded out to 4 byte alignment
+        self.__row_size = ((24 * width + 31) // 32) * 4
+        self.__row_buffer = bytearray(self.__row_size)
+        self.__next_row = 0
+
+        self.__dib_header = DIBHeader(
+            width=width,
+            height=height,
+            num_color_planes=1,
+            bits_per_pixel=24,
+            compression_type=CompressionType.BI_RGB,
+            raw_bitmap_size=self.__row_size * height,
+            horizontal_resolution_ppm=2835,
+            vertical_resolution_ppm=2835,
+            num_colors_in_palette=0,
+            num_important_colors_used=0,
+        )
+        dib_header_bytes = self.__dib_header.to_bytes()
+
+        self.__image_start_offset = 14 + len(dib_header_bytes)
+        self.__bmp_header = BMPHeader(
+            BMPType.BM,
+            self.__image_start_offset + self.__row_size * height,
+            b"\x00\x00",
+            b"\x00\x00",
+            self.__image_start_offset,
+        )
+
+        self.file_handle.seek(0)
+        self.file_handle.write(self.__bmp_header.to_bytes())
+        self.file_handle.write(dib_header_bytes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+
+    def write_row(self, row):
+        """
+        Writes out the next row of the image, starting from the top row.
+
+        The row can be given as a list of Colors, as bytes of blue, green, red triples (as given by
+        BMPFileReader.get_row_raw), or as a NumPy array of shape (width, 3) in the writer's channel
+        order.
+
+        :param row: The pixels of the row.
+        :type row: Union[List[Color], bytes, numpy.ndarray]
+        """
+        if self.__next_row >= self.height:
+            raise ValueError(
+                "All {} rows of the image have already been written.".format(self.height)
+            )
+
+        row_buffer = self.__row_buffer
+        num_bytes = self.width * 3
+
+        if hasattr(row, "dtype"):
+            # NumPy array
+            if tuple(row.shape) != (self.width, 3):
+                raise ValueError(
+                    "Expected a row of shape {}, but got {}.".format((self.width, 3), row.shape)
+                )
+
+            if self.channel_order == "RGB":
+                row = row[:, ::-1]
+
+            row_buffer[0:num_bytes] = row.astype("uint8").tobytes()
+        elif len(row) > 0 and isinstance(row[0], Color):
+            if len(row) != self.width:
+                raise ValueError(
+                    "Expected a row of {} pixels, but got {}.".format(self.width, len(row))
+                )
+
+            i = 0
+            for color in row:
+                row_buffer[i] = color.blue
+                row_buffer[i + 1] = color.green
+                row_buffer[i + 2] = color.red
+                i += 3
+        else:
+            if len(row) != num_bytes:
+                raise ValueError(
+                    "Expected a row of {} bytes, but got {}.".format(num_bytes, len(row))
+                )
+
+            row_buffer[0:num_bytes] = row
+
+        # Rows are stored bottom-up
+        file_row = (self.height - self.__next_row) - 1
+        self.file_handle.seek(self.__image_start_offset + self.__row_size * file_row)
+        self.file_handle.write(row_buffer)
+
+        self.__next_row += 1
+
+    def close(self):
+        """
+        Checks that all of the rows of the image have been written.
+        """
+        if self.__next_row != self.height:
+            raise ValueError(
+                "Only {} of the {} rows of the image were written.".format(
+                    self.__next_row, self.height
+                )
+            )
+
+
+class Color:
+    """
+    A 24bit RGB color value.
+    """
+
+    __slots__ = ("red", "green", "blue")
+
+    def __init__(self, red, green, blue):
+        """
+        Creates a Color from the given 1 byte red, green, and blue color values.
+
+        :param red: The 1 byte red value.
+        :type red: int
+        :param green: The 1 byte green value.
+        :type green: int
+        :param blue: The 1 byte blue value.
+        :type blue: int
+        """
+        self.red = red
+        self.green = green
+        self.blue = blue
+
+    def __repr__(self):
+        return "Color(red={}, green={}, blue={})".format(self.red, self.green, self.blue)
+
+    def __eq__(self, other):
+        if not isinstance(other, Color):
+            return False
+
+        return (
+            self.red == other.red
+            and self.green == other.green
+            and self.blue == other.blue
+        )
+
+    def __hash__(self):
+        return (self.red << 16) | (self.green << 8) | self.blue
+
+    @staticmethod
+    def from_bytes(color_bytes):
+        blue = color_bytes[0]
+        green = color_bytes[1]
+        red = color_bytes[2]
+
+        return Color(red, green, blue)
+
+
+class ColorCache:
+    """
+    A bounded cache that interns Color objects, so that all of the pixels of an image that share
+    the same color can share the same Color object.
+
+    This greatly reduces the memory used by decoded images with only a few distinct colors (ex.
+    flat color artwork and sprites). Once the cache is full, colors that are not already in it are
+    created as new objects, but are not added to the cache.
+
+    Note that since interned Color objects are shared, they should not be modified.
+    """
+
+    def __init__(self, max_size=256):
+        """
+        Creates an empty ColorCache that holds at most the given number of colors.
+
+        :param max_size: The maximum number of distinct colors to keep in the cache.
+        :type max_size: int
+        """
+        self.max_size = max_size
+        self.__colors = {}
+
+    def __len__(self):
+        return len(self.__colors)
+
+    def get(self, red, green, blue):
+        """
+        Returns a Color with the given 1 byte red, green, and blue color values, reusing a
+        previously created Color if there is one in the cache.
+
+        :param red: The 1 byte red value.
+        :type red: int
+        :param green: The 1 byte green value.
+        :type green: int
+        :param blue: The 1 byte blue value.
+        :type blue: int
+        :return: The color with the given color values.
+        :rtype: Color
+        """
+        key = (red << 16) | (green << 8) | blue
+
+        color = self.__colors.get(key)
+        if color is None:
+            color = Color(red, green, blue)
+
+            if len(self.__colors) < self.max_size:
+                self.__colors[key] = color
+
+        return color
+
+    def clear(self):
+        """
+        Removes all of the colors from the cache.
+        """
+        self.__colors = {}
+
+
+class RowCache:
+    """
+    A least recently used (LRU) cache of decoded rows and regions of an image, which is kept within
+    a fixed memory budget.
+
+    Once adding an entry would put the cache over its budget, the least recently used entries are
+    evicted until it fits again. Entries that are larger than the whole budget are not cached.
+
+    Note that cached rows are shared between everything that reads them, so they should not be
+    modified.
+    """
+
+    def __init__(self, max_bytes):
+        """
+        Creates an empty RowCache with the given memory budget.
+
+        :param max_bytes: The approximate maximum number of bytes of decoded pixels to keep in the
+            cache.
+        :type max_bytes: int
+        """
+        from collections import OrderedDict
+
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.__entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def get(self, key):
+        """
+        Returns the entry with the given key, or None if it is not in the cache.
+
+        :param key: The key of the entry.
+        :type key: Tuple
+        :return: The cached entry (if any).
+        :rtype: Any
+        """
+        entry = self.__entries.pop(key, None)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        # Move the entry to the most recently used end
+        self.__entries[key] = entry
+        self.hits += 1
+
+        return entry[0]
+
+    def put(self, key, value, size):
+        """
+        Adds the given entry to the cache, evicting the least recently used entries if needed.
+
+        :param key: The key of the entry.
+        :type key: Tuple
+        :param value: The entry to cache.
+        :type value: Any
+        :param size: The approximate number of bytes of memory used by the entry.
+        :type size: int
+        """
+        old_entry = self.__entries.pop(key, None)
+        if old_entry is not None:
+            self.current_bytes -= old_entry[1]
+
+        if size > self.max_bytes:
+            return
+
+        while self.current_bytes + size > self.max_bytes:
+            oldest_key = next(iter(self.__entries))
+            self.current_bytes -= self.__entries.pop(oldest_key)[1]
+            self.evictions += 1
+
+        self.__entries[key] = (value, size)
+        self.current_bytes += size
+
+    def clear(self):
+        """
+        Removes all of the entries from the cache.
+        """
+        self.__entries.clear()
+        self.current_bytes = 0
+
+    def stats(self):
+        """
+        Returns the hit, miss, and eviction counts of the cache, and how much of its budget is in
+        use.
+
+        :return: The statistics of the cache.
+        :rtype: Dict[str, int]
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self.__entries),
+            "current_bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+
+class ReaderStats:
+    """
+    Counts of the I/O and decoding work done by a BMPFileReader, and the time spent on it, which
+    can be used to find out whether loading an image is slowed down by reading the file, parsing the
+    headers, or decoding the pixels.
+
+    Recording stats is opt-in (see the stats argument of BMPFileReader), and only adds a few counter
+    updates and clock reads per read and per row. Times are in microseconds, and are measured with
+    time.ticks_us on MicroPython and time.perf_counter_ns on CPython.
+
+    The time spent in each phase is given by header_us (reading and parsing the headers), io_us
+    (reading pixel data and color tables), and decode_us (converting pixels into Colors or other
+    pixel formats).
+    """
+
+    PHASES = ("header", "io", "decode")
+
+    def __init__(self):
+        """
+        Creates a ReaderStats with all of its counts set to zero.
+        """
+        self.__stopwatch = _Stopwatch()
+        self.reset()
+
+    def reset(self):
+        """
+        Sets all of the counts and times back to zero.
+        """
+        self.seeks = 0
+        self.reads = 0
+        self.bytes_read = 0
+        self.rows_decoded = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+        # Times are added up in nanoseconds and only converted to microseconds when read, so that
+        # the many short samples (ex. one per row) are not each rounded down to zero
+        self.__times_ns = {phase: 0 for phase in ReaderStats.PHASES}
+
+    @property
+    def times_us(self):
+        """
+        The time spent in each phase, in microseconds.
+
+        :return: The time spent in each phase.
+        :rtype: Dict[str, int]
+        """
+        return {phase: time_ns // 1000 for phase, time_ns in self.__times_ns.items()}
+
+    def start(self):
+        """
+        Returns the current time, for timing a phase with stop.
+
+        :return: The current time, in the units of the underlying clock.
+        :rtype: int
+        """
+        return self.__stopwatch.now()
+
+    def stop(self, phase, start):
+        """
+        Adds the time since the given start time to the time spent in the given phase.
+
+        :param phase: The phase to add the time to.
+        :type phase: str
+        :param start: The start time, as given by start.
+        :type start: int
+        """
+        self.__times_ns[phase] += self.__stopwatch.elapsed_ns(start)
+
+    def to_dict(self):
+        """
+        Returns the counts and times as a flat dictionary (ex. for sending to a metrics system).
+
+        :return: The counts and times, with the time of each phase under "<phase>_us".
+        :rtype: Dict[str, int]
+        """
+        stats = {
+            "seeks": self.seeks,
+            "reads": self.reads,
+            "bytes_read": self.bytes_read,
+            "rows_decoded": self.rows_decoded,
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+        }
+
+        times_us = self.times_us
+        for phase in ReaderStats.PHASES:
+            stats[phase + "_us"] = times_us[phase]
+
+        return stats
+
+
+class _Stopwatch:
+    """
+    Measures elapsed time in nanoseconds, using time.ticks_us on MicroPython (which handles the
+    tick counter wrapping around) and time.perf_counter_ns on CPython.
+    """
+
+    def __init__(self):
+        import time
+
+        if hasattr(time, "ticks_us"):
+            self.now = time.ticks_us
+            self.__ticks_diff = time.ticks_diff
+        else:
+            self.now = time.perf_counter_ns
+            self.__ticks_diff = None
+
+    def elapsed_ns(self, start):
+        if self.__ticks_diff is not None:
+            return self.__ticks_diff(self.now(), start) * 1000
+
+        return self.now() - start
+
+
+def _decode_pixels(decoder, row_bytes, num_pixels, color_cache):
+    """
+    Decodes the given number of pixels of a row into Colors, using the given pixel decoder.
+    """
+    num_bytes = num_pixels * 3
+
+    if not decoder.is_bgr24:
+        row_bytes = decoder.to_bgr(row_bytes, num_pixels, bytearray(num_bytes))
+
+    # Parse the pixel color information for the row
+    if color_cache is None:
+        make_color = Color
+    else:
+        make_color = color_cache.get
+
+    if _EXTENDED_SLICES:
+        # Much faster than indexing each byte, especially for rows that are memoryviews
+        row_bytes = bytes(row_bytes[0:num_bytes])
+
+        return list(map(make_color, row_bytes[2::3], row_bytes[1::3], row_bytes[0::3]))
+
+    pixels = []
+    i = 0
+    while i < num_bytes:
+        pixels.append(make_color(row_bytes[i + 2], row_bytes[i + 1], row_bytes[i]))
+
+        i += 3
+
+    return pixels
+
+
+def _create_decoders(dib_header, image_start_offset, read_palette, keep_rle_index=True):
+    """
+    Creates the pixel decoder (and run-length decoder, if needed) for an image with the given DIB
+    header, raising a ValueError if the image's format is not supported. The given function is only
+    called to read in the color table if the image uses one.
+
+    If keep_rle_index is False, then the run-length decoder only supports decoding rows in order
+    (see _RLEDecoder).
+    """
+    bits_per_pixel = dib_header.bits_per_pixel
+    if bits_per_pixel not in (1, 4, 8, 16, 24, 32):
+        raise ValueError(
+            "This parser does not currently support BMP files with {} bits per pixel. Currently only 1, 4, 8, 16, 24, and 32-bit color values are supported.".format(bits_per_pixel)
+        )
+
+    rle_decoder = None
+
+    compression_type = dib_header.compression_type
+    if (compression_type == CompressionType.BI_RLE8 and bits_per_pixel == 8) or (
+        compression_type == CompressionType.BI_RLE4 and bits_per_pixel == 4
+    ):
+        # Run-length encoded rows are decoded into one palette index byte per pixel
+        decoder = _PaletteDecoder(8, read_palette())
+        rle_decoder = _RLEDecoder(
+            bits_per_pixel,
+            dib_header.width,
+            abs(dib_header.height),
+            image_start_offset,
+            keep_rle_index,
+        )
+    elif compression_type == CompressionType.BI_RGB:
+        if bits_per_pixel <= 8:
+            decoder = _PaletteDecoder(bits_per_pixel, read_palette())
+        elif bits_per_pixel == 24:
+            decoder = _BGR24Decoder()
+        elif bits_per_pixel == 16:
+            # X1R5G5B5
+            decoder = _BitFieldsDecoder(16, 0x7C00, 0x03E0, 0x001F)
+        else:
+            # X8R8G8B8
+            decoder = _BitFieldsDecoder(32, 0x00FF0000, 0x0000FF00, 0x000000FF)
+    elif bits_per_pixel in (16, 32) and compression_type in (
+        CompressionType.BI_BITFIELDS,
+        CompressionType.BI_ALPHABITFIELDS,
+    ):
+        decoder = _BitFieldsDecoder(
+            bits_per_pixel, dib_header.red_mask, dib_header.green_mask, dib_header.blue_mask
+        )
+    else:
+        raise ValueError(
+            "This parser does not currently support compressed BMP files."
+        )
+
+    return decoder, rle_decoder
+
+
+def _get_palette_size(dib_header):
+    # The size of the color table (in bytes) of an image that uses indexed colors
+    num_colors = dib_header.num_colors_in_palette
+    max_colors = 1 << dib_header.bits_per_pixel
+    if num_colors == 0 or num_colors > max_colors:
+        num_colors = max_colors
+
+    return num_colors * 4
+
+
+class _PixelFormatConverter:
+    """
+    Converts rows of blue, green, red triples into one of the pixel formats supported by
+    BMPFileReader.decode_into, using lookup tables for each color channel.
+    """
+
+    FORMATS = ("RGB565_BE", "RGB565_LE", "RGB888", "GRAY8")
+
+    # Converters are created on first use, since their lookup tables take up some memory
+    __converters = {}
+
+    def __init__(self, format):
+        self.format = format
+
+        if format in ("RGB565_BE", "RGB565_LE"):
+            self.bytes_per_pixel = 2
+
+            # Quantize each channel, and split the 16-bit value into its high and low bytes
+            red_5 = [(value * 31) // 255 for value in range(0, 256)]
+            green_6 = [(value * 63) // 255 for value in range(0, 256)]
+            blue_5 = red_5
+
+            self.red_high = bytes([v << 3 for v in red_5])
+            self.green_high = bytes([v >> 3 for v in green_6])
+            self.green_low = bytes([(v & 0x07) << 5 for v in green_6])
+            self.blue_low = bytes(blue_5)
+
+            if format == "RGB565_BE":
+                self.high_offset = 0
+                self.low_offset = 1
+            else:
+                self.high_offset = 1
+                self.low_offset = 0
+        elif format == "RGB888":
+            self.bytes_per_pixel = 3
+        else:
+            self.bytes_per_pixel = 1
+
+            # ITU-R BT.601 luma, in fixed point with 8 fractional bits
+            self.red_gray = [77 * value for value in range(0, 256)]
+            self.green_gray = [150 * value for value in range(0, 256)]
+            self.blue_gray = [29 * value for value in range(0, 256)]
+
+    @staticmethod
+    def get(format):
+        if format not in _PixelFormatConverter.FORMATS:
+            raise ValueError(
+                'Invalid pixel format: "{}". Supported formats are: {}'.format(
+                    format, ", ".join(_PixelFormatConverter.FORMATS)
+                )
+            )
+
+        converter = _PixelFormatConverter.__converters.get(format)
+        if converter is None:
+            converter = _PixelFormatConverter(format)
+            _PixelFormatConverter.__converters[format] = converter
+
+        return converter
+
+    def convert(self, bgr_bytes, num_pixels, out, start):
+        """
+        Converts the given number of pixels of blue, green, red triples, writing them into the
+        given buffer starting at the given offset.
+        """
+        num_bytes = num_pixels * 3
+        end = start + num_pixels * self.bytes_per_pixel
+
+        if _EXTENDED_SLICES:
+            bgr_bytes = bytes(bgr_bytes[0:num_bytes])
+            blues = bgr_bytes[0::3]
+            greens = bgr_bytes[1::3]
+            reds = bgr_bytes[2::3]
+
+            if self.format == "RGB888":
+                out[start:end:3] = reds
+                out[start + 1 : end : 3] = greens
+                out[start + 2 : end : 3] = blues
+            elif self.format == "GRAY8":
+                out[start:end] = bytes(
+                    map(
+                        _gray_from_parts,
+                        map(self.red_gray.__getitem__, reds),
+                        map(self.green_gray.__getitem__, greens),
+                        map(self.blue_gray.__getitem__, blues),
+                    )
+                )
+            else:
+                out[start + self.high_offset : end : 2] = bytes(
+                    map(
+                        int.__or__,
+                        map(self.red_high.__getitem__, reds),
+                        map(self.green_high.__getitem__, greens),
+                    )
+                )
+                out[start + self.low_offset : end : 2] = bytes(
+                    map(
+                        int.__or__,
+                        map(self.green_low.__getitem__, greens),
+                        map(self.blue_low.__getitem__, blues),
+                    )
+                )
+
+            return
+
+        j = start
+        if self.format == "RGB888":
+            for i in range(0, num_bytes, 3):
+                out[j] = bgr_bytes[i + 2]
+                out[j + 1] = bgr_bytes[i + 1]
+                out[j + 2] = bgr_bytes[i]
+                j += 3
+        elif self.format == "GRAY8":
+            red_gray = self.red_gray
+            green_gray = self.green_gray
+            blue_gray = self.blue_gray
+            for i in range(0, num_bytes, 3):
+                out[j] = (
+                    red_gray[bgr_bytes[i + 2]]
+                    + green_gray[bgr_bytes[i + 1]]
+                    + blue_gray[bgr_bytes[i]]
+                ) >> 8
+                j += 1
+        else:
+            red_high = self.red_high
+            green_high = self.green_high
+            green_low = self.green_low
+            blue_low = self.blue_low
+            high = start + self.high_offset
+            low = start + self.low_offset
+            for i in range(0, num_bytes, 3):
+                green = bgr_bytes[i + 1]
+                out[high] = red_high[bgr_bytes[i + 2]] | green_high[green]
+                out[low] = green_low[green] | blue_low[bgr_bytes[i]]
+                high += 2
+                low += 2
+
+
+def _gray_from_parts(red, green, blue):
+    return (red + green + blue) >> 8
+
+
+class _BGR24Decoder:
+    """
+    Decoder for 24-bit pixels, which are already stored as blue, green, red triples.
+    """
+
+    bits_per_pixel = 24
+    bytes_per_pixel = 3
+    is_bgr24 = True
+    has_bgr_layout = True
+
+    def to_bgr(self, pixel_bytes, num_pixels, out):
+        num_bytes = num_pixels * 3
+        out[0:num_bytes] = pixel_bytes[0:num_bytes]
+
+        return out
+
+
+class _BitFieldsDecoder:
+    """
+    Decoder for 16-bit and 32-bit pixels, where the bits of each color channel are given by a mask.
+
+    The shift and scaling lookup table for each channel are worked out once up front, and the
+    common 8888 and 565 layouts get their own fast paths.
+    """
+
+    is_bgr24 = False
+
+    def __init__(self, bits_per_pixel, red_mask, green_mask, blue_mask):
+        self.bits_per_pixel = bits_per_pixel
+        self.bytes_per_pixel = bits_per_pixel // 8
+
+        self.__red = _BitFieldsDecoder._make_channel(red_mask)
+        self.__green = _BitFieldsDecoder._make_channel(green_mask)
+        self.__blue = _BitFieldsDecoder._make_channel(blue_mask)
+
+        masks = (red_mask, green_mask, blue_mask)
+        if bits_per_pixel == 32 and masks == (0x00FF0000, 0x0000FF00, 0x000000FF):
+            self.__layout = "8888"
+        elif bits_per_pixel == 16 and masks == (0xF800, 0x07E0, 0x001F):
+            self.__layout = "565"
+        else:
+            self.__layout = None
+
+        # 8888 pixels are blue, green, red, and then an unused or alpha byte
+        self.has_bgr_layout = self.__layout == "8888"
+
+    def to_bgr(self, pixel_bytes, num_pixels, out):
+        if self.__layout == "8888":
+            if _EXTENDED_SLICES:
+                num_bytes = num_pixels * 4
+                pixel_view = memoryview(pixel_bytes)
+                out[0 : num_pixels * 3 : 3] = pixel_view[0:num_bytes:4]
+                out[1 : num_pixels * 3 : 3] = pixel_view[1:num_bytes:4]
+                out[2 : num_pixels * 3 : 3] = pixel_view[2:num_bytes:4]
+            else:
+                j = 0
+                for i in range(0, num_pixels * 4, 4):
+                    out[j] = pixel_bytes[i]
+                    out[j + 1] = pixel_bytes[i + 1]
+                    out[j + 2] = pixel_bytes[i + 2]
+                    j += 3
+
+            return out
+
+        red_mask, red_shift, red_table = self.__red
+        green_mask, green_shift, green_table = self.__green
+        blue_mask, blue_shift, blue_table = self.__blue
+
+        j = 0
+        if self.__layout == "565":
+            for i in range(0, num_pixels * 2, 2):
+                pixel = pixel_bytes[i] | (pixel_bytes[i + 1] << 8)
+
+                out[j] = blue_table[pixel & 0x1F]
+                out[j + 1] = green_table[(pixel >> 5) & 0x3F]
+                out[j + 2] = red_table[pixel >> 11]
+                j += 3
+        elif self.bytes_per_pixel == 2:
+            for i in range(0, num_pixels * 2, 2):
+                pixel = pixel_bytes[i] | (pixel_bytes[i + 1] << 8)
+
+                out[j] = blue_table[(pixel & blue_mask) >> blue_shift]
+                out[j + 1] = green_table[(pixel & green_mask) >> green_shift]
+                out[j + 2] = red_table[(pixel & red_mask) >> red_shift]
+                j += 3
+        else:
+            for i in range(0, num_pixels * 4, 4):
+                pixel = (
+                    pixel_bytes[i]
+                    | (pixel_bytes[i + 1] << 8)
+                    | (pixel_bytes[i + 2] << 16)
+                    | (pixel_bytes[i + 3] << 24)
+                )
+
+                out[j] = blue_table[(pixel & blue_mask) >> blue_shift]
+                out[j + 1] = green_table[(pixel & green_mask) >> green_shift]
+                out[j + 2] = red_table[(pixel & red_mask) >> red_shift]
+                j += 3
+
+        return out
+
+    @staticmethod
+    def _make_channel(mask):
+        """
+        Returns the mask, shift, and lookup table needed to convert the bits of a color channel
+        into a 1 byte color value.
+        """
+        if mask is None or mask == 0:
+            return 0, 0, bytes(1)
+
+        shift = 0
+        while (mask >> shift) & 1 == 0:
+            shift += 1
+
+        num_bits = 0
+        while (mask >> (shift + num_bits)) & 1 == 1:
+            num_bits += 1
+
+        # Only the top 8 bits of channels that are more than 8 bits wide are used
+        if num_bits > 8:
+            shift += num_bits - 8
+            num_bits = 8
+
+        mask = ((1 << num_bits) - 1) << shift
+
+        # Scale the channel's values up to fill the full 0-255 range
+        max_value = (1 << num_bits) - 1
+        table = bytes(
+            [(value * 255 + max_value // 2) // max_value for value in range(0, max_value + 1)]
+        )
+
+        return mask, shift, table
+
+
+class _PaletteDecoder:
+    """
+    Decoder for 1-bit, 4-bit, and 8-bit pixels, which are indices into a color table.
+
+    The color table is expanded up front into a lookup table from each possible byte of pixel data
+    to the blue, green, red triples of all of the pixels packed into it (8 pixels per byte for 1-bit
+    pixels, 2 for 4-bit pixels, and 1 for 8-bit pixels).
+    """
+
+    is_bgr24 = False
+    has_bgr_layout = False
+    bytes_per_pixel = None
 
-        The file handle must have been opened in read binary mode ("rb").
+    def __init__(self, bits_per_pixel, palette_bytes):
+        self.bits_per_pixel = bits_per_pixel
 
-        :param file_handle: The file handle of the BMP image to read.
-        :type file_handle: io.TextIOWrapper
-        """
-        self.file_handle = file_handle
-        self.__bmp_header = None
-        self.__dib_header = None
+        num_entries = 1 << bits_per_pixel
+        colors = []
+        for i in range(0, num_entries):
+            # Entries are blue, green, red, and then an unused byte. Pixels that refer to entries
+            # past the end of the palette are treated as black.
+            color = bytes(palette_bytes[i * 4 : i * 4 + 3])
+            if len(color) < 3:
+                color = bytes(3)
 
-    def read_bmp_file_header(self):
-        """
-        Returns the BMP file header of the image.
+            colors.append(color)
 
-        :return: BMP file header of the image.
-        :rtype: BMPHeader
-        """
-        if self.__bmp_header is not None:
-            return self.__bmp_header
+        self.colors = colors
 
-        self.file_handle.seek(0)
+        pixels_per_byte = 8 // bits_per_pixel
+        index_mask = num_entries - 1
 
-        header_bytes = self.file_handle.read(14)
+        self.__byte_table = [
+            b"".join(
+                [
+                    colors[(byte >> (8 - bits_per_pixel * (k + 1))) & index_mask]
+                    for k in range(0, pixels_per_byte)
+                ]
+            )
+            for byte in range(0, 256)
+        ]
+        self.__pixels_per_byte = pixels_per_byte
 
-        bmp_header = BMPHeader.from_bytes(header_bytes)
-        self.__bmp_header = bmp_header
+    def to_bgr(self, pixel_bytes, num_pixels, out):
+        num_bytes = (num_pixels + self.__pixels_per_byte - 1) // self.__pixels_per_byte
 
-        return bmp_header
+        byte_table = self.__byte_table
+        bgr_bytes = b"".join([byte_table[byte] for byte in pixel_bytes[0:num_bytes]])
 
-    def read_dib_header(self):
-        """
-        Returns the DIB header of the BMP file.
+        out[0 : num_pixels * 3] = bgr_bytes[0 : num_pixels * 3]
 
-        :return: DIB header of the image.
-        :rtype: DIBHeader
-        """
-        if self.__dib_header is not None:
-            return self.__dib_header
+        return out
 
-        self.file_handle.seek(14)
 
-        dib_header = DIBHeader.from_positioned_file_handler(self.file_handle)
-        self.__dib_header = dib_header
+class _RLEDecoder:
+    """
+    Decoder for run-length encoded (RLE8 and RLE4) pixel data, which decodes each row into one
+    palette index byte per pixel.
 
-        return dib_header
+    Since the encoded rows have varying lengths, the decoder keeps an index of where each row starts
+    in the file, which is filled in as rows are decoded. This way once a row has been reached, it
+    can be decoded again directly without having to decode all of the rows before it. The index
+    only grows as far as the rows that have been reached, so its size is bounded by the amount of
+    encoded data rather than by the height given in the header.
 
-    def get_width(self):
-        """
-        Returns the width of the image (in pixels).
+    If keep_index is False, then rows can only be decoded in order, and each row is dropped from
+    the index once it has been decoded, so only the rows just ahead of the current one are kept.
+    """
 
-        :return: Width of the image in pixels.
-        :rtype: int
-        """
-        return self.read_dib_header().width
+    # Marks rows that contain no pixel data, since they were skipped over by a delta or come after
+    # the end of the bitmap
+    EMPTY_ROW = -1
 
-    def get_height(self):
-        """
-        Returns the height of the image (in pixels).
+    def __init__(self, bits_per_pixel, width, height, image_start_offset, keep_index=True):
+        self.bits_per_pixel = bits_per_pixel
+        self.width = width
+        self.height = height
+        self.keep_index = keep_index
 
-        :return: Height of the image in pixels.
-        :rtype: int
-        """
-        return self.read_dib_header().height
+        # Where the encoded data of each row starts in the file, and the column that the first
+        # pixel of that data goes in, for the rows reached so far starting from first_row (which
+        # is only past the first row if keep_index is False)
+        self.row_offsets = []
+        self.row_start_columns = []
+        self.first_row = 0
 
-    def get_row(self, row):
-        """
-        Reads in the pixels of the specified row (zero-indexed).
+        # The rows from here on come after the end of the bitmap, so contain no pixel data
+        self.__end_row = height
 
-        :param row: The index of the row to read.
-        :type row: int
-        :return: The colors of the pixels in the specified row.
-        :rtype: List[Color]
-        """
-        PIXEL_SIZE_BYTES = 3
+        if height > 0:
+            self.row_offsets.append(image_start_offset)
+            self.row_start_columns.append(0)
 
-        # Check the file info to make sure we support it
-        bits_per_pixel = self.read_dib_header().bits_per_pixel
-        if bits_per_pixel != 24:
-            raise ValueError(
-                "This parser does not currently support BMP files with {} bits per pixel. Currently only 24-bit color values are supported.".format(bits_per_pixel)
-            )
+        self.__read_size = max(64, width)
 
-        compression_type = self.read_dib_header().compression_type
-        if compression_type != CompressionType.BI_RGB:
+    def decode_row(self, read, file_row):
+        """
+        Decodes the given row (in file order), using the given function to read bytes from the file.
+        """
+        if file_row < self.first_row:
             raise ValueError(
-                "This parser does not currently support compressed BMP files."
+                "Row {} has already been decoded, and rows can only be decoded in order.".format(
+                    file_row
+                )
             )
 
-        # Prepare to start parsing the row
-        height = self.get_height()
-        assert row < height
+        num_rows_reached = self._get_num_rows_reached()
+        while num_rows_reached <= file_row and num_rows_reached < self.__end_row:
+            self._decode_indexed_row(read, num_rows_reached - 1)
+            num_rows_reached = self._get_num_rows_reached()
 
-        row_index = (height - row) - 1
+        if file_row >= self._get_num_rows_reached():
+            # Pixels that are not covered by the encoded data are left as palette index 0
+            return bytearray(self.width)
 
-        # Rows are padded out to 4 byte alignment
-        row_size = int(math.ceil((PIXEL_SIZE_BYTES * self.get_width()) / 4.0) * 4)
+        return self._decode_indexed_row(read, file_row)
 
-        row_start = (
-            self.read_bmp_file_header().image_start_offset + row_size * row_index
-        )
+    def get_row_offset(self, file_row):
+        """
+        Returns where the encoded data of the given row (in file order) starts in the file, or None
+        if the row has not been reached yet or contains no pixel data.
+        """
+        if file_row < self.first_row or file_row >= self._get_num_rows_reached():
+            return None
 
-        # Read in the row information from the file
-        self.file_handle.seek(row_start)
+        offset = self.row_offsets[file_row - self.first_row]
+        return None if offset == _RLEDecoder.EMPTY_ROW else offset
 
-        row_bytes = list(bytearray(self.file_handle.read(row_size)))
+    def _get_num_rows_reached(self):
+        return self.first_row + len(self.row_offsets)
 
-        # Parse the pixel color information for the row
-        pixels = []
-        i = 0
-        while i < self.get_width():
-            start = i * 3
-            end = (i + 1) * 3
+    def _decode_indexed_row(self, read, file_row):
+        # Pixels that are not covered by the encoded data are left as palette index 0
+        indices = bytearray(self.width)
 
-            pixels.append(Color.from_bytes(row_bytes[start:end]))
+        offset = self.row_offsets[file_row - self.first_row]
+        x = self.row_start_columns[file_row - self.first_row]
 
-            i += 1
+        if not self.keep_index:
+            # The row will not be decoded again, so it (and any rows before it) can be forgotten
+            del self.row_offsets[0 : file_row - self.first_row + 1]
+            del self.row_start_columns[0 : file_row - self.first_row + 1]
+            self.first_row = file_row + 1
 
-        return pixels
+        if offset == _RLEDecoder.EMPTY_ROW:
+            return indices
 
+        width = self.width
+        is_rle4 = self.bits_per_pixel == 4
 
-class Color:
+        data = read(offset, self.__read_size)
+        end_of_file = len(data) < self.__read_size
+        i = 0
+        while True:
+            # Make sure that the longest possible command (absolute mode) is in the read in data
+            if i + 260 > len(data) and not end_of_file:
+                more_data = read(offset + len(data), self.__read_size + 260)
+                end_of_file = len(more_data) < self.__read_size + 260
+
+                data = bytes(data[i:]) + bytes(more_data)
+                offset += i
+                i = 0
+
+            if i + 2 > len(data):
+                # Ran out of data, so treat it like the end of the bitmap
+                self._mark_rest_empty(file_row + 1)
+                break
+
+            count = data[i]
+            value = data[i + 1]
+            i += 2
+
+            if count > 0:
+                # Encoded mode, with a run of count pixels of the same index (or pair of
+                # alternating indices for RLE4)
+                end = min(x + count, width)
+                if is_rle4:
+                    high = value >> 4
+                    low = value & 0x0F
+                    for k in range(0, end - x):
+                        indices[x + k] = low if k & 1 else high
+                else:
+                    for k in range(x, end):
+                        indices[k] = value
+
+                x += count
+            elif value == 0:
+                # End of line
+                self._index_row(file_row + 1, offset + i, 0)
+                break
+            elif value == 1:
+                # End of bitmap
+                self._mark_rest_empty(file_row + 1)
+                break
+            elif value == 2:
+                # Delta, which moves the position right and up (in file order)
+                if i + 2 > len(data):
+                    self._mark_rest_empty(file_row + 1)
+                    break
+
+                dx = data[i]
+                dy = data[i + 1]
+                i += 2
+
+                x += dx
+                if dy > 0:
+                    for empty_row in range(file_row + 1, min(file_row + dy, self.height)):
+                        self._index_row(empty_row, _RLEDecoder.EMPTY_ROW, 0)
+
+                    self._index_row(file_row + dy, offset + i, x)
+                    break
+            else:
+                # Absolute mode, with value indices given directly, padded to 2 byte alignment
+                if is_rle4:
+                    num_bytes = (value + 1) // 2
+                else:
+                    num_bytes = value
+
+                literal = data[i : i + num_bytes]
+                for k in range(0, min(value, width - x, len(literal) * (2 if is_rle4 else 1))):
+                    if is_rle4:
+                        byte = literal[k >> 1]
+                        indices[x + k] = byte & 0x0F if k & 1 else byte >> 4
+                    else:
+                        indices[x + k] = literal[k]
+
+                x += value
+                i += num_bytes + (num_bytes & 1)
+
+        return indices
+
+    def _index_row(self, file_row, offset, start_column):
+        # Rows are reached in order, so only the row after the last indexed one can be new
+        if file_row != self._get_num_rows_reached() or file_row >= self.__end_row:
+            return
+
+        self.row_offsets.append(offset)
+        self.row_start_columns.append(start_column)
+
+    def _mark_rest_empty(self, first_file_row):
+        if first_file_row == self._get_num_rows_reached():
+            self.__end_row = min(self.__end_row, first_file_row)
+
+
+class _ForwardReader:
     """
-    A 24bit RGB color value.
+    Reads bytes at given offsets from a stream that cannot seek, as long as the offsets only move
+    forwards. Bytes that are skipped over are read and thrown away.
+
+    Bytes read with read_at are kept until they are discarded, so that a decoder can read ahead and
+    then continue from part way into what it read.
     """
 
-    red = 0
-    green = 0
-    blue = 0
+    def __init__(self, stream):
+        self.stream = stream
 
-    def __init__(self, red, green, blue):
+        # The bytes that have been read from the stream but not discarded yet, and the offset of
+        # the first of them
+        self.offset = 0
+        self.data = b""
+
+    def read(self, size):
         """
-        Creates a Color from the given 1 byte red, green, and blue color values.
+        Reads the given number of bytes from the current position, like a file's read method.
+        """
+        data = self.read_at(self.offset, size)
+        self.discard_before(self.offset + len(data))
 
-        :param red: The 1 byte red value.
-        :type red: int
-        :param green: The 1 byte green value.
-        :type green: int
-        :param blue: The 1 byte blue value.
-        :type blue: int
+        return data
+
+    def read_at(self, offset, size):
         """
-        self.red = red
-        self.green = green
-        self.blue = blue
+        Reads up to the given number of bytes starting at the given offset, which must not be
+        before any discarded bytes.
+        """
+        self._check_offset(offset)
 
-    def __repr__(self):
-        return "Color(red={}, green={}, blue={})".format(self.red, self.green, self.blue)
+        available_end = self.offset + len(self.data)
+        if offset > available_end:
+            self.discard_before(offset)
+            available_end = offset
 
-    def __eq__(self, other):
-        if not isinstance(other, Color):
-            return False
+        if offset + size > available_end:
+            self.data = bytes(self.data) + self._read_stream(offset + size - available_end)
 
-        return (
-            self.red == other.red
-            and self.green == other.green
-            and self.blue == other.blue
-        )
+        start = offset - self.offset
+        return self.data[start : start + size]
 
-    @staticmethod
-    def from_bytes(color_bytes):
-        blue = color_bytes[0]
-        green = color_bytes[1]
-        red = color_bytes[2]
+    def readinto_at(self, offset, buffer):
+        """
+        Fills the given buffer with the bytes starting at the given offset, discarding everything
+        before it.
+        """
+        self.discard_before(offset)
+
+        size = len(buffer)
+        filled = min(size, len(self.data))
+        buffer[0:filled] = self.data[0:filled]
+        self.data = self.data[filled:]
+
+        readinto = getattr(self.stream, "readinto", None)
+        while filled < size:
+            if readinto is not None:
+                num_read = readinto(buffer[filled:])
+            else:
+                chunk = self.stream.read(size - filled)
+                num_read = len(chunk) if chunk else 0
+                buffer[filled : filled + num_read] = chunk
+
+            if not num_read:
+                raise ValueError(
+                    "Stream ended after {} bytes, before the end of the image.".format(
+                        offset + filled
+                    )
+                )
+
+            filled += num_read
+
+        self.offset = offset + size
+
+    def discard_before(self, offset):
+        """
+        Throws away all of the bytes before the given offset, reading and throwing away bytes from
+        the stream if the offset is past the bytes that have been read.
+        """
+        self._check_offset(offset)
 
-        return Color(red, green, blue)
+        skipped = offset - self.offset
+        if skipped < len(self.data):
+            self.data = self.data[skipped:]
+        else:
+            skipped -= len(self.data)
+            self.data = b""
+
+            while skipped > 0:
+                chunk = self.stream.read(min(skipped, DEFAULT_CHUNK_SIZE))
+                if not chunk:
+                    raise ValueError(
+                        "Stream ended after {} bytes, before the end of the image.".format(
+                            offset - skipped
+                        )
+                    )
+
+                skipped -= len(chunk)
+
+        self.offset = offset
+
+    def _check_offset(self, offset):
+        if offset < self.offset:
+            raise ValueError(
+                "Cannot read backwards in a stream (offset {} is before {}).".format(
+                    offset, self.offset
+                )
+            )
+
+    def _read_stream(self, size):
+        # Streams such as sockets and pipes can return fewer bytes than requested before their end
+        chunks = []
+        remaining = size
+        while remaining > 0:
+            chunk = self.stream.read(remaining)
+            if not chunk:
+                break
+
+            chunks.append(chunk)
+            remaining -= len(chunk)
+
+        return b"".join(chunks)
+
+
+def _supports_extended_slices():
+    # MicroPython does not support slices with a step for all types
+    try:
+        buffer = bytearray(4)
+        buffer[0:4:2] = memoryview(b"\x01\x02\x03\x04")[0:4:2]
+        return bytes(buffer) == b"\x01\x00\x03\x00" and b"\x01\x02\x03"[0::2] == b"\x01\x03"
+    except Exception:
+        return False
+
+
+_EXTENDED_SLICES = _supports_extended_slices()
 
 
 class BMPHeader:
@@ -224,16 +2791,24 @@ class BMPHeader:
 
     @staticmethod
     def from_bytes(header_bytes):
-        header_bytes_list = list(bytearray(header_bytes))
+        bmp_type_bytes, size, value_1, value_2, image_start_offset = struct.unpack_from(
+            "<2sI2s2sI", header_bytes, 0
+        )
 
-        bmp_type = BMPType.from_bytes(header_bytes_list[0:2])
-        size = int.from_bytes(bytes(header_bytes_list[2:6]), "little")
-        value_1 = bytes(header_bytes_list[6:8])
-        value_2 = bytes(header_bytes_list[8:10])
-        image_start_offset = int.from_bytes(bytes(header_bytes_list[10:14]), "little")
+        bmp_type = BMPType.from_bytes(bmp_type_bytes)
 
         return BMPHeader(bmp_type, size, value_1, value_2, image_start_offset)
 
+    def to_bytes(self):
+        return struct.pack(
+            "<2sI2s2sI",
+            BMPType.to_bytes(self.bmp_type),
+            self.size,
+            self.value_1,
+            self.value_2,
+            self.image_start_offset,
+        )
+
 
 class DIBHeader:
     def __init__(
@@ -248,6 +2823,10 @@ class DIBHeader:
         vertical_resolution_ppm,
         num_colors_in_palette,
         num_important_colors_used,
+        red_mask=None,
+        green_mask=None,
+        blue_mask=None,
+        alpha_mask=None,
     ):
         self.width = width
         self.height = height
@@ -259,6 +2838,10 @@ class DIBHeader:
         self.vertical_resolution_ppm = vertical_resolution_ppm
         self.num_colors_in_palette = num_colors_in_palette
         self.num_important_colors_used = num_important_colors_used
+        self.red_mask = red_mask
+        self.green_mask = green_mask
+        self.blue_mask = blue_mask
+        self.alpha_mask = alpha_mask
 
     def __eq__(self, other):
         if not isinstance(other, DIBHeader):
@@ -275,9 +2858,27 @@ class DIBHeader:
             and self.vertical_resolution_ppm == other.vertical_resolution_ppm
             and self.num_colors_in_palette == other.num_colors_in_palette
             and self.num_important_colors_used == other.num_important_colors_used
+            and self.red_mask == other.red_mask
+            and self.green_mask == other.green_mask
+            and self.blue_mask == other.blue_mask
+            and self.alpha_mask == other.alpha_mask
         )
 
     def __repr__(self):
+        # The bit masks are only given for images that use them
+        masks = ""
+        if self.red_mask is not None:
+            masks = """
+    red_mask={},
+    green_mask={},
+    blue_mask={},
+    alpha_mask={},""".format(
+                hex(self.red_mask),
+                hex(self.green_mask),
+                hex(self.blue_mask),
+                None if self.alpha_mask is None else hex(self.alpha_mask),
+            )
+
         return """DIBHeader(
     width={},
     height={},
@@ -288,7 +2889,7 @@ class DIBHeader:
     horizontal_resolution_ppm={},
     vertical_resolution_ppm={},
     num_colors_in_palette={},
-    num_important_colors_used={},
+    num_important_colors_used={},{}
 )""".format(
             self.width,
             self.height,
@@ -300,56 +2901,92 @@ class DIBHeader:
             self.vertical_resolution_ppm,
             self.num_colors_in_palette,
             self.num_important_colors_used,
+            masks,
         )
 
     @staticmethod
-    def from_positioned_file_handler(file_handler):
-        # Based on info from:
-        # https://en.wikipedia.org/wiki/BMP_file_format#DIB_header_(bitmap_information_header)
-
+    def from_positioned_file_handler(file_handler, max_header_size=100000):
         header_size = int.from_bytes(file_handler.read(4), "little")
 
-        if header_size <= 0:
+        # Check the size before reading the rest of the header, since a size under 4 would turn into
+        # a read of the whole rest of the file
+        if header_size < 12:
+            # The smallest DIB header is the 12 byte BITMAPCOREHEADER
             raise ValueError("BMP header has invalid header size: " + str(header_size))
-        elif header_size > 100000:
+        elif header_size < 40:
+            raise ValueError(
+                "BMP file looks like it might be using an old BMP DIB header that we do not support."
+            )
+        elif header_size > max_header_size:
             raise ValueError("BMP header looks like it may be too big (header_size=" + str(header_size) + ").")
 
         try:
-            header_bytes_list = list(bytearray(file_handler.read(header_size - 4)))
+            header_bytes = header_size.to_bytes(4, "little") + file_handler.read(header_size - 4)
         except MemoryError:
             raise MemoryError("MemoryError when trying to read BMP file header. header_size=" + str(header_size))
 
-        width = None
-        height = None
-        num_color_planes = None
-        bits_per_pixel = None
-        compression_type = None
-        raw_bitmap_size = None
-        horizontal_resolution_ppm = None
-        vertical_resolution_ppm = None
-        num_colors_in_palette = None
-        num_important_colors_used = None
+        if len(header_bytes) < header_size:
+            raise ValueError(
+                "BMP file ended part way through its DIB header (header_size={}).".format(header_size)
+            )
+
+        # The color channel bit masks directly follow the header in BITMAPINFOHEADER
+        if header_size < 52 and len(header_bytes) >= 20:
+            compression_type = struct.unpack_from("<I", header_bytes, 16)[0]
+            if compression_type == CompressionType.BI_BITFIELDS:
+                header_bytes += file_handler.read(12)
+            elif compression_type == CompressionType.BI_ALPHABITFIELDS:
+                header_bytes += file_handler.read(16)
+
+        return DIBHeader.from_bytes(header_bytes)
+
+    @staticmethod
+    def from_bytes(header_bytes):
+        """
+        Parses a DIB header from the given bytes, starting from the header size field.
+
+        For BITMAPINFOHEADER headers of images that use bit fields compression, the color channel
+        bit masks that follow the header also need to be included in the given bytes.
+
+        :param header_bytes: The bytes of the header.
+        :type header_bytes: bytes
+        :return: The parsed DIB header.
+        :rtype: DIBHeader
+        """
+        # Based on info from:
+        # https://en.wikipedia.org/wiki/BMP_file_format#DIB_header_(bitmap_information_header)
+        header_size = struct.unpack_from("<I", header_bytes, 0)[0]
+
+        red_mask = None
+        green_mask = None
+        blue_mask = None
+        alpha_mask = None
 
         # BITMAPINFOHEADER or higher version
         if header_size in [40, 52, 56, 108, 124] or header_size > 124:
-            width = int.from_bytes(bytes(header_bytes_list[0:4]), "little")
-            height = int.from_bytes(bytes(header_bytes_list[4:8]), "little")
-            num_color_planes = int.from_bytes(bytes(header_bytes_list[8:10]), "little")
-            bits_per_pixel = int.from_bytes(bytes(header_bytes_list[10:12]), "little")
-            compression_type = int.from_bytes(bytes(header_bytes_list[12:16]), "little")
-            raw_bitmap_size = int.from_bytes(bytes(header_bytes_list[16:20]), "little")
-            horizontal_resolution_ppm = int.from_bytes(
-                bytes(header_bytes_list[20:24]), "little"
-            )
-            vertical_resolution_ppm = int.from_bytes(
-                bytes(header_bytes_list[24:28]), "little"
-            )
-            num_colors_in_palette = int.from_bytes(
-                bytes(header_bytes_list[28:32]), "little"
-            )
-            num_important_colors_used = int.from_bytes(
-                bytes(header_bytes_list[32:36]), "little"
-            )
+            (
+                width,
+                height,
+                num_color_planes,
+                bits_per_pixel,
+                compression_type,
+                raw_bitmap_size,
+                horizontal_resolution_ppm,
+                vertical_resolution_ppm,
+                num_colors_in_palette,
+                num_important_colors_used,
+            ) = struct.unpack_from("<IiHHIIIIII", header_bytes, 4)
+
+            # The color channel bit masks are part of the header in BITMAPV2INFOHEADER and later,
+            # but directly follow the header in BITMAPINFOHEADER
+            if compression_type in (
+                CompressionType.BI_BITFIELDS,
+                CompressionType.BI_ALPHABITFIELDS,
+            ):
+                red_mask, green_mask, blue_mask = struct.unpack_from("<III", header_bytes, 40)
+
+                if header_size >= 56 or compression_type == CompressionType.BI_ALPHABITFIELDS:
+                    alpha_mask = struct.unpack_from("<I", header_bytes, 52)[0]
         else:
             # Note: Might add some support for older headers in the future, but I don't know how to
             # generate BMP files with them, so maybe not.
@@ -368,8 +3005,43 @@ class DIBHeader:
             vertical_resolution_ppm=vertical_resolution_ppm,
             num_colors_in_palette=num_colors_in_palette,
             num_important_colors_used=num_important_colors_used,
+            red_mask=red_mask,
+            green_mask=green_mask,
+            blue_mask=blue_mask,
+            alpha_mask=alpha_mask,
+        )
+
+    def to_bytes(self):
+        """
+        Returns the bytes of the header as a BITMAPINFOHEADER, followed by the color channel bit
+        masks if the header has them.
+
+        :return: The bytes of the header.
+        :rtype: bytes
+        """
+        header_bytes = struct.pack(
+            "<IIiHHIIIIII",
+            40,
+            self.width,
+            self.height,
+            self.num_color_planes,
+            self.bits_per_pixel,
+            self.compression_type,
+            self.raw_bitmap_size,
+            self.horizontal_resolution_ppm,
+            self.vertical_resolution_ppm,
+            self.num_colors_in_palette,
+            self.num_important_colors_used,
         )
 
+        if self.red_mask is not None:
+            header_bytes += struct.pack("<III", self.red_mask, self.green_mask, self.blue_mask)
+
+            if self.compression_type == CompressionType.BI_ALPHABITFIELDS:
+                header_bytes += struct.pack("<I", self.alpha_mask or 0)
+
+        return header_bytes
+
 
 # Note: Can't use enum here, since MicroPython doesn't currently have an enum standard library
 class BMPType:
@@ -399,11 +3071,20 @@ class BMPType:
         else:
             raise ValueError(f'Invalid BMP type: "{type_str}"')
 
+    @staticmethod
+    def to_bytes(bmp_type):
+        type_strs = ["BM", "BA", "CI", "CP", "IC", "PT"]
+        if not 0 <= bmp_type < len(type_strs):
+            raise ValueError(f'Invalid BMP type: "{bmp_type}"')
+
+        return type_strs[bmp_type].encode()
+
 
 class CompressionType:
     BI_RGB = 0
     BI_RLE8 = 1
     BI_REL4 = 2
+    BI_RLE4 = 2
     BI_BITFIELDS = 3
     BI_JPEG = 4
     BI_PNG = 5
@@ -432,3 +3113,375 @@ class CompressionType:
     @staticmethod
     def is_compressed(compression_type):
         return compression_type not in [CompressionType.BI_RGB, CompressionType.BI_CMYK]
+
+
+# The number of bytes at the start of a BMP file needed to read its metadata: the BMP file header,
+# the largest standard DIB header, and the bit masks that can follow a BITMAPINFOHEADER
+METADATA_PREFIX_SIZE = 14 + 124 + 16
+
+
+def read_metadata(file_handle):
+    """
+    Reads the metadata of a BMP file (its dimensions, bits per pixel, and compression type) using a
+    single small read from the start of the file.
+
+    :param file_handle: The file handle of the BMP image to read, opened in read binary mode ("rb").
+    :type file_handle: io.TextIOWrapper
+    :return: The metadata of the image, with keys "width", "height", "top_down", "bits_per_pixel",
+        and "compression_type".
+    :rtype: Dict[str, int]
+    """
+    prefix = memoryview(file_handle.read(METADATA_PREFIX_SIZE))
+
+    if len(prefix) < 14 + 40:
+        raise ValueError("File is too small to be a BMP file ({} bytes).".format(len(prefix)))
+
+    BMPHeader.from_bytes(prefix[0:14])
+    dib_header = DIBHeader.from_bytes(prefix[14:])
+
+    return {
+        "width": dib_header.width,
+        "height": abs(dib_header.height),
+        "top_down": dib_header.height < 0,
+        "bits_per_pixel": dib_header.bits_per_pixel,
+        "compression_type": dib_header.compression_type,
+    }
+
+
+def _get_mtime(stat):
+    """
+    Returns the modification time from the given os.stat result, in nanoseconds where available
+    (CPython) so that files rewritten within the same second are noticed, or in seconds otherwise
+    (MicroPython, where os.stat returns a plain tuple).
+    """
+    return getattr(stat, "st_mtime_ns", stat[8])
+
+
+class AssetCache:
+    """
+    A cache of images that have been decoded into a display's pixel format (ex. RGB565), stored as
+    files on flash storage alongside the BMP files that they were decoded from.
+
+    The first time an image is loaded it is decoded as usual, and the decoded pixels are written to
+    a cache file next to the BMP file (ex. "cat.bmp" is cached as "cat.bmp.pxc"). Later loads read
+    the cache file directly into the framebuffer, which skips parsing and converting the image.
+
+    Each cache file starts with a small header that records the size and modification time of the
+    BMP file it was made from, so it is ignored (and replaced) if the BMP file changes. On CPython
+    the modification time is recorded in nanoseconds, so changes within the same second are
+    noticed too.
+
+    If a budget is given, then the total size of the cache files is kept within it by deleting the
+    least recently used ones. The cache files are tracked in a small JSON index file, which is only
+    written to when a cache file is added or deleted, to limit writes to flash.
+    """
+
+    SUFFIX = ".pxc"
+
+    # Magic bytes, version, pixel format, width, height, source size, and source modification time
+    HEADER_FORMAT = "<4sBBIIQq"
+    HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+    MAGIC = b"BMPC"
+    VERSION = 2
+
+    def __init__(self, index_path="asset_cache.json", max_bytes=None, format="RGB565_BE"):
+        """
+        Creates an AssetCache.
+
+        :param index_path: The path of the JSON file used to keep track of the cache files.
+        :type index_path: str
+        :param max_bytes: The maximum total size of the cache files (in bytes). Defaults to no limit.
+        :type max_bytes: int
+        :param format: The pixel format to store images in (see BMPFileReader.decode_into).
+        :type format: str
+        """
+        self.index_path = index_path
+        self.max_bytes = max_bytes
+        self.format = format
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.__converter = _PixelFormatConverter.get(format)
+        self.__format_code = _PixelFormatConverter.FORMATS.index(format)
+
+        # List of [cache_path, size] entries, from least to most recently used
+        self.__entries = None
+
+    def get_cache_path(self, path):
+        """
+        Returns the path of the cache file for the given BMP file.
+
+        :param path: The path of the BMP file.
+        :type path: str
+        :return: The path of the cache file.
+        :rtype: str
+        """
+        return path + AssetCache.SUFFIX
+
+    def load_into(self, path, buffer, x=0, y=0, stride=None):
+        """
+        Loads the given BMP image into the given buffer, like BMPFileReader.decode_into, using the
+        cached copy of the image if it is up to date, or decoding the image and caching it if not.
+
+        :param path: The path of the BMP file.
+        :type path: str
+        :param buffer: The writable buffer to load the image into.
+        :type buffer: bytearray
+        :param x: The column of the buffer to put the left edge of the image at.
+        :type x: int
+        :param y: The row of the buffer to put the top edge of the image at.
+        :type y: int
+        :param stride: The number of bytes per row of the buffer. Defaults to the width of the image
+            times the number of bytes per pixel of the format.
+        :type stride: int
+        :return: True if the image was loaded from the cache, or False if it was decoded.
+        :rtype: bool
+        """
+        import os
+
+        stat = os.stat(path)
+        source_size = stat[6]
+        source_mtime = _get_mtime(stat)
+
+        cache_path = self.get_cache_path(path)
+        if self._load_cached(cache_path, source_size, source_mtime, buffer, x, y, stride):
+            self.hits += 1
+            self._touch(cache_path)
+            return True
+
+        self.misses += 1
+
+        with open(path, "rb") as file_handle:
+            reader = BMPFileReader(file_handle)
+            reader.decode_into(buffer, format=self.format, x=x, y=y, stride=stride)
+
+            width = reader.get_width()
+            height = reader.get_height()
+
+        self._store(cache_path, source_size, source_mtime, width, height, buffer, x, y, stride)
+
+        return False
+
+    def clear(self):
+        """
+        Deletes all of the cache files.
+        """
+        import os
+
+        for cache_path, _ in self._get_entries():
+            try:
+                os.remove(cache_path)
+            except OSError:
+                pass
+
+        self.__entries = []
+        self._save_index()
+
+    def get_total_bytes(self):
+        """
+        Returns the total size of the cache files (in bytes).
+
+        :return: The total size of the cache files.
+        :rtype: int
+        """
+        return sum(size for _, size in self._get_entries())
+
+    def _load_cached(self, cache_path, source_size, source_mtime, buffer, x, y, stride):
+        import os
+
+        bytes_per_pixel = self.__converter.bytes_per_pixel
+
+        try:
+            cache_size = os.stat(cache_path)[6]
+            with open(cache_path, "rb") as cache_file:
+                header = cache_file.read(AssetCache.HEADER_SIZE)
+                if len(header) < AssetCache.HEADER_SIZE:
+                    return False
+
+                magic, version, format_code, width, height, size, mtime = struct.unpack(
+                    AssetCache.HEADER_FORMAT, header
+                )
+
+                # Also catch cache files that were cut off while being written
+                if (
+                    magic != AssetCache.MAGIC
+                    or version != AssetCache.VERSION
+                    or format_code != self.__format_code
+                    or size != source_size
+                    or mtime != source_mtime
+                    or cache_size != AssetCache.HEADER_SIZE + width * height * bytes_per_pixel
+                ):
+                    return False
+
+                row_size = width * bytes_per_pixel
+                if stride is None:
+                    stride = row_size
+
+                _check_fits(buffer, width, height, x, y, stride, bytes_per_pixel)
+
+                buffer_view = memoryview(buffer)
+                start = y * stride + x * bytes_per_pixel
+                if stride == row_size:
+                    # The rows are contiguous in the buffer, so read them all at once
+                    cache_file.readinto(buffer_view[start : start + row_size * height])
+                else:
+                    for row in range(0, height):
+                        row_start = start + row * stride
+                        cache_file.readinto(buffer_view[row_start : row_start + row_size])
+        except OSError:
+            return False
+
+        return True
+
+    def _store(self, cache_path, source_size, source_mtime, width, height, buffer, x, y, stride):
+        import os
+
+        bytes_per_pixel = self.__converter.bytes_per_pixel
+        row_size = width * bytes_per_pixel
+        if stride is None:
+            stride = row_size
+
+        size = AssetCache.HEADER_SIZE + row_size * height
+
+        entries = self._get_entries()
+
+        # Whether the index needs to be written, which is avoided where possible to limit writes to
+        # flash
+        index_changed = self._remove_entry(cache_path)
+
+        if self.max_bytes is not None:
+            if size > self.max_bytes:
+                # The image can never be cached, so only drop any outdated cache file for it
+                if index_changed:
+                    try:
+                        os.remove(cache_path)
+                    except OSError:
+                        pass
+
+                    self._save_index()
+
+                return
+
+            total_bytes = self.get_total_bytes()
+            while total_bytes + size > self.max_bytes:
+                oldest_path, oldest_size = entries.pop(0)
+                try:
+                    os.remove(oldest_path)
+                except OSError:
+                    pass
+
+                total_bytes -= oldest_size
+                self.evictions += 1
+                index_changed = True
+
+        try:
+            with open(cache_path, "wb") as cache_file:
+                # Write the header last, so that a cache file that is cut off part way through
+                # being written is never seen as valid
+                cache_file.write(bytes(AssetCache.HEADER_SIZE))
+
+                buffer_view = memoryview(buffer)
+                start = y * stride + x * bytes_per_pixel
+                for row in range(0, height):
+                    row_start = start + row * stride
+                    cache_file.write(buffer_view[row_start : row_start + row_size])
+
+                cache_file.seek(0)
+                cache_file.write(
+                    struct.pack(
+                        AssetCache.HEADER_FORMAT,
+                        AssetCache.MAGIC,
+                        AssetCache.VERSION,
+                        self.__format_code,
+                        width,
+                        height,
+                        source_size,
+                        source_mtime,
+                    )
+                )
+        except OSError:
+            # Ex. the flash storage is full, in which case the image just does not get cached
+            try:
+                os.remove(cache_path)
+            except OSError:
+                pass
+
+            if index_changed:
+                self._save_index()
+
+            return
+
+        entries.append([cache_path, size])
+        self._save_index()
+
+    def _touch(self, cache_path):
+        # Mark the entry as the most recently used one. This is only saved to the index the next
+        # time that it is written.
+        entries = self._get_entries()
+        for i in range(0, len(entries)):
+            if entries[i][0] == cache_path:
+                entries.append(entries.pop(i))
+                return
+
+        # Cache files that are missing from the index (ex. due to a lost index) still count towards
+        # the budget
+        import os
+
+        entries.append([cache_path, os.stat(cache_path)[6]])
+
+    def _remove_entry(self, cache_path):
+        # Returns whether the entry was in the index
+        entries = self._get_entries()
+        for i in range(0, len(entries)):
+            if entries[i][0] == cache_path:
+                entries.pop(i)
+                return True
+
+        return False
+
+    def _get_entries(self):
+        if self.__entries is None:
+            import json
+
+            try:
+                with open(self.index_path, "r") as input_stream:
+                    self.__entries = json.load(input_stream)
+            except (OSError, ValueError):
+                self.__entries = []
+
+        return self.__entries
+
+    def _save_index(self):
+        import json
+
+        with open(self.index_path, "w") as output_stream:
+            json.dump(self._get_entries(), output_stream)
+
+
+def _check_fits(buffer, width, height, x, y, stride, bytes_per_pixel):
+    # Makes sure that an image of the given size fits at the given position in the buffer
+    if x < 0 or y < 0 or stride < (x + width) * bytes_per_pixel:
+        raise ValueError(
+            "A {}x{} image does not fit at x={}, y={} in a buffer with a stride of {} bytes.".format(
+                width, height, x, y, stride
+            )
+        )
+
+    required_size = (y + height - 1) * stride + (x + width) * bytes_per_pixel
+    if height > 0 and len(buffer) < required_size:
+        raise ValueError(
+            "Buffer is too small to hold the image ({} < {} bytes).".format(
+                len(buffer), required_size
+            )
+        )
+
+
+if __name__ == "__main__":
+    import sys
+
+    # The command line tool lives in its own module, so that it does not need to be copied onto
+    # microcontrollers along with the reader
+    import bmp_file_reader_cli
+
+    sys.exit(bmp_file_reader_cli.main())
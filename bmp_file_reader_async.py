@@ -0,0 +1,264 @@
+# MIT License
+#
+# Copyright (c) 2021 Christopher Wells
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from bmp_file_reader import DEFAULT_CHUNK_SIZE, BMPFileReader
+
+
+class AsyncBMPFileReader:
+    """
+    An object for reading a BMP image file from asyncio code without blocking the event loop.
+
+    Wraps a BMPFileReader, running its reads and decoding on an executor. Reads are run one at a
+    time, since they share the same file handle, and concurrent requests for the same data (ex. the
+    same row) are coalesced into a single read.
+
+    Requires CPython.
+    """
+
+    def __init__(self, reader, executor=None):
+        """
+        Creates an AsyncBMPFileReader that wraps the given reader.
+
+        :param reader: The reader to read the image with.
+        :type reader: BMPFileReader
+        :param executor: The executor to run reads on. Defaults to the event loop's default
+            executor.
+        :type executor: concurrent.futures.Executor
+        """
+        self.reader = reader
+        self.executor = executor
+        self.__lock = None
+        self.__pending = {}
+
+    @staticmethod
+    def from_path(
+        path,
+        mmap=False,
+        color_cache=None,
+        row_cache=None,
+        stats=None,
+        strict=False,
+        max_pixels=None,
+        executor=None,
+    ):
+        """
+        Creates an AsyncBMPFileReader that reads the BMP image file at the given path. See
+        BMPFileReader.from_path.
+
+        :param path: The path of the BMP image file to read.
+        :type path: str
+        :param mmap: Whether to memory-map the file.
+        :type mmap: bool
+        :param color_cache: An optional cache used to share Color objects between pixels with the
+            same color.
+        :type color_cache: ColorCache
+        :param row_cache: An optional cache used to keep recently read rows and regions of the image
+            in memory.
+        :type row_cache: RowCache
+        :param stats: An optional object to record the reader's I/O and decoding counts and timings
+            in.
+        :type stats: ReaderStats
+        :param strict: Whether to validate the headers of the file before reading any pixel data.
+        :type strict: bool
+        :param max_pixels: The maximum number of pixels allowed in strict mode.
+        :type max_pixels: int
+        :param executor: The executor to run reads on. Defaults to the event loop's default
+            executor.
+        :type executor: concurrent.futures.Executor
+        :return: A reader for the given file.
+        :rtype: AsyncBMPFileReader
+        """
+        return AsyncBMPFileReader(
+            BMPFileReader.from_path(
+                path,
+                mmap=mmap,
+                color_cache=color_cache,
+                row_cache=row_cache,
+                stats=stats,
+                strict=strict,
+                max_pixels=max_pixels,
+            ),
+            executor=executor,
+        )
+
+    def close(self):
+        """
+        Closes the underlying reader.
+        """
+        self.reader.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    async def read_bmp_file_header(self):
+        """
+        Returns the BMP file header of the image. See BMPFileReader.read_bmp_file_header.
+
+        :return: BMP file header of the image.
+        :rtype: BMPHeader
+        """
+        return await self._run(("bmp_header",), self.reader.read_bmp_file_header)
+
+    async def read_dib_header(self):
+        """
+        Returns the DIB header of the BMP file. See BMPFileReader.read_dib_header.
+
+        :return: DIB header of the image.
+        :rtype: DIBHeader
+        """
+        return await self._run(("dib_header",), self.reader.read_dib_header)
+
+    async def get_width(self):
+        """
+        Returns the width of the image (in pixels).
+
+        :return: Width of the image in pixels.
+        :rtype: int
+        """
+        return (await self.read_dib_header()).width
+
+    async def get_height(self):
+        """
+        Returns the height of the image (in pixels).
+
+        :return: Height of the image in pixels.
+        :rtype: int
+        """
+        return abs((await self.read_dib_header()).height)
+
+    async def get_row(self, row):
+        """
+        Reads in the pixels of the specified row (zero-indexed). See BMPFileReader.get_row.
+
+        :param row: The index of the row to read.
+        :type row: int
+        :return: The colors of the pixels in the specified row.
+        :rtype: List[Color]
+        """
+        return await self._run(("row", row), self.reader.get_row, row)
+
+    async def get_row_raw(self, row):
+        """
+        Reads in the raw pixel bytes of the specified row (zero-indexed). See
+        BMPFileReader.get_row_raw.
+
+        :param row: The index of the row to read.
+        :type row: int
+        :return: The blue, green, red bytes of the pixels in the specified row.
+        :rtype: bytes
+        """
+
+        def get_row_raw():
+            return bytes(self.reader.get_row_raw(row))
+
+        return await self._run(("row_raw", row), get_row_raw)
+
+    async def get_region(self, x, y, width, height):
+        """
+        Reads in the pixels of the given rectangular region of the image. See
+        BMPFileReader.get_region.
+
+        :param x: The index of the leftmost column of the region.
+        :type x: int
+        :param y: The index of the top row of the region.
+        :type y: int
+        :param width: The width of the region (in pixels).
+        :type width: int
+        :param height: The height of the region (in pixels).
+        :type height: int
+        :return: The colors of the pixels in each row of the region, starting from the top row.
+        :rtype: List[List[Color]]
+        """
+        return await self._run(
+            ("region", x, y, width, height), self.reader.get_region, x, y, width, height
+        )
+
+    async def iter_rows(self, order="top_down", chunk_size=None):
+        """
+        Iterates over the rows of the image, yielding (row_index, pixels) tuples. See
+        BMPFileReader.iter_rows.
+
+        Each chunk of rows is read and decoded in a single call on the executor.
+
+        :param order: The order to yield the rows in, either "top_down" or "file_order".
+        :type order: str
+        :param chunk_size: The maximum number of bytes to read from the file at a time. Defaults to
+            DEFAULT_CHUNK_SIZE.
+        :type chunk_size: int
+        :return: An async iterator over the index and the colors of the pixels of each row.
+        :rtype: AsyncIterator[Tuple[int, List[Color]]]
+        """
+        if chunk_size is None:
+            chunk_size = DEFAULT_CHUNK_SIZE
+
+        rows = self.reader.iter_rows(order=order, chunk_size=chunk_size)
+
+        def next_rows():
+            # Decode roughly one chunk worth of rows per call
+            row_size = max(1, self.reader.get_width() * 3)
+            num_rows = max(1, chunk_size // row_size)
+
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= num_rows:
+                    break
+
+            return batch
+
+        while True:
+            batch = await self._run_in_executor(next_rows)
+            if len(batch) == 0:
+                break
+
+            for row in batch:
+                yield row
+
+    async def _run(self, key, function, *args):
+        import asyncio
+
+        # Share the result of any identical request that is already in progress
+        task = self.__pending.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._run_in_executor(function, *args))
+            self.__pending[key] = task
+
+            def remove_pending(_):
+                if self.__pending.get(key) is task:
+                    del self.__pending[key]
+
+            task.add_done_callback(remove_pending)
+
+        return await asyncio.shield(task)
+
+    async def _run_in_executor(self, function, *args):
+        import asyncio
+
+        if self.__lock is None:
+            self.__lock = asyncio.Lock()
+
+        async with self.__lock:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, function, *args)
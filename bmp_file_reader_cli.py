@@ -0,0 +1,422 @@
+# MIT License
+#
+# Copyright (c) 2021 Christopher Wells
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from bmp_file_reader import DEFAULT_MAX_PIXELS, BMPFileReader
+from bmp_file_reader_tools import (
+    DecodeResult,
+    _get_file_size,
+    _map_files,
+    _StageTimer,
+    decode_many,
+)
+
+
+def _info_file(path):
+    timer = _StageTimer()
+    try:
+        with BMPFileReader.from_path(path) as reader:
+            value = (reader.read_bmp_file_header(), reader.read_dib_header())
+            num_bytes = _get_file_size(reader.file_handle)
+            timer.lap("read_headers")
+
+            return DecodeResult(
+                path,
+                value,
+                reader.get_width(),
+                reader.get_height(),
+                num_bytes=num_bytes,
+                timings=timer.timings,
+            )
+    except Exception as e:
+        return DecodeResult(path, error=e, timings=timer.timings)
+
+
+CONVERT_FORMATS = ("rgb565", "rgb888", "ppm", "npy")
+
+
+def _convert_file(job, format):
+    path, output_path = job
+
+    timer = _StageTimer()
+    try:
+        with BMPFileReader.from_path(path) as reader:
+            width = reader.get_width()
+            height = reader.get_height()
+            num_bytes = _get_file_size(reader.file_handle)
+            timer.lap("read_headers")
+
+            if format == "npy":
+                import numpy as np
+
+                value = reader.to_ndarray(copy=True)
+            elif format == "rgb565":
+                value = bytearray(width * height * 2)
+                reader.decode_into(value, format="RGB565_BE")
+            else:
+                value = bytearray(width * height * 3)
+                reader.decode_into(value, format="RGB888")
+            timer.lap("decode")
+
+        _make_parent_dirs(output_path)
+        if format == "npy":
+            np.save(output_path, value)
+        else:
+            with open(output_path, "wb") as output_stream:
+                if format == "ppm":
+                    output_stream.write("P6\n{} {}\n255\n".format(width, height).encode())
+
+                output_stream.write(value)
+        timer.lap("write")
+
+        return DecodeResult(
+            path, output_path, width, height, num_bytes=num_bytes, timings=timer.timings
+        )
+    except Exception as e:
+        return DecodeResult(path, error=e, timings=timer.timings)
+
+
+def _verify_file(path, max_pixels):
+    timer = _StageTimer()
+    try:
+        # Strict mode makes sure that the file is not cut off before the end of the pixel array,
+        # since reads past the end of the file are not otherwise noticed
+        with BMPFileReader.from_path(path, strict=True, max_pixels=max_pixels) as reader:
+            reader._check_supported()
+            width = reader.get_width()
+            height = reader.get_height()
+            num_bytes = _get_file_size(reader.file_handle)
+            timer.lap("read_headers")
+
+            for _ in reader.iter_rows_raw(order="file_order"):
+                pass
+            timer.lap("decode")
+
+        return DecodeResult(path, None, width, height, num_bytes=num_bytes, timings=timer.timings)
+    except Exception as e:
+        return DecodeResult(path, error=e, timings=timer.timings)
+
+
+def _positive_int(value):
+    import argparse
+
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+
+    if number <= 0:
+        raise argparse.ArgumentTypeError("must be a positive integer: {}".format(repr(value)))
+
+    return number
+
+
+def _make_parent_dirs(path):
+    import os
+
+    parent = os.path.dirname(path)
+    if parent != "":
+        os.makedirs(parent, exist_ok=True)
+
+
+def _get_output_paths(files, out_dir, extension):
+    """
+    Works out where to write the output for each of the given (path, name) pairs, keeping the name
+    of each file relative to its pattern under the output directory. Files whose output path would
+    clash with that of an earlier file get an error result instead.
+
+    Returns a dictionary from the path of each file to its output path, and the error results.
+    """
+    import os
+
+    output_paths = {}
+    used = {}
+    errors = []
+    for path, name in files:
+        output_path = os.path.join(out_dir, os.path.splitext(name)[0] + "." + extension)
+
+        key = os.path.normcase(os.path.normpath(output_path))
+        if key in used:
+            errors.append(
+                DecodeResult(
+                    path,
+                    error=ValueError(
+                        "Output file {} is already written for {}".format(output_path, used[key])
+                    ),
+                )
+            )
+            continue
+
+        used[key] = path
+        output_paths[path] = output_path
+
+    return output_paths, errors
+
+
+def _expand_paths(patterns):
+    """
+    Expands the given glob patterns and directories into the BMP files they refer to, as (path,
+    name) pairs, where name is the path of the file relative to the directory that the pattern
+    starts from (ex. "a/x.bmp" for "assets/a/x.bmp" matched by "assets/**/*.bmp"). Files matched by
+    more than one of the patterns are only included once.
+    """
+    import glob
+    import os
+
+    files = []
+    seen = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            root = pattern
+
+            # Match the extension in any case with a single listing, rather than globbing for each
+            # case, which lists every file twice on case-insensitive filesystems
+            matches = [
+                os.path.join(pattern, name)
+                for name in os.listdir(pattern)
+                if name.lower().endswith(".bmp") and not name.startswith(".")
+            ]
+        else:
+            root = os.path.dirname(pattern)
+            while glob.has_magic(root):
+                root = os.path.dirname(root)
+
+            matches = glob.glob(pattern, recursive=True)
+
+            # Report missing files as errors rather than silently skipping them
+            if len(matches) == 0 and not glob.has_magic(pattern):
+                matches = [pattern]
+
+        for path in sorted(matches):
+            key = os.path.normcase(os.path.normpath(path))
+            if key not in seen:
+                seen.add(key)
+                files.append((path, os.path.relpath(path, root or os.curdir)))
+
+    return files
+
+
+def main(argv=None):
+    """
+    Runs the bmp_file_reader command line tool.
+
+    Each subcommand works on BMP files, directories, or glob patterns, processing the files in
+    parallel. Once done, the throughput (files/s and MB/s), the time spent in each stage summed over
+    all of the files, and the slowest files are reported on stderr. Files that cannot be processed
+    are also reported on stderr, except for "info --json", which prints them as JSON objects with an
+    "error" key so that its output stays one JSON object per line.
+
+    :param argv: The command line arguments, not including the program name. Defaults to
+        sys.argv[1:].
+    :type argv: List[str]
+    :return: The exit code of the tool.
+    :rtype: int
+    """
+    import argparse
+    import itertools
+    import json
+    import sys
+    import time
+
+    parser = argparse.ArgumentParser(prog="python -m bmp_file_reader_cli")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    def add_common_arguments(subparser):
+        subparser.add_argument("paths", nargs="+", help="BMP files, directories, or glob patterns")
+        subparser.add_argument(
+            "--workers",
+            type=_positive_int,
+            default=None,
+            help="Number of worker processes (defaults to the number of CPUs)",
+        )
+
+    info_parser = subparsers.add_parser("info", help="Print the header fields of BMP files")
+    add_common_arguments(info_parser)
+    info_parser.add_argument(
+        "--json",
+        action="store_true",
+        help='Print one JSON object per file (with an "error" key for files that cannot be read)',
+    )
+
+    decode_parser = subparsers.add_parser(
+        "decode", help="Decode BMP files in parallel into raw BGR (.raw) or NumPy (.npy) files"
+    )
+    add_common_arguments(decode_parser)
+    decode_parser.add_argument("--output", choices=["ndarray", "raw"], default="raw")
+    decode_parser.add_argument(
+        "--out-dir", default=None, help="Directory to write the decoded files to (if any)"
+    )
+
+    convert_parser = subparsers.add_parser(
+        "convert",
+        help="Convert BMP files into raw RGB565 (big-endian), raw RGB888, PPM, or NumPy files",
+    )
+    add_common_arguments(convert_parser)
+    convert_parser.add_argument("--format", choices=CONVERT_FORMATS, required=True)
+    convert_parser.add_argument(
+        "--out-dir", required=True, help="Directory to write the converted files to"
+    )
+
+    verify_parser = subparsers.add_parser(
+        "verify",
+        help="Check that the headers of BMP files are valid, and that the files can be fully decoded",
+    )
+    add_common_arguments(verify_parser)
+    verify_parser.add_argument(
+        "--max-pixels",
+        type=int,
+        default=DEFAULT_MAX_PIXELS,
+        help="Report images with more pixels than this as errors",
+    )
+
+    args = parser.parse_args(argv)
+
+    files = _expand_paths(args.paths)
+    paths = [path for path, _ in files]
+
+    if args.command == "info":
+        results = _map_files(_info_file, paths, (), args.workers)
+        verb = "Read"
+    elif args.command == "decode":
+        if args.out_dir is not None:
+            output_paths, errors = _get_output_paths(
+                files, args.out_dir, "npy" if args.output == "ndarray" else "raw"
+            )
+            to_decode = [path for path in paths if path in output_paths]
+        else:
+            errors = []
+            to_decode = paths
+
+        results = itertools.chain(
+            errors,
+            decode_many(to_decode, workers=args.workers, output=args.output, ordered=False),
+        )
+        verb = "Decoded"
+    elif args.command == "convert":
+        output_paths, errors = _get_output_paths(files, args.out_dir, args.format)
+        jobs = [(path, output_paths[path]) for path in paths if path in output_paths]
+
+        results = itertools.chain(
+            errors, _map_files(_convert_file, jobs, (args.format,), args.workers, ordered=False)
+        )
+        verb = "Converted"
+    else:
+        results = _map_files(
+            _verify_file, paths, (args.max_pixels,), args.workers, ordered=False
+        )
+        verb = "Verified"
+
+    num_errors = 0
+    num_bytes = 0
+    stage_totals = {}
+    file_times = []
+
+    start = time.perf_counter()
+    for result in results:
+        for stage, seconds in result.timings.items():
+            stage_totals[stage] = stage_totals.get(stage, 0.0) + seconds
+        file_times.append((sum(result.timings.values()), result.path))
+
+        if not result.ok():
+            num_errors += 1
+
+            # Keep stdout parseable: with --json errors are reported as JSON objects too, and
+            # otherwise they go to stderr along with the summary
+            if args.command == "info" and args.json:
+                print(json.dumps({"path": result.path, "error": str(result.error)}))
+            else:
+                print("{}: error: {}".format(result.path, result.error), file=sys.stderr)
+            continue
+
+        num_bytes += result.num_bytes
+
+        if args.command == "info":
+            bmp_header, dib_header = result.value
+            if args.json:
+                print(
+                    json.dumps(
+                        {
+                            "path": result.path,
+                            "bmp_header": vars(bmp_header),
+                            "dib_header": vars(dib_header),
+                        },
+                        # The reserved fields of the BMP header are bytes
+                        default=lambda value: bytes(value).hex(),
+                    )
+                )
+            else:
+                print("{}:\n{}\n{}".format(result.path, bmp_header, dib_header))
+        elif args.command == "decode" and args.out_dir is not None:
+            output_path = output_paths[result.path]
+            _make_parent_dirs(output_path)
+
+            if args.output == "ndarray":
+                import numpy as np
+
+                np.save(output_path, result.value)
+            else:
+                with open(output_path, "wb") as output_stream:
+                    output_stream.write(result.value)
+
+    duration = time.perf_counter() - start
+
+    print(
+        "{} {} files ({} errors) in {:.2f}s ({:.1f} files/s, {:.1f} MB/s)".format(
+            verb,
+            len(paths),
+            num_errors,
+            duration,
+            len(paths) / duration if duration > 0 else 0.0,
+            num_bytes / 1000000 / duration if duration > 0 else 0.0,
+        ),
+        file=sys.stderr,
+    )
+
+    if len(stage_totals) > 0:
+        print(
+            "Time per stage (summed over files): {}".format(
+                ", ".join(
+                    "{} {:.3f}s".format(stage, seconds) for stage, seconds in stage_totals.items()
+                )
+            ),
+            file=sys.stderr,
+        )
+
+        file_times.sort(reverse=True)
+        print(
+            "Slowest files: {}".format(
+                ", ".join("{} ({:.3f}s)".format(path, seconds) for seconds, path in file_times[0:3])
+            ),
+            file=sys.stderr,
+        )
+
+    return 1 if num_errors > 0 else 0
+
+
+if __name__ == "__main__":
+    import sys
+
+    # Run the tool via the bmp_file_reader_cli module rather than __main__, so that the worker
+    # processes can find the functions they run
+    import bmp_file_reader_cli
+
+    sys.exit(bmp_file_reader_cli.main())
@@ -0,0 +1,276 @@
+# MIT License
+#
+# Copyright (c) 2021 Christopher Wells
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from bmp_file_reader import BMPFileReader, _get_mtime, _Stopwatch, read_metadata
+
+
+def scan_metadata(paths, index_path=None):
+    """
+    Reads the metadata of each of the given BMP files, as given by read_metadata.
+
+    If an index path is given, then the metadata is cached in a JSON file at that path, keyed by
+    the path, modification time, and size of each file. Files that have not changed since the last
+    scan are then not opened again.
+
+    The returned metadata also includes the "path", "size", and "mtime" (in nanoseconds) of each
+    file. Files that cannot be read are included with an "error" key describing the problem
+    instead, and are not cached.
+
+    :param paths: The paths of the BMP files to scan.
+    :type paths: Iterable[str]
+    :param index_path: The path of the JSON file to cache the metadata in (if any).
+    :type index_path: str
+    :return: The metadata of each file, in the same order as the given paths.
+    :rtype: List[Dict[str, Any]]
+    """
+    import json
+    import os
+
+    index = {}
+    if index_path is not None:
+        try:
+            with open(index_path, "r") as input_stream:
+                index = json.load(input_stream)
+        except (OSError, ValueError):
+            index = {}
+
+    index_changed = False
+    results = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError as e:
+            results.append({"path": path, "error": str(e)})
+            continue
+
+        size = stat[6]
+        mtime = _get_mtime(stat)
+
+        cached = index.get(path)
+        if cached is not None and cached["size"] == size and cached["mtime"] == mtime:
+            results.append(cached)
+            continue
+
+        try:
+            with open(path, "rb") as file_handle:
+                metadata = read_metadata(file_handle)
+        except Exception as e:
+            results.append({"path": path, "size": size, "mtime": mtime, "error": str(e)})
+            continue
+
+        metadata["path"] = path
+        metadata["size"] = size
+        metadata["mtime"] = mtime
+
+        index[path] = metadata
+        index_changed = True
+        results.append(metadata)
+
+    if index_path is not None and index_changed:
+        with open(index_path, "w") as output_stream:
+            json.dump(index, output_stream)
+
+    return results
+
+
+class DecodeResult:
+    """
+    The result of decoding one of the files given to decode_many.
+
+    If the file could not be decoded, then value is None and error is the exception that was
+    raised while decoding it.
+    """
+
+    def __init__(
+        self, path, value=None, width=None, height=None, error=None, num_bytes=0, timings=None
+    ):
+        self.path = path
+        self.value = value
+        self.width = width
+        self.height = height
+        self.error = error
+
+        # The size of the file (in bytes), and the time spent in each stage of processing it (in
+        # seconds)
+        self.num_bytes = num_bytes
+        self.timings = {} if timings is None else timings
+
+    def __repr__(self):
+        return "DecodeResult(path={}, width={}, height={}, error={})".format(
+            repr(self.path), self.width, self.height, repr(self.error)
+        )
+
+    def ok(self):
+        """
+        Returns whether the file was decoded successfully.
+
+        :return: True if the file was decoded, False if there was an error.
+        :rtype: bool
+        """
+        return self.error is None
+
+
+def decode_many(paths, workers=None, output="ndarray", ordered=True, max_in_flight=None):
+    """
+    Decodes many BMP files in parallel using a pool of processes, yielding a DecodeResult for each
+    one.
+
+    With output="ndarray" each file is decoded into a NumPy array of shape (height, width, 3) in RGB
+    order (see BMPFileReader.to_ndarray), and with output="raw" each file is decoded into the bytes
+    of its pixels as blue, green, red triples, starting from the top row with no row padding.
+
+    Only a limited number of files are decoded at a time, so that the decoded images do not pile up
+    in memory if they are consumed more slowly than they are decoded. Errors are captured per file
+    rather than stopping the whole batch.
+
+    Requires CPython (and NumPy for output="ndarray").
+
+    :param paths: The paths of the BMP files to decode.
+    :type paths: Iterable[str]
+    :param workers: The number of worker processes to use. Defaults to the number of CPUs.
+    :type workers: int
+    :param output: The format to decode the images into, either "ndarray" or "raw".
+    :type output: str
+    :param ordered: Whether to yield the results in the same order as the given paths, or in the
+        order that the files finish being decoded.
+    :type ordered: bool
+    :param max_in_flight: The maximum number of files to be decoding or waiting to be yielded at a
+        time. Defaults to twice the number of workers.
+    :type max_in_flight: int
+    :return: An iterator over the results of decoding each of the files.
+    :rtype: Iterator[DecodeResult]
+    """
+    if output not in ("ndarray", "raw"):
+        raise ValueError('Invalid output format: "{}"'.format(output))
+
+    return _map_files(_decode_file, paths, (output,), workers, ordered, max_in_flight)
+
+
+def _map_files(function, paths, args, workers=None, ordered=True, max_in_flight=None):
+    """
+    Calls the given function on each of the given paths (followed by the given extra arguments)
+    using a pool of processes, returning an iterator over the result of each call. With a single
+    worker the calls are made in this process instead.
+
+    The arguments are checked straight away, rather than once the iterator is first used.
+    """
+    import os
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    elif workers <= 0:
+        raise ValueError("The number of workers must be positive: {}".format(workers))
+
+    if max_in_flight is None:
+        max_in_flight = workers * 2
+    elif max_in_flight <= 0:
+        raise ValueError("max_in_flight must be positive: {}".format(max_in_flight))
+
+    if workers == 1:
+        return (function(path, *args) for path in paths)
+
+    return _map_files_in_pool(function, paths, args, workers, ordered, max_in_flight)
+
+
+def _map_files_in_pool(function, paths, args, workers, ordered, max_in_flight):
+    import concurrent.futures
+
+    paths = iter(paths)
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight = []
+
+        def submit_next():
+            for path in paths:
+                in_flight.append(executor.submit(function, path, *args))
+                return True
+
+            return False
+
+        while len(in_flight) < max_in_flight and submit_next():
+            pass
+
+        while len(in_flight) > 0:
+            if ordered:
+                future = in_flight.pop(0)
+            else:
+                done, _ = concurrent.futures.wait(
+                    in_flight, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                future = next(iter(done))
+                in_flight.remove(future)
+
+            result = future.result()
+
+            submit_next()
+
+            yield result
+
+
+class _StageTimer:
+    """
+    Adds up the time spent in each stage of processing a file.
+    """
+
+    def __init__(self):
+        self.__stopwatch = _Stopwatch()
+        self.__last = self.__stopwatch.now()
+        self.timings = {}
+
+    def lap(self, stage):
+        """
+        Records the time since the last lap as time spent in the given stage.
+        """
+        elapsed = self.__stopwatch.elapsed_ns(self.__last) / 1000000000
+        self.__last = self.__stopwatch.now()
+        self.timings[stage] = self.timings.get(stage, 0.0) + elapsed
+
+
+def _decode_file(path, output):
+    timer = _StageTimer()
+    try:
+        with BMPFileReader.from_path(path) as reader:
+            width = reader.get_width()
+            height = reader.get_height()
+            num_bytes = _get_file_size(reader.file_handle)
+            timer.lap("read_headers")
+
+            if output == "ndarray":
+                value = reader.to_ndarray(copy=True)
+            else:
+                value = bytearray(width * height * 3)
+                value_view = memoryview(value)
+
+                row_size = width * 3
+                for row, row_bytes in reader.iter_rows_raw(order="file_order"):
+                    value_view[row * row_size : (row + 1) * row_size] = row_bytes
+            timer.lap("decode")
+
+        return DecodeResult(path, value, width, height, num_bytes=num_bytes, timings=timer.timings)
+    except Exception as e:
+        return DecodeResult(path, error=e, timings=timer.timings)
+
+
+def _get_file_size(file_handle):
+    import os
+
+    return os.fstat(file_handle.fileno()).st_size
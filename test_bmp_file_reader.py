@@ -1,6 +1,86 @@
+import asyncio
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
 import unittest
 
 import bmp_file_reader as bmpr
+import bmp_file_reader_async
+import bmp_file_reader_cli
+import bmp_file_reader_tools
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def build_bmp(
+    width,
+    height,
+    bits_per_pixel,
+    rows,
+    compression_type=bmpr.CompressionType.BI_RGB,
+    extra_header_bytes=b"",
+):
+    """
+    Builds an in-memory BMP file with a BITMAPINFOHEADER, using the given rows of pixel bytes in
+    the order that they are stored in the file. Rows are padded out to 4 byte alignment.
+    """
+    padded_rows = []
+    for row in rows:
+        padded_rows.append(row + bytes((4 - len(row) % 4) % 4))
+    pixel_array = b"".join(padded_rows)
+
+    image_start_offset = 14 + 40 + len(extra_header_bytes)
+
+    bmp_header = (
+        b"BM"
+        + (image_start_offset + len(pixel_array)).to_bytes(4, "little")
+        + bytes(4)
+        + image_start_offset.to_bytes(4, "little")
+    )
+    dib_header = b"".join(
+        [
+            (40).to_bytes(4, "little"),
+            width.to_bytes(4, "little", signed=True),
+            height.to_bytes(4, "little", signed=True),
+            (1).to_bytes(2, "little"),
+            bits_per_pixel.to_bytes(2, "little"),
+            compression_type.to_bytes(4, "little"),
+            len(pixel_array).to_bytes(4, "little"),
+            (2835).to_bytes(4, "little"),
+            (2835).to_bytes(4, "little"),
+            bytes(8),
+        ]
+    )
+
+    return io.BytesIO(bmp_header + dib_header + extra_header_bytes + pixel_array)
+
+
+class TrickleStream:
+    """
+    A stream that cannot seek, and that returns at most a few bytes per read, like a slow socket or
+    pipe.
+    """
+
+    def __init__(self, data, max_read_size=7):
+        self.data = data
+        self.position = 0
+        self.max_read_size = max_read_size
+
+    def read(self, size=-1):
+        if size < 0:
+            size = len(self.data)
+
+        size = min(size, self.max_read_size)
+        chunk = self.data[self.position : self.position + size]
+        self.position += len(chunk)
+
+        return chunk
 
 
 class BMPFileReaderTest(unittest.TestCase):
@@ -151,59 +231,2045 @@ class BMPFileReaderTest(unittest.TestCase):
 
         self.assertEqual(expected, actual)
 
+    def test_get_row_raw(self):
+        image_path = "images/single_green_pixel.bmp"
+
+        with open(image_path, "rb") as file_handle:
+            reader = bmpr.BMPFileReader(file_handle)
+
+            actual = bytes(reader.get_row_raw(0))
+
+        expected = b"\x00\xff\x00"
+
+        self.assertEqual(expected, actual)
+
+    def test_get_row_raw_into_buffer(self):
+        image_path = "images/small_image_with_colors.bmp"
+
+        with open(image_path, "rb") as file_handle:
+            reader = bmpr.BMPFileReader(file_handle)
+
+            buffer = bytearray(100)
+            actual = reader.get_row_raw(0, out=buffer)
+
+            self.assertEqual(30 * 3, len(actual))
+            self.assertEqual(b"\x71\x91\x14", bytes(buffer[24 * 3 : 25 * 3]))
+
+            with self.assertRaises(ValueError):
+                reader.get_row_raw(0, out=bytearray(10))
+
+    def test_read_all_rows(self):
+        image_path = "images/small_image_with_colors.bmp"
+
+        with open(image_path, "rb") as file_handle:
+            reader = bmpr.BMPFileReader(file_handle)
+
+            expected = [reader.get_row(i) for i in range(0, reader.get_height())]
+
+            actual = reader.read_all_rows()
+            actual_small_chunks = reader.read_all_rows(chunk_size=200)
+
+        self.assertEqual(expected, actual)
+        self.assertEqual(expected, actual_small_chunks)
+
+    def test_iter_rows(self):
+        image_path = "images/small_image_with_colors.bmp"
+
+        with open(image_path, "rb") as file_handle:
+            reader = bmpr.BMPFileReader(file_handle)
+
+            expected = [(i, reader.get_row(i)) for i in range(0, reader.get_height())]
+
+            actual_top_down = list(reader.iter_rows(chunk_size=300))
+            actual_file_order = list(reader.iter_rows(order="file_order", chunk_size=300))
+
+        self.assertEqual(expected, actual_top_down)
+        self.assertEqual(list(reversed(expected)), actual_file_order)
+
+    def test_iter_rows_raw(self):
+        for image_path in ["images/small_image_with_colors.bmp", "images/16_bit_colors.bmp"]:
+            with open(image_path, "rb") as file_handle:
+                reader = bmpr.BMPFileReader(file_handle)
+
+                height = reader.get_height()
+                expected = [(i, bytes(reader.get_row_raw(i))) for i in range(0, height)]
+
+                actual_top_down = [
+                    (i, bytes(row)) for i, row in reader.iter_rows_raw(chunk_size=300)
+                ]
+                actual_file_order = [
+                    (i, bytes(row))
+                    for i, row in reader.iter_rows_raw(order="file_order", chunk_size=300)
+                ]
+
+            self.assertEqual(expected, actual_top_down)
+            self.assertEqual(list(reversed(expected)), actual_file_order)
+
+    def test_top_down(self):
+        # Each pixel's color is (column, row, 0) in the top-down image
+        width = 5
+        height = 7
+        top_down_rows = [
+            b"".join(bytes([0, y, x]) for x in range(0, width)) for y in range(0, height)
+        ]
+
+        bottom_up = bmpr.BMPFileReader(
+            build_bmp(width, height, 24, list(reversed(top_down_rows)))
+        )
+        top_down = bmpr.BMPFileReader(build_bmp(width, -height, 24, top_down_rows))
+
+        self.assertFalse(bottom_up.is_top_down())
+        self.assertTrue(top_down.is_top_down())
+        self.assertEqual(height, top_down.get_height())
+        self.assertEqual(-height, top_down.read_dib_header().height)
+
+        expected = bottom_up.read_all_rows()
+
+        self.assertEqual(bmpr.Color(4, 0, 0), top_down.get_row(0)[4])
+        self.assertEqual(bmpr.Color(0, 6, 0), top_down.get_row(6)[0])
+        self.assertEqual(expected, [top_down.get_row(i) for i in range(0, height)])
+        self.assertEqual(expected, top_down.read_all_rows())
+        self.assertEqual(
+            [bytes(bottom_up.get_row_raw(i)) for i in range(0, height)],
+            [bytes(top_down.get_row_raw(i)) for i in range(0, height)],
+        )
+        self.assertEqual(bottom_up.get_region(1, 2, 3, 4), top_down.get_region(1, 2, 3, 4))
+        self.assertEqual(bottom_up.read_thumbnail(2, 3), top_down.read_thumbnail(2, 3))
+        self.assertEqual(
+            bottom_up.read_thumbnail(2, 3, method="box"),
+            top_down.read_thumbnail(2, 3, method="box"),
+        )
+
+        for chunk_size in [None, 20]:
+            self.assertEqual(
+                list(enumerate(expected)), list(top_down.iter_rows(chunk_size=chunk_size))
+            )
+
+            # Top-down files are read forwards for both orders
+            self.assertEqual(
+                list(enumerate(expected)),
+                list(top_down.iter_rows(order="file_order", chunk_size=chunk_size)),
+            )
+            self.assertEqual(
+                list(reversed(list(enumerate(expected)))),
+                list(bottom_up.iter_rows(order="file_order", chunk_size=chunk_size)),
+            )
+
+        framebuffer = bytearray(width * height * 3)
+        top_down.decode_into(framebuffer, format="RGB888")
+        self.assertEqual(bytes([4, 6, 0]), framebuffer[-3:])
+
+    @unittest.skipIf(np is None, "requires NumPy")
+    def test_top_down_to_ndarray(self):
+        rows = [bytes([0, y, 0, 0, y, 1]) for y in range(0, 3)]
+        top_down = bmpr.BMPFileReader(build_bmp(2, -3, 24, rows))
+
+        actual = top_down.to_ndarray()
+
+        self.assertEqual((3, 2, 3), actual.shape)
+        self.assertEqual([0, 0, 0], list(actual[0, 0]))
+        self.assertEqual([1, 2, 0], list(actual[2, 1]))
+
+    def test_iter_rows_invalid_order(self):
+        image_path = "images/small_image_with_colors.bmp"
+
+        with open(image_path, "rb") as file_handle:
+            reader = bmpr.BMPFileReader(file_handle)
+
+            with self.assertRaises(ValueError):
+                list(reader.iter_rows(order="sideways"))
+
     def test_get_row_16bit_colors(self):
         image_path = "images/16_bit_colors.bmp"
 
         with open(image_path, "rb") as file_handle:
             reader = bmpr.BMPFileReader(file_handle)
 
-            with self.assertRaises(ValueError) as context:
-                reader.get_row(0)
+            actual = reader.get_row(6)
 
-            expected_msg = "This parser does not currently support BMP files with 16 bits per pixel. Currently only 24-bit color values are supported."
-            self.assertEquals(expected_msg, str(context.exception))
+        self.assertEqual(25, len(actual))
+        self.assertEqual(bmpr.Color(red=255, green=255, blue=255), actual[0])
+        self.assertEqual(bmpr.Color(red=41, green=40, blue=41), actual[6])
+        self.assertEqual(bmpr.Color(red=0, green=0, blue=0), actual[7])
 
-    def test_get_row_16bit_colors(self):
+    def test_get_row_32bit_colors(self):
         image_path = "images/32_bit_colors.bmp"
 
         with open(image_path, "rb") as file_handle:
             reader = bmpr.BMPFileReader(file_handle)
 
-            with self.assertRaises(ValueError) as context:
-                reader.get_row(0)
+            actual = reader.get_row(6)
+            actual_raw = bytes(reader.get_row_raw(6))
 
-            expected_msg = "This parser does not currently support BMP files with 32 bits per pixel. Currently only 24-bit color values are supported."
-            self.assertEquals(expected_msg, str(context.exception))
+        self.assertEqual(25, len(actual))
+        self.assertEqual(bmpr.Color(red=255, green=255, blue=255), actual[0])
+        self.assertEqual(bmpr.Color(red=96, green=96, blue=96), actual[5])
+        self.assertEqual(bmpr.Color(red=42, green=42, blue=42), actual[6])
+        self.assertEqual(b"\x60\x60\x60\x2a\x2a\x2a", actual_raw[5 * 3 : 7 * 3])
 
+    def test_get_row_16bit_555_colors(self):
+        # X1R5G5B5 pixels: red, green, blue, white
+        pixel_bytes = b"\x00\x7c\xe0\x03\x1f\x00\xff\x7f"
+        image = build_bmp(4, 1, 16, [pixel_bytes])
 
-class DIBHeaderTest(unittest.TestCase):
-    def test_repr_simple(self):
-        header = bmpr.DIBHeader(
-            width=1,
-            height=1,
-            num_color_planes=1,
-            bits_per_pixel=24,
-            compression_type=bmpr.CompressionType.BI_RGB,
-            raw_bitmap_size=4,
-            horizontal_resolution_ppm=11811,
-            vertical_resolution_ppm=11811,
-            num_colors_in_palette=0,
-            num_important_colors_used=0,
+        reader = bmpr.BMPFileReader(image)
+
+        actual = reader.get_row(0)
+
+        expected = [
+            bmpr.Color(red=255, green=0, blue=0),
+            bmpr.Color(red=0, green=255, blue=0),
+            bmpr.Color(red=0, green=0, blue=255),
+            bmpr.Color(red=255, green=255, blue=255),
+        ]
+
+        self.assertEqual(expected, actual)
+
+    def test_get_row_bitfields_after_info_header(self):
+        # 32-bit R8G8B8X8 pixels, with the masks following a 40 byte BITMAPINFOHEADER
+        masks = b"\x00\x00\x00\xff\x00\x00\xff\x00\x00\xff\x00\x00"
+        image = build_bmp(
+            2,
+            1,
+            32,
+            [b"\x00\x03\x02\x01\x00\x06\x05\x04"],
+            compression_type=bmpr.CompressionType.BI_BITFIELDS,
+            extra_header_bytes=masks,
         )
 
-        actual = repr(header)
+        reader = bmpr.BMPFileReader(image)
 
-        expected = """DIBHeader(
-    width=1,
-    height=1,
-    num_color_planes=1,
-    bits_per_pixel=24,
-    compression_type=BI_RGB,
-    raw_bitmap_size=4,
-    horizontal_resolution_ppm=11811,
-    vertical_resolution_ppm=11811,
-    num_colors_in_palette=0,
-    num_important_colors_used=0,
-)"""
+        actual = reader.get_row(0)
+
+        expected = [
+            bmpr.Color(red=1, green=2, blue=3),
+            bmpr.Color(red=4, green=5, blue=6),
+        ]
+
+        self.assertEqual(0xFF000000, reader.read_dib_header().red_mask)
+        self.assertEqual(expected, actual)
+
+    def test_get_row_1bit_colors(self):
+        palette = b"\x00\x00\x00\x00\x10\x20\x30\x00"
+        image = build_bmp(
+            10,
+            2,
+            1,
+            [b"\xa5\x40", b"\x0f\xc0"],
+            extra_header_bytes=palette,
+        )
+
+        reader = bmpr.BMPFileReader(image)
+
+        actual = reader.read_all_rows()
+
+        black = bmpr.Color(red=0, green=0, blue=0)
+        other = bmpr.Color(red=0x30, green=0x20, blue=0x10)
+        expected = [
+            [black, black, black, black, other, other, other, other, other, other],
+            [other, black, other, black, black, other, black, other, black, other],
+        ]
+
+        self.assertEqual(expected, actual)
+        self.assertEqual(expected[1][3:9], reader.get_region(3, 1, 6, 1)[0])
+        self.assertEqual(b"\x10\x20\x30\x00\x00\x00", bytes(reader.get_row_raw(1))[0:6])
+
+    def test_get_row_4bit_colors(self):
+        palette = b"".join(bytes([i, i * 2, i * 3, 0]) for i in range(0, 16))
+        image = build_bmp(3, 1, 4, [b"\x1f\x50"], extra_header_bytes=palette)
+
+        reader = bmpr.BMPFileReader(image)
+
+        actual = reader.get_row(0)
+
+        expected = [
+            bmpr.Color(red=3, green=2, blue=1),
+            bmpr.Color(red=45, green=30, blue=15),
+            bmpr.Color(red=15, green=10, blue=5),
+        ]
+
+        self.assertEqual(expected, actual)
+        self.assertEqual(expected[1:], reader.get_region(1, 0, 2, 1)[0])
+
+    def test_get_row_8bit_colors(self):
+        # Only 2 colors are given in the palette, so other indices are treated as black
+        palette = b"\xff\x00\x00\x00\x00\xff\x00\x00"
+        image = build_bmp(3, 1, 8, [b"\x01\x00\x07"], extra_header_bytes=palette)
+        image.seek(46)
+        image.write((2).to_bytes(4, "little"))
+
+        reader = bmpr.BMPFileReader(image)
+
+        actual = reader.get_row(0)
+
+        expected = [
+            bmpr.Color(red=0, green=255, blue=0),
+            bmpr.Color(red=0, green=0, blue=255),
+            bmpr.Color(red=0, green=0, blue=0),
+        ]
+
+        self.assertEqual(expected, actual)
+
+    def test_get_row_rle8(self):
+        palette = b"".join(bytes([i, i, i, 0]) for i in range(0, 256))
+        encoded = b"".join(
+            [
+                # Row 0: a run of 3 pixels, and then 2 pixels in absolute mode (padded)
+                b"\x03\x05",
+                b"\x00\x03\x07\x08\x09\x00",
+                b"\x00\x00",
+                # Row 1: a delta 1 right and 2 up, leaving the rest of row 1 and all of row 2 empty
+                b"\x01\x04",
+                b"\x00\x02\x01\x02",
+                # Row 3: picks up after the delta at column 2
+                b"\x02\x06",
+                b"\x00\x01",
+            ]
+        )
+        image = build_bmp(
+            6,
+            4,
+            8,
+            [encoded],
+            compression_type=bmpr.CompressionType.BI_RLE8,
+            extra_header_bytes=palette,
+        )
+
+        reader = bmpr.BMPFileReader(image)
+
+        actual = [[c.red for c in row] for row in reader.read_all_rows()]
+
+        expected = [
+            [0, 0, 6, 6, 0, 0],
+            [0, 0, 0, 0, 0, 0],
+            [4, 0, 0, 0, 0, 0],
+            [5, 5, 5, 7, 8, 9],
+        ]
+
+        self.assertEqual(expected, actual)
+        self.assertEqual([[6, 6, 0]], [[c.red for c in row] for row in reader.get_region(2, 0, 3, 1)])
+
+    def test_get_row_rle8_random_access(self):
+        palette = b"".join(bytes([i, i, i, 0]) for i in range(0, 256))
+        encoded = b"".join(bytes([2, row, 0, 0]) for row in range(0, 10)) + b"\x00\x01"
+        image = build_bmp(
+            2,
+            10,
+            8,
+            [encoded],
+            compression_type=bmpr.CompressionType.BI_RLE8,
+            extra_header_bytes=palette,
+        )
+
+        reader = bmpr.BMPFileReader(image)
+
+        # The top row is the last row in the file, so reading it indexes all of the rows
+        self.assertEqual([9, 9], [c.red for c in reader.get_row(0)])
+        self.assertEqual([4, 4], [c.red for c in reader.get_row(5)])
+        self.assertEqual([0, 0], [c.red for c in reader.get_row(9)])
+
+        # Rows can then be read directly from the index, even if the earlier data is gone
+        image.seek(14 + 40 + 1024)
+        image.write(b"\xff" * 4 * 4)
+
+        self.assertEqual([4, 4], [c.red for c in reader.get_row(5)])
+
+    def test_get_row_rle4(self):
+        palette = b"".join(bytes([i, i, i, 0]) for i in range(0, 16))
+        encoded = b"".join(
+            [
+                # Row 0: 5 pixels alternating between 1 and 2, then 3 pixels in absolute mode
+                b"\x05\x12",
+                b"\x00\x03\xab\xc0",
+                b"\x00\x00",
+                # End of bitmap, leaving row 1 empty
+                b"\x00\x01",
+            ]
+        )
+        image = build_bmp(
+            8,
+            2,
+            4,
+            [encoded],
+            compression_type=bmpr.CompressionType.BI_RLE4,
+            extra_header_bytes=palette,
+        )
+
+        reader = bmpr.BMPFileReader(image)
+
+        actual = [[c.red for c in row] for row in reader.read_all_rows()]
+
+        expected = [
+            [0, 0, 0, 0, 0, 0, 0, 0],
+            [1, 2, 1, 2, 1, 10, 11, 12],
+        ]
+
+        self.assertEqual(expected, actual)
+
+    def test_get_row_unsupported_bits_per_pixel(self):
+        image = build_bmp(1, 1, 64, [bytes(8)])
+
+        reader = bmpr.BMPFileReader(image)
+
+        with self.assertRaises(ValueError) as context:
+            reader.get_row(0)
+
+        expected_msg = "This parser does not currently support BMP files with 64 bits per pixel. Currently only 1, 4, 8, 16, 24, and 32-bit color values are supported."
+        self.assertEqual(expected_msg, str(context.exception))
+    def test_get_row_color_cache(self):
+        image_path = "images/small_image_with_colors.bmp"
+
+        with open(image_path, "rb") as file_handle:
+            expected = bmpr.BMPFileReader(file_handle).read_all_rows()
+
+            color_cache = bmpr.ColorCache()
+            reader = bmpr.BMPFileReader(file_handle, color_cache=color_cache)
+
+            actual = reader.read_all_rows()
+
+        self.assertEqual(expected, actual)
+        self.assertIs(actual[0][0], actual[19][0])
+        self.assertEqual(len({c for row in expected for c in row}), len(color_cache))
+
+    @unittest.skipIf(np is None, "requires NumPy")
+    def test_to_ndarray(self):
+        image_path = "images/small_image_with_colors.bmp"
+
+        with open(image_path, "rb") as file_handle:
+            reader = bmpr.BMPFileReader(file_handle)
+
+            rows = reader.read_all_rows()
+
+            actual_rgb = reader.to_ndarray()
+            actual_bgr = reader.to_ndarray(channel_order="BGR", copy=True)
+
+        expected_rgb = np.array(
+            [[[c.red, c.green, c.blue] for c in row] for row in rows], dtype=np.uint8
+        )
+
+        self.assertEqual((20, 30, 3), actual_rgb.shape)
+        self.assertEqual(np.uint8, actual_rgb.dtype)
+        np.testing.assert_array_equal(expected_rgb, actual_rgb)
+        np.testing.assert_array_equal(expected_rgb[:, :, ::-1], actual_bgr)
+        self.assertTrue(actual_bgr.flags["C_CONTIGUOUS"])
+
+    def test_from_path(self):
+        image_path = "images/small_image_with_colors.bmp"
+
+        with open(image_path, "rb") as file_handle:
+            expected = bmpr.BMPFileReader(file_handle).read_all_rows()
+
+        for mmap in [False, True]:
+            with bmpr.BMPFileReader.from_path(image_path, mmap=mmap) as reader:
+                actual = reader.read_all_rows()
+                actual_rows = [reader.get_row(i) for i in range(0, reader.get_height())]
+                actual_raw = bytes(reader.get_row_raw(0))
+
+            self.assertEqual(expected, actual)
+            self.assertEqual(expected, actual_rows)
+            self.assertEqual(b"\x71\x91\x14", actual_raw[24 * 3 : 25 * 3])
+            self.assertTrue(reader.file_handle.closed)
+
+    def test_from_path_mmap_raw_rows_are_views(self):
+        image_path = "images/small_image_with_colors.bmp"
+
+        reader = bmpr.BMPFileReader.from_path(image_path, mmap=True)
+
+        row = reader.get_row_raw(3)
+        self.assertIsInstance(row, memoryview)
+        self.assertTrue(row.readonly)
+
+        buffer = bytearray(30 * 3)
+        reader.get_row_raw(3, out=buffer)
+        self.assertEqual(bytes(row), bytes(buffer))
+
+        # Closing while a view is still held should not fail
+        reader.close()
+        self.assertTrue(reader.file_handle.closed)
+
+    @unittest.skipIf(np is None, "requires NumPy")
+    def test_to_ndarray_32bit_colors(self):
+        image_path = "images/32_bit_colors.bmp"
+
+        with open(image_path, "rb") as file_handle:
+            reader = bmpr.BMPFileReader(file_handle)
+
+            rows = reader.read_all_rows()
+
+            actual = reader.to_ndarray()
+
+        expected = np.array(
+            [[[c.red, c.green, c.blue] for c in row] for row in rows], dtype=np.uint8
+        )
+
+        np.testing.assert_array_equal(expected, actual)
+
+    @unittest.skipIf(np is None, "requires NumPy")
+    def test_to_ndarray_16bit_colors(self):
+        image_path = "images/16_bit_colors.bmp"
+
+        with open(image_path, "rb") as file_handle:
+            reader = bmpr.BMPFileReader(file_handle)
+
+            rows = reader.read_all_rows()
+
+            actual = reader.to_ndarray(channel_order="BGR")
+
+        expected = np.array(
+            [[[c.blue, c.green, c.red] for c in row] for row in rows], dtype=np.uint8
+        )
+
+        np.testing.assert_array_equal(expected, actual)
+
+    @unittest.skipIf(np is None, "requires NumPy")
+    def test_to_ndarray_mmap(self):
+        image_path = "images/small_image_with_colors.bmp"
+
+        with open(image_path, "rb") as file_handle:
+            expected = bmpr.BMPFileReader(file_handle).to_ndarray(copy=True)
+
+        with bmpr.BMPFileReader.from_path(image_path, mmap=True) as reader:
+            actual = reader.to_ndarray(copy=True)
+
+        np.testing.assert_array_equal(expected, actual)
+
+    def test_get_region(self):
+        image_path = "images/small_image_with_colors.bmp"
+
+        with open(image_path, "rb") as file_handle:
+            reader = bmpr.BMPFileReader(file_handle)
+
+            rows = reader.read_all_rows()
+
+            actual = reader.get_region(20, 3, 7, 5)
+
+            with self.assertRaises(ValueError):
+                reader.get_region(25, 0, 6, 1)
+
+        expected = [row[20:27] for row in rows[3:8]]
+
+        self.assertEqual(expected, actual)
+        self.assertNotEqual(bmpr.Color(red=255, green=255, blue=255), actual[0][1])
+
+    def test_iter_tiles(self):
+        image_path = "images/small_image_with_colors.bmp"
+
+        with open(image_path, "rb") as file_handle:
+            reader = bmpr.BMPFileReader(file_handle)
+
+            rows = reader.read_all_rows()
+
+            actual = list(reader.iter_tiles(16, 8))
+
+        expected = [
+            (x, y, [row[x : x + 16] for row in rows[y : y + 8]])
+            for y in [0, 8, 16]
+            for x in [0, 16]
+        ]
+
+        self.assertEqual(expected, actual)
+        self.assertEqual((14, 4), (len(actual[-1][2][0]), len(actual[-1][2])))
+
+    def test_get_pixel(self):
+        palette = b"".join(bytes([i * 16, i * 16, i * 16, 0]) for i in range(0, 16))
+        images = [
+            open("images/small_image_with_colors.bmp", "rb"),
+            open("images/16_bit_colors.bmp", "rb"),
+            open("images/32_bit_colors.bmp", "rb"),
+            build_bmp(3, 2, 4, [b"\x1f\x50", b"\x23\x40"], extra_header_bytes=palette),
+            build_bmp(
+                10,
+                2,
+                1,
+                [b"\xa5\x80", b"\x0f\x40"],
+                extra_header_bytes=bytes([0, 0, 0, 0, 255, 255, 255, 0]),
+            ),
+        ]
+
+        for image in images:
+            with image:
+                reader = bmpr.BMPFileReader(image)
+                rows = reader.read_all_rows()
+
+                for y in range(0, reader.get_height()):
+                    for x in range(0, reader.get_width()):
+                        self.assertEqual(rows[y][x], reader.get_pixel(x, y), (x, y))
+
+        with open("images/small_image_with_colors.bmp", "rb") as file_handle:
+            reader = bmpr.BMPFileReader(file_handle)
+
+            self.assertEqual(bmpr.Color(20, 145, 113), reader.get_pixel(24, 0))
+
+            for x, y in [(-1, 0), (30, 0), (0, -1), (0, 20)]:
+                with self.assertRaises(IndexError):
+                    reader.get_pixel(x, y)
+
+    def test_get_pixel_rle8(self):
+        palette = b"".join(bytes([i, i, i, 0]) for i in range(0, 256))
+        encoded = b"".join(bytes([2, row, 0, 0]) for row in range(0, 10)) + b"\x00\x01"
+        image = build_bmp(
+            2,
+            10,
+            8,
+            [encoded],
+            compression_type=bmpr.CompressionType.BI_RLE8,
+            extra_header_bytes=palette,
+        )
+
+        reader = bmpr.BMPFileReader(image)
+
+        self.assertEqual(
+            [bmpr.Color(9, 9, 9), bmpr.Color(0, 0, 0), bmpr.Color(5, 5, 5)],
+            reader.get_pixels([(1, 0), (0, 9), (1, 4)]),
+        )
+
+    def test_get_pixels_reads_in_file_order(self):
+        width = 4000
+        height = 4
+        rows = [bytes([y]) * (width * 3) for y in range(0, height)]
+        stats = bmpr.ReaderStats()
+        reader = bmpr.BMPFileReader(build_bmp(width, height, 24, rows), stats=stats)
+        reader.get_width()
+        reader.read_bmp_file_header()
+        stats.reset()
+
+        coordinates = [(5, 0), (3999, 3), (7, 0), (0, 3), (5, 0), (6, 1)]
+
+        actual = reader.get_pixels(coordinates)
+
+        # Row 0 is stored last, so it holds 3s
+        self.assertEqual(
+            [bmpr.Color(v, v, v) for v in [3, 0, 3, 0, 3, 2]],
+            actual,
+        )
+
+        # The pixels of rows 0 and 1 are each read in a single read, while the two pixels of row 3
+        # are too far apart, so they are read separately
+        self.assertEqual(4, stats.reads)
+        self.assertEqual(3 * 3 + 3 + 3 + 3, stats.bytes_read)
+
+    def test_get_pixels_groups_nearby_pixels(self):
+        width = 4000
+        rows = [bytes(range(0, 250)) * (width * 3 // 250)]
+        stats = bmpr.ReaderStats()
+        reader = bmpr.BMPFileReader(build_bmp(width, 1, 24, rows), stats=stats)
+
+        columns = [0, 1, 3998, 3999]
+        expected = [reader.get_row(0)[x] for x in columns]
+        stats.reset()
+
+        actual = reader.get_pixels([(x, 0) for x in columns])
+
+        self.assertEqual(expected, actual)
+
+        # Each of the two clusters of pixels is read in a single read
+        self.assertEqual(2, stats.reads)
+        self.assertEqual(2 * 3 * 2, stats.bytes_read)
+
+        # No columns means nothing to read, even for rows too wide to read a chunk at a time
+        stats.reset()
+        self.assertEqual([(0, [])], list(reader.iter_columns([])))
+        self.assertEqual(0, stats.reads)
+
+    def test_iter_column(self):
+        image_path = "images/small_image_with_colors.bmp"
+
+        with open(image_path, "rb") as file_handle:
+            reader = bmpr.BMPFileReader(file_handle)
+
+            rows = reader.read_all_rows()
+            expected = [(y, rows[y][24]) for y in range(0, 20)]
+
+            # A small chunk size reads only the column's pixels from each row
+            for chunk_size in [None, 100]:
+                self.assertEqual(expected, list(reader.iter_column(24, chunk_size=chunk_size)))
+                self.assertEqual(
+                    list(reversed(expected)),
+                    list(reader.iter_column(24, order="file_order", chunk_size=chunk_size)),
+                )
+                self.assertEqual(
+                    [(y, [rows[y][29], rows[y][0], rows[y][29]]) for y in range(0, 20)],
+                    list(reader.iter_columns([29, 0, 29], chunk_size=chunk_size)),
+                )
+
+            with self.assertRaises(IndexError):
+                list(reader.iter_column(30))
+
+            with self.assertRaises(ValueError):
+                list(reader.iter_column(0, order="sideways"))
+
+    def test_read_thumbnail_nearest(self):
+        image_path = "images/small_image_with_colors.bmp"
+
+        with open(image_path, "rb") as file_handle:
+            reader = bmpr.BMPFileReader(file_handle)
+
+            rows = reader.read_all_rows()
+
+            thumbnail = reader.read_thumbnail(15, 15)
+            unscaled = reader.read_thumbnail(100, 100)
+
+        expected = [
+            [rows[2 * y + 1][2 * x + 1] for x in range(0, 15)] for y in range(0, 10)
+        ]
+
+        self.assertEqual(expected, thumbnail)
+        self.assertEqual(rows, unscaled)
+
+    def test_read_thumbnail_nearest_only_reads_sampled_rows(self):
+        width = 64
+        height = 64
+        file_rows = [bytes([y]) * width for y in range(0, height)]
+        palette = b"".join(bytes([i, i, i, 0]) for i in range(0, 256))
+        image = build_bmp(width, height, 8, file_rows, extra_header_bytes=palette)
+
+        reads = []
+        original_read = image.read
+
+        def counting_read(size=-1):
+            data = original_read(size)
+            reads.append(len(data))
+            return data
+
+        image.read = counting_read
+
+        reader = bmpr.BMPFileReader(image)
+        reader.read_bmp_file_header()
+        reader._check_supported()
+        del reads[:]
+
+        thumbnail = reader.read_thumbnail(4, 4)
+
+        self.assertEqual(4, len(reads))
+        self.assertTrue(sum(reads) <= 4 * width)
+        self.assertEqual(
+            [[bmpr.Color(v, v, v)] * 4 for v in [55, 39, 23, 7]], thumbnail
+        )
+
+    def test_read_thumbnail_box(self):
+        image_path = "images/small_image_with_colors.bmp"
+
+        with open(image_path, "rb") as file_handle:
+            reader = bmpr.BMPFileReader(file_handle)
+
+            rows = reader.read_all_rows()
+
+            thumbnail = reader.read_thumbnail(15, 10, method="box")
+
+        def average(colors, channel):
+            values = [getattr(color, channel) for color in colors]
+            return (sum(values) + len(values) // 2) // len(values)
+
+        expected = []
+        for y in range(0, 10):
+            expected_row = []
+            for x in range(0, 15):
+                block = [
+                    rows[2 * y + dy][2 * x + dx] for dy in range(0, 2) for dx in range(0, 2)
+                ]
+                expected_row.append(
+                    bmpr.Color(
+                        average(block, "red"), average(block, "green"), average(block, "blue")
+                    )
+                )
+            expected.append(expected_row)
+
+        self.assertEqual(expected, thumbnail)
+
+    def test_read_thumbnail_sizes(self):
+        image_path = "images/small_image_with_colors.bmp"
+
+        with open(image_path, "rb") as file_handle:
+            reader = bmpr.BMPFileReader(file_handle)
+
+            for method in ["nearest", "box"]:
+                for max_size, expected in [
+                    ((30, 5), (8, 5)),
+                    ((7, 100), (7, 5)),
+                    ((1, 1), (1, 1)),
+                    ((30, 20), (30, 20)),
+                ]:
+                    thumbnail = reader.read_thumbnail(*max_size, method=method)
+
+                    self.assertEqual(
+                        expected, (len(thumbnail[0]), len(thumbnail)), (method, max_size)
+                    )
+
+            with self.assertRaises(ValueError):
+                reader.read_thumbnail(0, 10)
+
+            with self.assertRaises(ValueError):
+                reader.read_thumbnail(10, 10, method="bilinear")
+
+    def test_read_thumbnail_4_bit(self):
+        palette = b"".join(bytes([i * 16, i * 16, i * 16, 0]) for i in range(0, 16))
+        # Top row (stored last) is 0..7, bottom row is 8..15
+        image = build_bmp(
+            8,
+            2,
+            4,
+            [b"\x89\xab\xcd\xef", b"\x01\x23\x45\x67"],
+            extra_header_bytes=palette,
+        )
+
+        reader = bmpr.BMPFileReader(image)
+
+        nearest = reader.read_thumbnail(4, 1)
+        box = reader.read_thumbnail(4, 1, method="box")
+
+        self.assertEqual([[bmpr.Color(v, v, v) for v in [144, 176, 208, 240]]], nearest)
+        self.assertEqual([[bmpr.Color(v, v, v) for v in [72, 104, 136, 168]]], box)
+
+    def test_decode_into_rgb565(self):
+        image_path = "images/small_image_with_colors.bmp"
+
+        with open(image_path, "rb") as file_handle:
+            reader = bmpr.BMPFileReader(file_handle)
+
+            rows = reader.read_all_rows()
+
+            big_endian = bytearray(30 * 20 * 2)
+            reader.decode_into(big_endian, format="RGB565_BE")
+
+            little_endian = bytearray(30 * 20 * 2)
+            reader.decode_into(little_endian, format="RGB565_LE")
+
+        expected = bytearray()
+        for row in rows:
+            for color in row:
+                value = (
+                    (((color.red * 31) // 255) << 11)
+                    | (((color.green * 63) // 255) << 5)
+                    | ((color.blue * 31) // 255)
+                )
+                expected += bytes([value >> 8, value & 0xFF])
+
+        self.assertEqual(expected, big_endian)
+        self.assertEqual(expected[1::2], little_endian[0::2])
+        self.assertEqual(expected[0::2], little_endian[1::2])
+
+    def test_decode_into_formats_without_extended_slices(self):
+        for image_path in [
+            "images/small_image_with_colors.bmp",
+            "images/16_bit_colors.bmp",
+            "images/32_bit_colors.bmp",
+        ]:
+            for format in ["RGB565_BE", "RGB565_LE", "RGB888", "GRAY8"]:
+                with open(image_path, "rb") as file_handle:
+                    reader = bmpr.BMPFileReader(file_handle)
+                    size = (
+                        reader.get_width()
+                        * reader.get_height()
+                        * {"RGB888": 3, "GRAY8": 1}.get(format, 2)
+                    )
+
+                    expected = bytearray(size)
+                    reader.decode_into(expected, format=format)
+
+                    actual = bytearray(size)
+                    original = bmpr._EXTENDED_SLICES
+                    bmpr._EXTENDED_SLICES = False
+                    try:
+                        reader.decode_into(actual, format=format)
+                    finally:
+                        bmpr._EXTENDED_SLICES = original
+
+                self.assertEqual(expected, actual, (image_path, format))
+
+    def test_decode_into_rgb888_and_gray8(self):
+        image_path = "images/small_image_with_colors.bmp"
+
+        with open(image_path, "rb") as file_handle:
+            reader = bmpr.BMPFileReader(file_handle)
+
+            row = reader.get_row(0)
+
+            rgb = bytearray(30 * 20 * 3)
+            reader.decode_into(rgb, format="RGB888")
+
+            gray = bytearray(30 * 20)
+            reader.decode_into(gray, format="GRAY8")
+
+        self.assertEqual(bytes([20, 145, 113]), rgb[24 * 3 : 25 * 3])
+        self.assertEqual((77 * 20 + 150 * 145 + 29 * 113) >> 8, gray[24])
+        self.assertEqual(
+            bytes(
+                (77 * c.red + 150 * c.green + 29 * c.blue) >> 8 for c in row
+            ),
+            gray[0:30],
+        )
+
+    def test_decode_into_offset_and_stride(self):
+        image_path = "images/small_image_with_colors.bmp"
+
+        with open(image_path, "rb") as file_handle:
+            reader = bmpr.BMPFileReader(file_handle)
+
+            full = bytearray(30 * 20 * 2)
+            reader.decode_into(full)
+
+            # Place the image at (5, 3) in a 40x25 framebuffer
+            framebuffer = bytearray(b"\xaa" * (40 * 25 * 2))
+            reader.decode_into(framebuffer, x=5, y=3, stride=40 * 2)
+
+            with self.assertRaises(ValueError):
+                reader.decode_into(bytearray(30 * 20 * 2 - 1))
+
+            with self.assertRaises(ValueError):
+                reader.decode_into(framebuffer, x=15, stride=40 * 2)
+
+            with self.assertRaises(ValueError):
+                reader.decode_into(full, format="RGB444")
+
+        for row in range(0, 20):
+            start = ((row + 3) * 40 + 5) * 2
+            self.assertEqual(
+                full[row * 60 : (row + 1) * 60], framebuffer[start : start + 60]
+            )
+
+        self.assertEqual(b"\xaa" * (40 * 3 * 2), framebuffer[0 : 40 * 3 * 2])
+        self.assertEqual(b"\xaa" * 10, framebuffer[3 * 80 : 3 * 80 + 10])
+
+
+class BMPStreamReaderTest(unittest.TestCase):
+    def assert_same_as_file_reader(self, image_bytes):
+        reader = bmpr.BMPFileReader(io.BytesIO(image_bytes))
+        expected = list(reader.iter_rows(order="file_order"))
+
+        for stream in [TrickleStream(image_bytes), io.BufferedReader(io.BytesIO(image_bytes))]:
+            stream_reader = bmpr.BMPStreamReader(stream)
+
+            self.assertEqual(reader.get_width(), stream_reader.get_width())
+            self.assertEqual(reader.get_height(), stream_reader.get_height())
+            self.assertEqual(expected, list(stream_reader.iter_rows()))
+
+    def test_iter_rows(self):
+        for image_path in [
+            "images/small_image_with_colors.bmp",
+            "images/16_bit_colors.bmp",
+            "images/32_bit_colors.bmp",
+            "images/single_green_pixel.bmp",
+        ]:
+            with open(image_path, "rb") as file_handle:
+                self.assert_same_as_file_reader(file_handle.read())
+
+    def test_iter_rows_indexed_and_top_down(self):
+        palette = b"".join(bytes([i * 16, i * 16, i * 16, 0]) for i in range(0, 16))
+        rows = [bytes([(y * 16 + y) & 0xFF]) * 3 for y in range(0, 5)]
+
+        self.assert_same_as_file_reader(
+            build_bmp(5, 5, 4, rows, extra_header_bytes=palette).getvalue()
+        )
+        self.assert_same_as_file_reader(
+            build_bmp(5, -5, 4, rows, extra_header_bytes=palette).getvalue()
+        )
+
+        stream_reader = bmpr.BMPStreamReader(
+            TrickleStream(build_bmp(5, -5, 4, rows, extra_header_bytes=palette).getvalue())
+        )
+        self.assertEqual([0, 1, 2, 3, 4], [row for row, _ in stream_reader.iter_rows()])
+
+    def test_iter_rows_rle8(self):
+        palette = b"".join(bytes([i, i, i, 0]) for i in range(0, 256))
+
+        # Long rows in absolute mode, so that the decoder has to read ahead across rows
+        encoded = b"".join(
+            bytes([0, 200]) + bytes((y + i) & 0xFF for i in range(0, 200)) + b"\x64\x07\x00\x00"
+            for y in range(0, 6)
+        )
+        encoded += b"\x00\x01"
+
+        self.assert_same_as_file_reader(
+            build_bmp(
+                300,
+                6,
+                8,
+                [encoded],
+                compression_type=bmpr.CompressionType.BI_RLE8,
+                extra_header_bytes=palette,
+            ).getvalue()
+        )
+
+    def test_iter_rows_rle8_tall(self):
+        import tracemalloc
+
+        # One pixel per row, so that the encoded data is small compared to the number of rows
+        height = 20000
+        palette = b"".join(bytes([i, i, i, 0]) for i in range(0, 256))
+        encoded = b"".join(bytes([1, y & 0xFF, 0, 0]) for y in range(0, height)) + b"\x00\x01"
+        image_bytes = build_bmp(
+            1,
+            height,
+            8,
+            [encoded],
+            compression_type=bmpr.CompressionType.BI_RLE8,
+            extra_header_bytes=palette,
+        ).getvalue()
+
+        stream_reader = bmpr.BMPStreamReader(io.BufferedReader(io.BytesIO(image_bytes)))
+
+        tracemalloc.start()
+        try:
+            num_rows = 0
+            for row, row_bytes in stream_reader.iter_rows_raw():
+                if row_bytes[0] != ((height - row - 1) & 0xFF):
+                    self.fail("Wrong pixel in row {}: {}".format(row, bytes(row_bytes)))
+
+                num_rows += 1
+
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        self.assertEqual(height, num_rows)
+
+        # Rows are not kept in the index once they have been read
+        self.assertTrue(peak < 100000, peak)
+
+    def test_iter_rows_raw(self):
+        image_path = "images/small_image_with_colors.bmp"
+
+        with open(image_path, "rb") as file_handle:
+            image_bytes = file_handle.read()
+
+        reader = bmpr.BMPFileReader(io.BytesIO(image_bytes))
+        expected = [(i, bytes(row)) for i, row in reader.iter_rows_raw(order="file_order")]
+
+        stream_reader = bmpr.BMPStreamReader(TrickleStream(image_bytes))
+        actual = [(i, bytes(row)) for i, row in stream_reader.iter_rows_raw()]
+
+        self.assertEqual(expected, actual)
+        self.assertEqual(
+            reader.read_all_rows(),
+            bmpr.BMPStreamReader(TrickleStream(image_bytes)).read_all_rows(),
+        )
+
+    def test_rows_can_only_be_read_once(self):
+        image_path = "images/single_green_pixel.bmp"
+
+        with open(image_path, "rb") as file_handle:
+            stream_reader = bmpr.BMPStreamReader(TrickleStream(file_handle.read()))
+
+        self.assertEqual(1, len(list(stream_reader.iter_rows())))
+
+        with self.assertRaises(ValueError):
+            list(stream_reader.iter_rows())
+
+    def test_truncated_stream(self):
+        image_path = "images/small_image_with_colors.bmp"
+
+        with open(image_path, "rb") as file_handle:
+            image_bytes = file_handle.read()
+
+        stream_reader = bmpr.BMPStreamReader(TrickleStream(image_bytes[0:-100]))
+
+        with self.assertRaises(ValueError):
+            list(stream_reader.iter_rows())
+
+
+class AsyncBMPFileReaderTest(unittest.TestCase):
+    def test_get_row_and_region(self):
+        image_path = "images/small_image_with_colors.bmp"
+
+        with open(image_path, "rb") as file_handle:
+            expected = bmpr.BMPFileReader(file_handle).read_all_rows()
+
+        async def read():
+            async with bmp_file_reader_async.AsyncBMPFileReader.from_path(image_path) as reader:
+                height = await reader.get_height()
+
+                rows = await asyncio.gather(*[reader.get_row(i) for i in range(0, height)])
+                duplicate_rows = await asyncio.gather(reader.get_row(3), reader.get_row(3))
+                region = await reader.get_region(20, 3, 7, 5)
+                raw = await reader.get_row_raw(0)
+
+                return rows, duplicate_rows, region, raw
+
+        rows, duplicate_rows, region, raw = asyncio.run(read())
+
+        self.assertEqual(expected, rows)
+        self.assertEqual([expected[3], expected[3]], duplicate_rows)
+        self.assertEqual([row[20:27] for row in expected[3:8]], region)
+        self.assertEqual(b"\x71\x91\x14", raw[24 * 3 : 25 * 3])
+
+    def test_iter_rows(self):
+        image_path = "images/32_bit_colors.bmp"
+
+        with open(image_path, "rb") as file_handle:
+            expected = list(bmpr.BMPFileReader(file_handle).iter_rows(order="file_order"))
+
+        async def read():
+            async with bmp_file_reader_async.AsyncBMPFileReader.from_path(image_path) as reader:
+                return [
+                    row async for row in reader.iter_rows(order="file_order", chunk_size=500)
+                ]
+
+        actual = asyncio.run(read())
+
+        self.assertEqual(expected, actual)
+
+    def test_stats_and_strict(self):
+        image_path = "images/small_image_with_colors.bmp"
+
+        stats = bmpr.ReaderStats()
+
+        async def read():
+            async with bmp_file_reader_async.AsyncBMPFileReader.from_path(
+                image_path, stats=stats, strict=True, max_pixels=30 * 20
+            ) as reader:
+                await reader.get_row(0)
+
+            async with bmp_file_reader_async.AsyncBMPFileReader.from_path(
+                image_path, strict=True, max_pixels=30 * 20 - 1
+            ) as reader:
+                await reader.get_row(0)
+
+        with self.assertRaises(ValueError):
+            asyncio.run(read())
+
+        self.assertEqual(1, stats.rows_decoded)
+        self.assertTrue(stats.bytes_read > 0)
+
+
+class BMPFileWriterTest(unittest.TestCase):
+    def test_write_rows(self):
+        image_path = "images/small_image_with_colors.bmp"
+
+        with open(image_path, "rb") as file_handle:
+            reader = bmpr.BMPFileReader(file_handle)
+
+            expected = reader.read_all_rows()
+
+            output_stream = io.BytesIO()
+            with bmpr.BMPFileWriter(output_stream, 30, 20) as writer:
+                for i in range(0, 10):
+                    writer.write_row(reader.get_row(i))
+                for i in range(10, 20):
+                    writer.write_row(reader.get_row_raw(i))
+
+        output_reader = bmpr.BMPFileReader(output_stream)
+
+        self.assertEqual(expected, output_reader.read_all_rows())
+        self.assertEqual(1894, len(output_stream.getvalue()))
+        self.assertEqual(
+            bmpr.BMPHeader(bmpr.BMPType.BM, 1894, b"\x00\x00", b"\x00\x00", 54),
+            output_reader.read_bmp_file_header(),
+        )
+
+    @unittest.skipIf(np is None, "requires NumPy")
+    def test_write_rows_ndarray(self):
+        expected = np.arange(5 * 3 * 3, dtype=np.uint8).reshape((5, 3, 3))
+
+        output_stream = io.BytesIO()
+        with bmpr.BMPFileWriter(output_stream, 3, 5) as writer:
+            for row in expected:
+                writer.write_row(row)
+
+        actual = bmpr.BMPFileReader(output_stream).to_ndarray()
+
+        np.testing.assert_array_equal(expected, actual)
+
+    def test_write_rows_invalid(self):
+        output_stream = io.BytesIO()
+        writer = bmpr.BMPFileWriter(output_stream, 2, 1)
+
+        with self.assertRaises(ValueError):
+            writer.write_row([bmpr.Color(0, 0, 0)])
+
+        with self.assertRaises(ValueError):
+            writer.close()
+
+        writer.write_row(bytes(6))
+
+        with self.assertRaises(ValueError):
+            writer.write_row(bytes(6))
+
+
+class ReaderStatsTest(unittest.TestCase):
+    def test_counts(self):
+        image_path = "images/small_image_with_colors.bmp"
+        stats = bmpr.ReaderStats()
+
+        with open(image_path, "rb") as file_handle:
+            reader = bmpr.BMPFileReader(
+                file_handle, row_cache=bmpr.RowCache(1000000), stats=stats
+            )
+
+            reader.get_width()
+            reader.read_bmp_file_header()
+
+            # BMP header and DIB header
+            self.assertEqual((2, 2, 14 + 108), (stats.seeks, stats.reads, stats.bytes_read))
+
+            reader.get_row(0)
+            reader.get_row(0)
+            reader.get_row(1)
+
+            row_size = 30 * 3 + 2
+            self.assertEqual(
+                (4, 4, 14 + 108 + row_size * 2), (stats.seeks, stats.reads, stats.bytes_read)
+            )
+            self.assertEqual(2, stats.rows_decoded)
+            self.assertEqual((1, 2), (stats.cache_hits, stats.cache_misses))
+
+            stats.reset()
+            reader.read_all_rows()
+
+        actual = stats.to_dict()
+
+        self.assertEqual(
+            {
+                "seeks": 1,
+                "reads": 1,
+                "bytes_read": row_size * 20,
+                "rows_decoded": 20,
+                "cache_hits": 0,
+                "cache_misses": 0,
+            },
+            {key: actual[key] for key in actual if not key.endswith("_us")},
+        )
+        self.assertEqual(
+            ["decode_us", "header_us", "io_us"],
+            sorted(key for key in actual if key.endswith("_us")),
+        )
+        self.assertTrue(all(actual[key] >= 0 for key in actual))
+
+    def test_mmap_reads_do_not_seek(self):
+        image_path = "images/small_image_with_colors.bmp"
+        stats = bmpr.ReaderStats()
+
+        with bmpr.BMPFileReader.from_path(image_path, mmap=True, stats=stats) as reader:
+            reader.get_height()
+            reader.read_bmp_file_header()
+            stats.reset()
+
+            for _ in reader.iter_rows_raw():
+                pass
+
+        self.assertEqual((0, 1, (30 * 3 + 2) * 20), (stats.seeks, stats.reads, stats.bytes_read))
+        self.assertEqual(20, stats.rows_decoded)
+
+    def test_decode_into_counts_rows(self):
+        for image_path in ("images/small_image_with_colors.bmp", "images/16_bit_colors.bmp"):
+            stats = bmpr.ReaderStats()
+
+            with open(image_path, "rb") as file_handle:
+                reader = bmpr.BMPFileReader(file_handle, stats=stats)
+                width = reader.get_width()
+                height = reader.get_height()
+
+                buffer = bytearray(width * height * 2)
+                reader.decode_into(buffer)
+
+            self.assertEqual(height, stats.rows_decoded, msg=image_path)
+
+    def test_decode_time(self):
+        image_path = "images/16_bit_colors.bmp"
+        stats = bmpr.ReaderStats()
+
+        with open(image_path, "rb") as file_handle:
+            reader = bmpr.BMPFileReader(file_handle, stats=stats)
+
+            for _ in range(0, 20):
+                reader.read_all_rows()
+
+        self.assertEqual(25 * 20, stats.rows_decoded)
+        self.assertTrue(stats.times_us["decode"] > 0)
+
+
+class StrictValidationTest(unittest.TestCase):
+    def build_24_bit(self, width=4, height=3):
+        return build_bmp(width, height, 24, [bytes(width * 3)] * height).getvalue()
+
+    def assert_rejected(self, image_bytes, max_pixels=None):
+        stats = bmpr.ReaderStats()
+        reader = bmpr.BMPFileReader(
+            io.BytesIO(image_bytes), stats=stats, strict=True, max_pixels=max_pixels
+        )
+
+        with self.assertRaises(ValueError):
+            reader.get_row(0)
+
+        # Only the headers (and at most a small color table) are read
+        self.assertTrue(stats.bytes_read <= 14 + 124 + 1024, stats.bytes_read)
+
+    def test_valid_files(self):
+        for image_path in [
+            "images/small_image_with_colors.bmp",
+            "images/16_bit_colors.bmp",
+            "images/32_bit_colors.bmp",
+            "images/single_green_pixel.bmp",
+        ]:
+            with bmpr.BMPFileReader.from_path(image_path, strict=True) as reader:
+                reader.validate()
+                self.assertEqual(reader.get_height(), len(reader.read_all_rows()))
+
+        palette = b"".join(bytes([i, i, i, 0]) for i in range(0, 16))
+        reader = bmpr.BMPFileReader(
+            build_bmp(3, 1, 4, [b"\x1f\x50"], extra_header_bytes=palette), strict=True
+        )
+        self.assertEqual(3, len(reader.get_row(0)))
+
+    def test_truncated_pixel_array(self):
+        self.assert_rejected(self.build_24_bit()[0:-1])
+
+        # Without strict mode the top row (stored last) just comes back short
+        reader = bmpr.BMPFileReader(io.BytesIO(self.build_24_bit()[0:-1]))
+        self.assertEqual(3, len(reader.get_row(0)))
+
+    def test_max_pixels(self):
+        self.assert_rejected(self.build_24_bit(4, 3), max_pixels=11)
+
+        reader = bmpr.BMPFileReader(
+            io.BytesIO(self.build_24_bit(4, 3)), strict=True, max_pixels=12
+        )
+        reader.validate()
+
+    def test_huge_declared_size(self):
+        image_bytes = bytearray(self.build_24_bit())
+        image_bytes[18:22] = (0x7FFFFFFF).to_bytes(4, "little")
+        image_bytes[22:26] = (0x7FFFFFFF).to_bytes(4, "little")
+
+        self.assert_rejected(bytes(image_bytes))
+
+    def test_read_all_rows_huge_height(self):
+        for height in [-1761607679, 1761607679]:
+            image_bytes = bytearray(self.build_24_bit(1, 3))
+            image_bytes[22:26] = height.to_bytes(4, "little", signed=True)
+
+            reader = bmpr.BMPFileReader(io.BytesIO(bytes(image_bytes)), strict=True)
+            with self.assertRaises(ValueError):
+                reader.read_all_rows()
+
+            # Streams are not validated up front, but rows are only kept as they arrive
+            stream_reader = bmpr.BMPStreamReader(io.BytesIO(bytes(image_bytes)))
+            with self.assertRaises(ValueError):
+                stream_reader.read_all_rows()
+
+    def test_invalid_headers(self):
+        # Header size too large
+        image_bytes = bytearray(self.build_24_bit())
+        image_bytes[14:18] = (90000).to_bytes(4, "little")
+        self.assert_rejected(bytes(image_bytes))
+
+        # Zero width
+        image_bytes = bytearray(self.build_24_bit())
+        image_bytes[18:22] = bytes(4)
+        self.assert_rejected(bytes(image_bytes))
+
+        # Image start offset past the end of the file
+        image_bytes = bytearray(self.build_24_bit())
+        image_bytes[10:14] = (100000).to_bytes(4, "little")
+        self.assert_rejected(bytes(image_bytes))
+
+        # Image start offset inside of the DIB header
+        image_bytes = bytearray(self.build_24_bit())
+        image_bytes[10:14] = (20).to_bytes(4, "little")
+        self.assert_rejected(bytes(image_bytes))
+
+        # More colors in the color table than a 4-bit image can use
+        palette = b"".join(bytes([i, i, i, 0]) for i in range(0, 16))
+        image_bytes = bytearray(
+            build_bmp(3, 1, 4, [b"\x1f\x50"], extra_header_bytes=palette).getvalue()
+        )
+        image_bytes[46:50] = (17).to_bytes(4, "little")
+        self.assert_rejected(bytes(image_bytes))
+
+        # Too small to be a BMP file
+        self.assert_rejected(self.build_24_bit()[0:30])
+
+    def test_rle_huge_height(self):
+        import tracemalloc
+
+        # A single pixel followed by an end of bitmap marker, with a huge height in the header
+        palette = b"".join(bytes([i, i, i, 0]) for i in range(0, 256))
+        image_bytes = build_bmp(
+            1,
+            1 << 20,
+            8,
+            [b"\x01\x05\x00\x01"],
+            compression_type=bmpr.CompressionType.BI_RLE8,
+            extra_header_bytes=palette,
+        ).getvalue()
+
+        tracemalloc.start()
+        try:
+            reader = bmpr.BMPFileReader(io.BytesIO(image_bytes), strict=True)
+            reader.validate()
+
+            bottom_row = reader.get_row((1 << 20) - 1)
+            top_row = reader.get_row(0)
+
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        self.assertEqual([bmpr.Color(5, 5, 5)], bottom_row)
+        self.assertEqual([bmpr.Color(0, 0, 0)], top_row)
+
+        # Rows are only indexed as far as the encoded data goes
+        self.assertTrue(peak < 100000, peak)
+
+    def test_rle_truncated(self):
+        palette = b"".join(bytes([i, i, i, 0]) for i in range(0, 256))
+        image_bytes = bytearray(
+            build_bmp(
+                2,
+                2,
+                8,
+                [b"\x02\x05\x00\x00", b"\x02\x06\x00\x01"],
+                compression_type=bmpr.CompressionType.BI_RLE8,
+                extra_header_bytes=palette,
+            ).getvalue()
+        )
+
+        bmpr.BMPFileReader(io.BytesIO(bytes(image_bytes)), strict=True).validate()
+        self.assert_rejected(bytes(image_bytes[0:-2]))
+
+    def test_truncated_dib_header(self):
+        reader = bmpr.BMPFileReader(io.BytesIO(self.build_24_bit()[0:40]))
+
+        with self.assertRaises(ValueError):
+            reader.read_dib_header()
+
+    def test_tiny_dib_header_size(self):
+        for header_size in [1, 3, 4, 11, 12, 39]:
+            image_bytes = bytearray(self.build_24_bit() + bytes(1000000))
+            image_bytes[14:18] = header_size.to_bytes(4, "little")
+
+            file_handle = io.BytesIO(bytes(image_bytes))
+            reader = bmpr.BMPFileReader(file_handle)
+
+            with self.assertRaises(ValueError):
+                reader.read_dib_header()
+
+            # Only the header size field is read
+            self.assertEqual(14 + 4, file_handle.tell())
+
+    def test_dib_header_past_end_of_file(self):
+        image_bytes = bytearray(self.build_24_bit())
+        image_bytes[14:18] = (124).to_bytes(4, "little")
+
+        self.assert_rejected(bytes(image_bytes[0:100]))
+
+    def test_row_out_of_range(self):
+        reader = bmpr.BMPFileReader(io.BytesIO(self.build_24_bit(4, 3)))
+
+        for row in [-1, 3]:
+            with self.assertRaises(IndexError):
+                reader.get_row(row)
+
+            with self.assertRaises(IndexError):
+                reader.get_row_raw(row)
+
+
+class RowCacheTest(unittest.TestCase):
+    def test_get_row_cached(self):
+        image_path = "images/small_image_with_colors.bmp"
+
+        with open(image_path, "rb") as file_handle:
+            expected = bmpr.BMPFileReader(file_handle).read_all_rows()
+
+        row_cache = bmpr.RowCache(max_bytes=4 * 30 * bmpr.DECODED_PIXEL_SIZE)
+        with bmpr.BMPFileReader.from_path(image_path, row_cache=row_cache) as reader:
+            first = reader.get_row(5)
+            second = reader.get_row(5)
+            region = reader.get_region(20, 3, 7, 5)
+            region_again = reader.get_region(20, 3, 7, 5)
+
+            actual = [reader.get_row(i) for i in range(0, 20)]
+
+        self.assertEqual(expected, actual)
+        self.assertIs(first, second)
+        self.assertIs(region, region_again)
+        self.assertEqual([row[20:27] for row in expected[3:8]], region)
+
+        stats = row_cache.stats()
+        self.assertEqual(2, stats["hits"])
+        self.assertEqual(22, stats["misses"])
+        self.assertLessEqual(stats["current_bytes"], stats["max_bytes"])
+        self.assertEqual(4, stats["entries"])
+
+    def test_lru_eviction(self):
+        row_cache = bmpr.RowCache(max_bytes=10)
+
+        row_cache.put("a", 1, 4)
+        row_cache.put("b", 2, 4)
+        row_cache.get("a")
+        row_cache.put("c", 3, 4)
+        row_cache.put("too big", 4, 11)
+
+        self.assertEqual(1, row_cache.get("a"))
+        self.assertIsNone(row_cache.get("b"))
+        self.assertEqual(3, row_cache.get("c"))
+        self.assertIsNone(row_cache.get("too big"))
+        self.assertEqual(1, row_cache.evictions)
+        self.assertEqual(8, row_cache.current_bytes)
+
+
+class ColorTest(unittest.TestCase):
+    def test_hash(self):
+        self.assertEqual(hash(bmpr.Color(1, 2, 3)), hash(bmpr.Color(1, 2, 3)))
+        self.assertEqual(
+            {bmpr.Color(1, 2, 3), bmpr.Color(3, 2, 1)},
+            {bmpr.Color(3, 2, 1), bmpr.Color(1, 2, 3), bmpr.Color(1, 2, 3)},
+        )
+
+    def test_slots(self):
+        color = bmpr.Color(1, 2, 3)
+
+        with self.assertRaises(AttributeError):
+            color.alpha = 4
+
+    def test_color_cache_bounded(self):
+        color_cache = bmpr.ColorCache(max_size=2)
+
+        first = color_cache.get(1, 2, 3)
+        self.assertIs(first, color_cache.get(1, 2, 3))
+
+        color_cache.get(4, 5, 6)
+        overflow = color_cache.get(7, 8, 9)
+
+        self.assertEqual(2, len(color_cache))
+        self.assertEqual(bmpr.Color(7, 8, 9), overflow)
+        self.assertIsNot(overflow, color_cache.get(7, 8, 9))
+
+
+class ScanMetadataTest(unittest.TestCase):
+    def test_read_metadata(self):
+        image_path = "images/16_bit_colors.bmp"
+
+        with open(image_path, "rb") as file_handle:
+            actual = bmpr.read_metadata(file_handle)
+
+        expected = {
+            "width": 25,
+            "height": 25,
+            "top_down": False,
+            "bits_per_pixel": 16,
+            "compression_type": bmpr.CompressionType.BI_BITFIELDS,
+        }
+
+        self.assertEqual(expected, actual)
+
+    def test_scan_metadata_index(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            image_path = os.path.join(temp_dir, "image.bmp")
+            shutil.copyfile("images/small_image_with_colors.bmp", image_path)
+
+            index_path = os.path.join(temp_dir, "index.json")
+            image_paths = [image_path, os.path.join(temp_dir, "missing.bmp")]
+
+            actual = bmp_file_reader_tools.scan_metadata(image_paths, index_path=index_path)
+
+            self.assertEqual(
+                (30, 20, 24),
+                (actual[0]["width"], actual[0]["height"], actual[0]["bits_per_pixel"]),
+            )
+            self.assertIn("error", actual[1])
+            self.assertTrue(os.path.exists(index_path))
+
+            # Unchanged files are served from the index
+            with open(index_path, "r") as input_stream:
+                index = json.load(input_stream)
+            index[image_path]["width"] = 1234
+            with open(index_path, "w") as output_stream:
+                json.dump(index, output_stream)
+
+            actual_cached = bmp_file_reader_tools.scan_metadata(
+                [image_path], index_path=index_path
+            )
+            self.assertEqual(1234, actual_cached[0]["width"])
+
+            # Changed files are read again
+            shutil.copyfile("images/single_white_pixel.bmp", image_path)
+
+            actual_changed = bmp_file_reader_tools.scan_metadata(
+                [image_path], index_path=index_path
+            )
+            self.assertEqual(1, actual_changed[0]["width"])
+
+    def test_scan_metadata_index_same_second(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            image_path = os.path.join(temp_dir, "image.bmp")
+            index_path = os.path.join(temp_dir, "index.json")
+
+            # Files rewritten within the same second, with the same size, are still read again
+            mtime_ns = 1600000000 * 1000000000
+            with open(image_path, "wb") as output_stream:
+                output_stream.write(build_bmp(2, 1, 24, [bytes(6)]).getvalue())
+            os.utime(image_path, ns=(mtime_ns, mtime_ns + 1000))
+
+            bmp_file_reader_tools.scan_metadata([image_path], index_path=index_path)
+
+            with open(image_path, "wb") as output_stream:
+                output_stream.write(build_bmp(1, 2, 24, [bytes(3), bytes(3)]).getvalue())
+            os.utime(image_path, ns=(mtime_ns, mtime_ns + 2000))
+
+            actual = bmp_file_reader_tools.scan_metadata([image_path], index_path=index_path)
+
+            self.assertEqual((1, 2), (actual[0]["width"], actual[0]["height"]))
+
+
+class AssetCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.index_path = os.path.join(self.temp_dir, "index.json")
+
+        self.image_paths = []
+        for name in ["small_image_with_colors.bmp", "16_bit_colors.bmp", "32_bit_colors.bmp"]:
+            image_path = os.path.join(self.temp_dir, name)
+            shutil.copy(os.path.join("images", name), image_path)
+            self.image_paths.append(image_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def decode(self, image_path, buffer, **kwargs):
+        with open(image_path, "rb") as file_handle:
+            bmpr.BMPFileReader(file_handle).decode_into(buffer, **kwargs)
+
+        return buffer
+
+    def test_load_into(self):
+        cache = bmpr.AssetCache(self.index_path)
+        image_path = self.image_paths[0]
+
+        expected = self.decode(image_path, bytearray(30 * 20 * 2))
+
+        first = bytearray(30 * 20 * 2)
+        self.assertFalse(cache.load_into(image_path, first))
+        self.assertTrue(os.path.exists(image_path + ".pxc"))
+
+        # A new cache (ex. after a reboot) finds the cache file via the index
+        cache = bmpr.AssetCache(self.index_path)
+        second = bytearray(30 * 20 * 2)
+        self.assertTrue(cache.load_into(image_path, second))
+
+        self.assertEqual(expected, first)
+        self.assertEqual(expected, second)
+        self.assertEqual((1, 0), (cache.hits, cache.misses))
+        self.assertEqual(bmpr.AssetCache.HEADER_SIZE + 30 * 20 * 2, cache.get_total_bytes())
+
+    def test_load_into_wide_image(self):
+        # Wider than fits in 16 bits
+        width = 70000
+        image_path = os.path.join(self.temp_dir, "wide.bmp")
+        with open(image_path, "wb") as output_stream:
+            row = bytes(i & 0xFF for i in range(0, width * 3))
+            output_stream.write(build_bmp(width, 1, 24, [row]).getvalue())
+
+        cache = bmpr.AssetCache(self.index_path)
+        expected = self.decode(image_path, bytearray(width * 2))
+
+        for expected_hit in [False, True]:
+            framebuffer = bytearray(width * 2)
+            self.assertEqual(expected_hit, cache.load_into(image_path, framebuffer))
+            self.assertEqual(expected, framebuffer)
+
+    def test_load_into_with_offset_and_stride(self):
+        cache = bmpr.AssetCache(self.index_path, format="RGB888")
+        image_path = self.image_paths[0]
+
+        expected = self.decode(
+            image_path, bytearray(40 * 25 * 3), format="RGB888", x=4, y=2, stride=40 * 3
+        )
+
+        for expected_hit in [False, True]:
+            framebuffer = bytearray(40 * 25 * 3)
+            self.assertEqual(
+                expected_hit, cache.load_into(image_path, framebuffer, x=4, y=2, stride=40 * 3)
+            )
+            self.assertEqual(expected, framebuffer)
+
+        # The cached copy can be loaded with a different placement than it was stored with
+        framebuffer = bytearray(30 * 20 * 3)
+        self.assertTrue(cache.load_into(image_path, framebuffer))
+        self.assertEqual(
+            self.decode(image_path, bytearray(30 * 20 * 3), format="RGB888"), framebuffer
+        )
+
+    def test_invalidated_when_source_changes(self):
+        cache = bmpr.AssetCache(self.index_path)
+        image_path = self.image_paths[1]
+
+        self.assertFalse(cache.load_into(image_path, bytearray(25 * 25 * 2)))
+        self.assertTrue(cache.load_into(image_path, bytearray(25 * 25 * 2)))
+
+        # Replace the image with a different one
+        shutil.copy(self.image_paths[2], image_path)
+        stat = os.stat(image_path)
+        os.utime(image_path, (stat.st_atime, stat.st_mtime + 10))
+
+        actual = bytearray(25 * 25 * 2)
+        self.assertFalse(cache.load_into(image_path, actual))
+        self.assertEqual(self.decode(self.image_paths[2], bytearray(25 * 25 * 2)), actual)
+        self.assertTrue(cache.load_into(image_path, bytearray(25 * 25 * 2)))
+
+    def test_invalidated_when_source_changes_within_a_second(self):
+        cache = bmpr.AssetCache(self.index_path)
+        image_path = self.image_paths[1]
+
+        mtime_ns = 1600000000 * 1000000000
+        os.utime(image_path, ns=(mtime_ns, mtime_ns + 1000))
+        self.assertFalse(cache.load_into(image_path, bytearray(25 * 25 * 2)))
+
+        # Change a pixel of the image, keeping its size, within the same second
+        with open(image_path, "r+b") as image_file:
+            image_file.seek(-4, 2)
+            image_file.write(b"\xff\xff")
+        os.utime(image_path, ns=(mtime_ns, mtime_ns + 2000))
+
+        actual = bytearray(25 * 25 * 2)
+        self.assertFalse(cache.load_into(image_path, actual))
+        self.assertEqual(self.decode(image_path, bytearray(25 * 25 * 2)), actual)
+
+    def test_truncated_cache_file_is_ignored(self):
+        cache = bmpr.AssetCache(self.index_path)
+        image_path = self.image_paths[0]
+
+        cache.load_into(image_path, bytearray(30 * 20 * 2))
+
+        with open(image_path + ".pxc", "r+b") as cache_file:
+            cache_file.truncate(100)
+
+        actual = bytearray(30 * 20 * 2)
+        self.assertFalse(cache.load_into(image_path, actual))
+        self.assertEqual(self.decode(image_path, bytearray(30 * 20 * 2)), actual)
+
+    def test_budget_eviction(self):
+        entry_size = bmpr.AssetCache.HEADER_SIZE + 25 * 25 * 2
+        cache = bmpr.AssetCache(self.index_path, max_bytes=1000)
+
+        small_image, image_16, image_32 = self.image_paths
+
+        # Too large for the budget, so never cached
+        self.assertFalse(cache.load_into(small_image, bytearray(30 * 20 * 2)))
+        self.assertFalse(os.path.exists(small_image + ".pxc"))
+
+        cache.max_bytes = entry_size * 2
+
+        cache.load_into(image_16, bytearray(25 * 25 * 2))
+        cache.load_into(image_32, bytearray(25 * 25 * 2))
+        self.assertEqual(entry_size * 2, cache.get_total_bytes())
+
+        # Using the 16-bit image makes the 32-bit one the least recently used
+        self.assertTrue(cache.load_into(image_16, bytearray(25 * 25 * 2)))
+
+        cache.max_bytes = entry_size
+        os.remove(image_16 + ".pxc")
+        cache.load_into(image_16, bytearray(25 * 25 * 2))
+
+        self.assertFalse(os.path.exists(image_32 + ".pxc"))
+        self.assertTrue(os.path.exists(image_16 + ".pxc"))
+        self.assertEqual(entry_size, cache.get_total_bytes())
+        self.assertEqual(1, cache.evictions)
+
+        cache.clear()
+        self.assertFalse(os.path.exists(image_16 + ".pxc"))
+        self.assertEqual(0, cache.get_total_bytes())
+
+    def test_index_not_written_for_uncacheable_images(self):
+        cache = bmpr.AssetCache(self.index_path, max_bytes=1000)
+
+        small_image, image_16, _ = self.image_paths
+
+        # Images too large for the budget do not cause writes to the index
+        cache.load_into(small_image, bytearray(30 * 20 * 2))
+        self.assertFalse(os.path.exists(self.index_path))
+
+        cache.max_bytes = None
+        cache.load_into(image_16, bytearray(25 * 25 * 2))
+        cache.max_bytes = 1000
+
+        os.utime(self.index_path, ns=(0, 0))
+        for _ in range(0, 3):
+            self.assertFalse(cache.load_into(small_image, bytearray(30 * 20 * 2)))
+            self.assertTrue(cache.load_into(image_16, bytearray(25 * 25 * 2)))
+
+        self.assertEqual(0, os.stat(self.index_path).st_mtime_ns)
+
+
+class DecodeManyTest(unittest.TestCase):
+    def test_decode_many_raw(self):
+        image_paths = [
+            "images/single_white_pixel.bmp",
+            "images/does_not_exist.bmp",
+            "images/small_image_with_colors.bmp",
+        ]
+
+        actual = list(bmp_file_reader_tools.decode_many(image_paths, workers=2, output="raw"))
+
+        self.assertEqual(image_paths, [result.path for result in actual])
+        self.assertEqual([True, False, True], [result.ok() for result in actual])
+
+        self.assertEqual(b"\xff\xff\xff", bytes(actual[0].value))
+        self.assertIsInstance(actual[1].error, OSError)
+
+        with open("images/small_image_with_colors.bmp", "rb") as file_handle:
+            reader = bmpr.BMPFileReader(file_handle)
+
+            expected = b"".join(bytes(reader.get_row_raw(i)) for i in range(0, 20))
+
+        self.assertEqual((30, 20), (actual[2].width, actual[2].height))
+        self.assertEqual(expected, bytes(actual[2].value))
+
+    @unittest.skipIf(np is None, "requires NumPy")
+    def test_decode_many_ndarray_unordered(self):
+        image_paths = ["images/16_bit_colors.bmp", "images/32_bit_colors.bmp"]
+
+        actual = list(
+            bmp_file_reader_tools.decode_many(
+                image_paths, workers=2, ordered=False, max_in_flight=1
+            )
+        )
+
+        self.assertEqual(sorted(image_paths), sorted(result.path for result in actual))
+
+        for result in actual:
+            with open(result.path, "rb") as file_handle:
+                expected = bmpr.BMPFileReader(file_handle).to_ndarray()
+
+            np.testing.assert_array_equal(expected, result.value)
+
+
+    def test_decode_many_invalid_arguments(self):
+        image_paths = ["images/single_white_pixel.bmp"]
+
+        with self.assertRaises(ValueError):
+            bmp_file_reader_tools.decode_many(image_paths, workers=0)
+
+        with self.assertRaises(ValueError):
+            bmp_file_reader_tools.decode_many(image_paths, workers=2, max_in_flight=0)
+
+
+class CommandLineTest(unittest.TestCase):
+    def run_main(self, argv):
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            exit_code = bmp_file_reader_cli.main(argv)
+
+        return exit_code, stdout.getvalue(), stderr.getvalue()
+
+    def test_info_json(self):
+        exit_code, stdout, stderr = self.run_main(
+            ["info", "images/single_*_pixel.bmp", "--json", "--workers", "1"]
+        )
+
+        lines = [json.loads(line) for line in stdout.splitlines()]
+
+        self.assertEqual(0, exit_code)
+        self.assertEqual(
+            ["images/single_green_pixel.bmp", "images/single_white_pixel.bmp"],
+            [line["path"] for line in lines],
+        )
+        self.assertEqual(1, lines[0]["dib_header"]["width"])
+        self.assertEqual(122, lines[0]["bmp_header"]["image_start_offset"])
+        self.assertIn("Read 2 files (0 errors)", stderr)
+        self.assertIn("files/s", stderr)
+        self.assertIn("MB/s", stderr)
+        self.assertIn("read_headers", stderr)
+
+    def test_info_json_errors(self):
+        exit_code, stdout, stderr = self.run_main(
+            [
+                "info",
+                "images/single_white_pixel.bmp",
+                "images/missing.bmp",
+                "--json",
+                "--workers",
+                "1",
+            ]
+        )
+
+        lines = [json.loads(line) for line in stdout.splitlines()]
+
+        self.assertEqual(1, exit_code)
+        self.assertEqual(
+            ["images/single_white_pixel.bmp", "images/missing.bmp"],
+            [line["path"] for line in lines],
+        )
+        self.assertNotIn("error", lines[0])
+        self.assertIn("No such file", lines[1]["error"])
+        self.assertIn("Read 2 files (1 errors)", stderr)
+
+    def test_paths_listed_once(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for name in ["a.bmp", "b.BMP", "c.txt"]:
+                shutil.copyfile("images/single_white_pixel.bmp", os.path.join(temp_dir, name))
+
+            exit_code, stdout, stderr = self.run_main(
+                ["info", temp_dir, os.path.join(temp_dir, "a.bmp"), "--json", "--workers", "1"]
+            )
+
+        self.assertEqual(0, exit_code)
+        self.assertEqual(
+            [os.path.join(temp_dir, "a.bmp"), os.path.join(temp_dir, "b.BMP")],
+            [json.loads(line)["path"] for line in stdout.splitlines()],
+        )
+
+    def test_convert(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for format in ["rgb565", "rgb888", "ppm"]:
+                exit_code, _, stderr = self.run_main(
+                    [
+                        "convert",
+                        "images/small_image_with_colors.bmp",
+                        "--format",
+                        format,
+                        "--out-dir",
+                        temp_dir,
+                        "--workers",
+                        "2",
+                    ]
+                )
+
+                self.assertEqual(0, exit_code)
+                self.assertIn("Converted 1 files (0 errors)", stderr)
+
+            with open("images/small_image_with_colors.bmp", "rb") as file_handle:
+                reader = bmpr.BMPFileReader(file_handle)
+
+                rgb565 = bytearray(30 * 20 * 2)
+                reader.decode_into(rgb565, format="RGB565_BE")
+
+                rgb888 = bytearray(30 * 20 * 3)
+                reader.decode_into(rgb888, format="RGB888")
+
+            with open(os.path.join(temp_dir, "small_image_with_colors.rgb565"), "rb") as f:
+                self.assertEqual(rgb565, f.read())
+
+            with open(os.path.join(temp_dir, "small_image_with_colors.rgb888"), "rb") as f:
+                self.assertEqual(rgb888, f.read())
+
+            with open(os.path.join(temp_dir, "small_image_with_colors.ppm"), "rb") as f:
+                self.assertEqual(b"P6\n30 20\n255\n" + rgb888, f.read())
+
+    def test_convert_keeps_relative_paths(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            in_dir = os.path.join(temp_dir, "in")
+            out_dir = os.path.join(temp_dir, "out")
+            for sub_dir, image_name in [
+                ("a", "single_white_pixel.bmp"),
+                ("b", "single_green_pixel.bmp"),
+            ]:
+                os.makedirs(os.path.join(in_dir, sub_dir))
+                shutil.copyfile(
+                    os.path.join("images", image_name), os.path.join(in_dir, sub_dir, "x.bmp")
+                )
+
+            exit_code, _, stderr = self.run_main(
+                [
+                    "convert",
+                    os.path.join(in_dir, "**", "*.bmp"),
+                    "--format",
+                    "rgb888",
+                    "--out-dir",
+                    out_dir,
+                    "--workers",
+                    "2",
+                ]
+            )
+
+            self.assertEqual(0, exit_code)
+            self.assertIn("Converted 2 files (0 errors)", stderr)
+
+            with open(os.path.join(out_dir, "a", "x.rgb888"), "rb") as f:
+                self.assertEqual(b"\xff\xff\xff", f.read())
+            with open(os.path.join(out_dir, "b", "x.rgb888"), "rb") as f:
+                self.assertEqual(b"\x00\xff\x00", f.read())
+
+            # Files given separately are named after their own paths, so the second one would
+            # overwrite the first
+            exit_code, _, stderr = self.run_main(
+                [
+                    "decode",
+                    os.path.join(in_dir, "a", "x.bmp"),
+                    os.path.join(in_dir, "b", "x.bmp"),
+                    "--out-dir",
+                    out_dir,
+                    "--workers",
+                    "1",
+                ]
+            )
+
+            self.assertEqual(1, exit_code)
+            self.assertIn("Decoded 2 files (1 errors)", stderr)
+            self.assertIn(os.path.join(in_dir, "b", "x.bmp") + ": error: Output file", stderr)
+            with open(os.path.join(out_dir, "x.raw"), "rb") as f:
+                self.assertEqual(b"\xff\xff\xff", f.read())
+
+    def test_invalid_workers(self):
+        for workers in ["0", "-1", "many"]:
+            with self.assertRaises(SystemExit) as context:
+                self.run_main(["info", "images/single_white_pixel.bmp", "--workers", workers])
+
+            self.assertEqual(2, context.exception.code)
+
+    def test_verify(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with open("images/small_image_with_colors.bmp", "rb") as file_handle:
+                image_bytes = file_handle.read()
+
+            with open(os.path.join(temp_dir, "ok.bmp"), "wb") as f:
+                f.write(image_bytes)
+
+            with open(os.path.join(temp_dir, "truncated.bmp"), "wb") as f:
+                f.write(image_bytes[0:-100])
+
+            exit_code, stdout, stderr = self.run_main(["verify", temp_dir, "--workers", "1"])
+
+        self.assertEqual(1, exit_code)
+        self.assertIn("truncated.bmp: error: File is truncated", stderr)
+        self.assertEqual("", stdout)
+        self.assertIn("Verified 2 files (1 errors)", stderr)
+
+
+class DIBHeaderTest(unittest.TestCase):
+    def test_repr_simple(self):
+        header = bmpr.DIBHeader(
+            width=1,
+            height=1,
+            num_color_planes=1,
+            bits_per_pixel=24,
+            compression_type=bmpr.CompressionType.BI_RGB,
+            raw_bitmap_size=4,
+            horizontal_resolution_ppm=11811,
+            vertical_resolution_ppm=11811,
+            num_colors_in_palette=0,
+            num_important_colors_used=0,
+        )
+
+        actual = repr(header)
+
+        expected = """DIBHeader(
+    width=1,
+    height=1,
+    num_color_planes=1,
+    bits_per_pixel=24,
+    compression_type=BI_RGB,
+    raw_bitmap_size=4,
+    horizontal_resolution_ppm=11811,
+    vertical_resolution_ppm=11811,
+    num_colors_in_palette=0,
+    num_important_colors_used=0,
+)"""
+
+        self.assertEquals(expected, actual)
+
+    def test_negative_height_round_trip(self):
+        header = bmpr.DIBHeader(
+            width=3,
+            height=-2,
+            num_color_planes=1,
+            bits_per_pixel=24,
+            compression_type=bmpr.CompressionType.BI_RGB,
+            raw_bitmap_size=24,
+            horizontal_resolution_ppm=2835,
+            vertical_resolution_ppm=2835,
+            num_colors_in_palette=0,
+            num_important_colors_used=0,
+        )
 
-        self.assertEquals(expected, actual)
\ No newline at end of file
+        self.assertEqual(header, bmpr.DIBHeader.from_bytes(header.to_bytes()))